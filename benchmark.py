@@ -0,0 +1,84 @@
+""" Measure how fast the game world can be simulated without a screen.
+
+    python benchmark.py --characters 200 --projectiles 5000 --ticks 500
+
+    With --workers the characters are simulated on worker processes, refer to
+    GameEngine.enable_sharding().  Several worker counts can be given to see
+    how the simulation scales, 0 simulates everything in this process.
+
+    python benchmark.py --characters 2000 --projectiles 0 --workers 0 1 2 4
+
+    Characters at rest fall asleep, with --walking they are started walking
+    so they stay awake longer.
+"""
+import argparse
+from time import time
+from engine.headless import HeadlessSimulation
+from entity.character import Character
+
+def populate(simulation, characters, projectiles, walking=False):
+    """ Spawn the given number of characters and projectiles spread evenly
+        across the world map.  The whole map is loaded, characters on tiles
+        of a streamed world that aren't loaded would be frozen.
+    """
+    gameengine = simulation.gameengine
+    tileengine = gameengine.tileengine
+    worldWidth = tileengine.worldSize[0] * tileengine.tileSize
+    worldHeight = tileengine.worldSize[1] * tileengine.tileSize
+
+    if tileengine.world is not None:
+        tileengine.unloadDistance = max(tileengine.chunkCount)
+
+        for chunkX in range(tileengine.chunkCount[0]):
+            for chunkY in range(tileengine.chunkCount[1]):
+                tileengine.load_chunk((chunkX, chunkY))
+
+    for index in range(characters):
+        x = (index * worldWidth) // max(1, characters)
+        character = gameengine.add_character(Character((0,0,0), (x, tileengine.tileSize)))
+
+        if walking:
+            character.xdirection = 1 if index % 2 else -1
+
+    for index in range(projectiles):
+        x = (index * worldWidth) // max(1, projectiles)
+        gameengine.projectiles.spawn((index * 7) % 360, 10, (x, worldHeight // 4))
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless simulation benchmark")
+    parser.add_argument('--characters', type=int, default=100, help="number of characters to spawn")
+    parser.add_argument('--projectiles', type=int, default=1000, help="number of projectiles to spawn")
+    parser.add_argument('--ticks', type=int, default=500, help="number of game ticks to simulate")
+    parser.add_argument('--walking', action='store_true', help="start the characters walking")
+    parser.add_argument('--workers', type=int, nargs='+', default=[0], help="numbers of worker processes to simulate the characters on")
+    args = parser.parse_args()
+
+    for workers in args.workers:
+        run(args, workers)
+
+def run(args, workers):
+    """ Run the benchmark with the characters simulated on the given number
+        of worker processes
+    """
+    simulation = HeadlessSimulation()
+    populate(simulation, args.characters, args.projectiles, args.walking)
+
+    if workers:
+        simulation.gameengine.enable_sharding(workers)
+
+    start = time()
+    simulation.run(args.ticks)
+    elapsed = time() - start
+
+    simulation.gameengine.disable_sharding()
+
+    print("Simulated %d ticks with %d characters and %d projectiles on %d workers" % (args.ticks, args.characters, args.projectiles, workers))
+    print("%.1f ticks per second" % (args.ticks / elapsed))
+
+    timings = simulation.timings
+    for name, scope in sorted(timings.scopes.items()):
+        stats = timings.stats(name)
+        print("  %-12s %8.3f ms/tick (p95 %.3f ms, max %.3f ms)" % (name, 1000.0 * scope.total / args.ticks, 1000.0 * stats['p95'], 1000.0 * stats['max']))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,147 @@
+from pygame.locals import Rect
+
+# Characters further than this many pixels outside the camera window are
+# updated at a reduced rate
+LOD_DISTANCE = 1024
+
+# Far away characters are updated once every this many game ticks
+LOD_INTERVAL = 4
+
+# Sleeping characters within this many pixels of an edited tile wake up
+WAKE_DISTANCE = 32
+
+class ActivityManager(object):
+    """ Decides which characters are updated each game tick.
+
+        Characters that are on the ground, not moving and haven't been
+        disturbed go to sleep and are skipped until something wakes them: a
+        tile edit near them, a projectile hit or input aimed at them.
+        Characters kept awake, like the player, never sleep.
+
+        Characters far outside the camera window are only updated once every
+        LOD_INTERVAL ticks, spread over the ticks so the cost stays even.
+        Each character gets its phase from a counter when it is added, so
+        the same characters are updated on the same ticks on every run.
+        When they are updated they advance by all the ticks since their last
+        update, so they cover the same ground as the characters in view, in
+        fewer and bigger steps.  Characters on tiles of a streamed world that
+        aren't loaded yet are frozen.
+    """
+
+    def __init__(self, spatialIndex, lodDistance=LOD_DISTANCE, lodInterval=LOD_INTERVAL):
+        self.spatialIndex = spatialIndex
+        self.lodDistance = lodDistance
+        self.lodInterval = lodInterval
+
+        self.sleeping = set()
+        self.keepAwake = set()
+
+        # Phase of the reduced rate updates of each character, and the tick
+        # each character was last updated, woken or frozen on
+        self.phases = {}
+        self.nextPhase = 0
+        self.lastTicks = {}
+        self.tileSize = 0
+        self.tick = 0
+
+        # Number of characters updated in the last tick
+        self.updated = 0
+
+        # Simulation of characters on worker processes, which keeps the
+        # sleeping state of its characters itself
+        self.sharding = None
+
+    def add(self, character):
+        self.phases[character] = self.nextPhase
+        self.nextPhase += 1
+        self.lastTicks[character] = self.tick
+
+    def keep_awake(self, character):
+        """ Never put the character to sleep
+        """
+        self.keepAwake.add(character)
+        self.wake(character)
+
+    def wake(self, character):
+        # Time stood still while asleep
+        if character in self.sleeping:
+            self.sleeping.discard(character)
+            self.lastTicks[character] = self.tick
+
+        if self.sharding is not None:
+            self.sharding.wake(character)
+
+    def remove(self, character):
+        self.sleeping.discard(character)
+        self.keepAwake.discard(character)
+        self.phases.pop(character, None)
+        self.lastTicks.pop(character, None)
+
+    def wake_rect(self, rect):
+        """ Wake the characters in the world pixel rect
+        """
+        if self.sleeping or self.sharding is not None:
+            for character in self.spatialIndex.query_rect(rect):
+                self.wake(character)
+
+    def wake_point(self, point):
+        """ Wake the characters at the world pixel location
+        """
+        if self.sleeping or self.sharding is not None:
+            for character in self.spatialIndex.query_point(point):
+                self.wake(character)
+
+    def tiles_edited(self, window):
+        """ Wake the characters near the edited tiles.  The window is tile
+            size.
+        """
+        tileSize = self.tileSize
+        rect = Rect(window[0]*tileSize, window[1]*tileSize, window[2]*tileSize, window[3]*tileSize)
+
+        self.wake_rect(rect.inflate(2*WAKE_DISTANCE, 2*WAKE_DISTANCE))
+
+    def watch(self, tileengine):
+        """ Wake characters on the tile engine's tile edits
+        """
+        self.tileSize = tileengine.tileSize
+        tileengine.add_listener(self.tiles_edited)
+
+    def update(self, gameengine, characters, current_time):
+        """ Update the characters that are awake, the far away ones at a
+            reduced rate, and put the ones that came to rest to sleep
+        """
+        self.tick += 1
+        self.updated = 0
+
+        near = gameengine.camera.window.inflate(2*self.lodDistance, 2*self.lodDistance)
+        tileengine = gameengine.tileengine
+        streaming = tileengine.world is not None
+        sleeping = self.sleeping
+        phase = self.tick % self.lodInterval
+        phases = self.phases
+        lastTicks = self.lastTicks
+
+        for character in characters:
+            if character in sleeping:
+                continue
+
+            rect = character.rect
+
+            if not near.colliderect(rect) and phases.get(character, 0) % self.lodInterval != phase:
+                continue
+
+            if streaming and not tileengine.is_loaded(rect.center):
+                lastTicks[character] = self.tick
+                continue
+
+            # Make up for the ticks skipped since the last update
+            ticks = min(self.tick - lastTicks.get(character, self.tick - 1), self.lodInterval)
+            lastTicks[character] = self.tick
+
+            location = rect.topleft
+            character.update(gameengine, current_time, ticks)
+            self.updated += 1
+
+            if (character.onGround and character.xdirection == 0 and character.rect.topleft == location and
+                    character not in self.keepAwake):
+                sleeping.add(character)
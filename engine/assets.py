@@ -0,0 +1,130 @@
+import threading
+import pygame
+from utilities.util import Util
+
+# Conversion modes for loaded images.  Converted images are stored in the
+# display pixel format so blitting them does not need a format conversion.
+RAW = None
+CONVERT = 'convert'
+CONVERT_ALPHA = 'convert_alpha'
+
+class AssetCache(object):
+    """ Cache of loaded assets shared by the whole game.  Each image is loaded
+        from disk once per conversion mode and the same surface is handed out
+        to every caller, so callers must not draw onto the returned surfaces.
+    """
+
+    def __init__(self):
+        self.images = {}
+        self.fonts = {}
+        self.hits = 0
+        self.misses = 0
+        self.residentBytes = 0
+
+        # Raw images decoded by the preload thread, and the files it still
+        # has to decode
+        self.preloaded = {}
+        self.pending = set()
+        self.condition = threading.Condition()
+
+    def load_image(self, filename, mode=CONVERT):
+        """ Get the image loaded from the given file, converted using the
+            given conversion mode.
+        """
+        key = (filename, mode)
+        image = self.images.get(key)
+
+        if image is not None:
+            self.hits += 1
+            return image
+
+        if mode is not RAW and pygame.display.get_surface() is None:
+            # Images can only be converted once the display mode is set, so
+            # hand out the raw image until then
+            return self.load_image(filename, RAW)
+
+        self.misses += 1
+
+        # Reuse the raw image if it was already loaded
+        image = self.images.get((filename, RAW))
+
+        if image is None:
+            image = self.take_preloaded(filename)
+
+        if image is None:
+            image = pygame.image.load(filename)
+
+        if mode is not RAW:
+            image = getattr(image, mode)()
+
+        return self.store(key, image)
+
+    def font(self, name, size, bold=False):
+        """ Get the system font.  Looking up a system font scans the font
+            directories, so each font is only looked up once.
+        """
+        key = (name, size, bold)
+        font = self.fonts.get(key)
+
+        if font is None:
+            font = self.fonts[key] = pygame.font.SysFont(name, size, bold)
+
+        return font
+
+    def preload(self, filenames):
+        """ Start decoding the image files on a worker thread.  Images are
+            still converted when they are first loaded, as that has to
+            happen on the main thread once the display mode is set.  Returns
+            the worker thread.
+        """
+        with self.condition:
+            self.pending.update(filenames)
+
+        worker = threading.Thread(target=self.run_preload, args=(list(filenames),), name='preload')
+        worker.daemon = True
+        worker.start()
+
+        return worker
+
+    def run_preload(self, filenames):
+        for filename in filenames:
+            try:
+                image = pygame.image.load(filename)
+            except Exception:
+                # Let the main thread load it and report the error
+                image = None
+
+            with self.condition:
+                if image is not None:
+                    self.preloaded[filename] = image
+
+                self.pending.discard(filename)
+                self.condition.notify_all()
+
+    def take_preloaded(self, filename):
+        """ Get the preloaded raw image, waiting for it if it is still being
+            decoded.  Returns None if the image wasn't preloaded.
+        """
+        with self.condition:
+            while filename in self.pending:
+                self.condition.wait()
+
+            return self.preloaded.pop(filename, None)
+
+    def store(self, key, image):
+        self.images[key] = image
+        self.residentBytes += Util.surface_bytes(image)
+
+        return image
+
+    def clear(self):
+        self.images.clear()
+        self.residentBytes = 0
+
+    def stats(self):
+        """ Get the cache statistics as a (hits, misses, residentBytes) tuple
+        """
+        return (self.hits, self.misses, self.residentBytes)
+
+# Asset cache shared by the whole game
+assets = AssetCache()
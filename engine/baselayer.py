@@ -0,0 +1,177 @@
+from pygame.locals import Rect, SRCALPHA
+
+class BaseLayer(object):
+    """ Base (back) layer of the world, described procedurally rather than
+        stored as a surface the size of the world.  The layer is a list of
+        parts drawn in order: solid bands and vertical gradients anchored to
+        the world, and parallax image layers that scroll slower than the
+        world.  Any window of the world can be rendered directly onto a
+        target surface.
+    """
+
+    def __init__(self, worldWidth, worldHeight):
+        self.worldWidth = worldWidth
+        self.worldHeight = worldHeight
+        self.parts = []
+
+    def add_band(self, top, height, color):
+        """ Add a solid band of color across the world
+        """
+        self.parts.append(Band(top, height, color))
+
+    def add_gradient(self, top, height, topColor, bottomColor):
+        """ Add a band across the world fading vertically from the top color
+            to the bottom color
+        """
+        self.parts.append(Gradient(top, height, topColor, bottomColor))
+
+    def add_parallax(self, image, factor, offset=(0,0), tiled=False):
+        """ Add an image layer that scrolls at the given factor of the camera
+            movement.  A factor of 0 keeps the image fixed on the screen and a
+            factor of 1 moves it with the world.
+        """
+        self.parts.append(Parallax(image, factor, offset, tiled))
+
+    def scrollable(self):
+        """ Whether all the parts are anchored to the world, so a rendered
+            window can be shifted along with the world
+        """
+        return all(part.anchored for part in self.parts)
+
+    def fixed(self):
+        """ Whether all the parts are fixed on the screen, so a rendered
+            window looks the same wherever the camera is
+        """
+        return all(part.fixed for part in self.parts)
+
+    def visible_parts(self, size):
+        """ The parts showing on a screen of the given size.  The parts
+            under an opaque part covering the whole screen are hidden.
+        """
+        for index in range(len(self.parts) - 1, -1, -1):
+            if self.parts[index].covers(size):
+                return self.parts[index:]
+
+        return self.parts
+
+    def split(self, size):
+        """ Split the parts showing on a screen of the given size into a
+            back layer, up to the last part not anchored to the world, and a
+            front layer of the parts anchored to the world drawn over it.
+            The front layer can be shifted along with the world.
+        """
+        parts = self.visible_parts(size)
+        back = BaseLayer(self.worldWidth, self.worldHeight)
+        front = BaseLayer(self.worldWidth, self.worldHeight)
+
+        for index in range(len(parts) - 1, -1, -1):
+            if not parts[index].anchored:
+                back.parts = parts[:index+1]
+                front.parts = parts[index+1:]
+                break
+        else:
+            front.parts = list(parts)
+
+        return back, front
+
+    def render(self, target, window):
+        """ Render the given world pixel window of the base layer onto the
+            target surface
+        """
+        window = Rect(window)
+
+        for part in self.visible_parts(window.size):
+            part.render(target, window)
+
+
+class Band(object):
+    """ Solid band of color across the world
+    """
+
+    anchored = True
+    fixed = False
+
+    def __init__(self, top, height, color):
+        self.rect = Rect(0, top, 0, height)
+        self.color = color
+
+    def render(self, target, window):
+        rect = Rect(window.left, self.rect.top, window.width, self.rect.height).clip(window)
+
+        if rect.height > 0:
+            target.fill(self.color, rect.move(-window.left, -window.top))
+
+    def covers(self, size):
+        return False
+
+
+class Gradient(object):
+    """ Band across the world fading vertically between two colors
+    """
+
+    anchored = True
+    fixed = False
+
+    def __init__(self, top, height, topColor, bottomColor):
+        self.top = top
+        self.height = height
+
+        # Precompute the color of every row
+        self.colors = [tuple(int(topColor[i] + (bottomColor[i] - topColor[i]) * row / float(max(1, height - 1)))
+                             for i in range(3))
+                       for row in range(height)]
+
+    def render(self, target, window):
+        first = max(self.top, window.top)
+        last = min(self.top + self.height, window.bottom)
+
+        for y in range(first, last):
+            target.fill(self.colors[y - self.top], Rect(0, y - window.top, window.width, 1))
+
+    def covers(self, size):
+        return False
+
+
+class Parallax(object):
+    """ Image layer scrolling at a factor of the camera movement
+    """
+
+    def __init__(self, image, factor, offset=(0,0), tiled=False):
+        self.image = image
+        self.factor = factor
+        self.offset = offset
+        self.tiled = tiled
+
+        # Only a layer moving with the world is anchored to it, and only one
+        # that doesn't move at all is fixed on the screen
+        self.anchored = factor == 1
+        self.fixed = factor == 0
+
+    def covers(self, size):
+        """ Whether the layer hides everything under it on a screen of the
+            given size
+        """
+        image = self.image
+        opaque = not image.get_flags() & SRCALPHA and image.get_colorkey() is None and image.get_alpha() is None
+
+        if not self.fixed or not opaque:
+            return False
+
+        return self.tiled or Rect(self.offset, image.get_size()).contains(Rect((0,0), size))
+
+    def render(self, target, window):
+        width, height = self.image.get_size()
+        left = self.offset[0] - int(window.left * self.factor)
+        top = self.offset[1] - int(window.top * self.factor)
+
+        if not self.tiled:
+            target.blit(self.image, (left, top))
+            return
+
+        # Repeat the image over the whole target
+        left = left % width - width
+        top = top % height - height
+
+        for x in range(left, window.width, width):
+            for y in range(top, window.height, height):
+                target.blit(self.image, (x, y))
@@ -18,11 +18,17 @@ class Camera(object):
         """
         return target.rect.move(-self.window.left, -self.window.top)
 
-    def update(self, surface, target):
-        """ Center the camera around the target
+    def update(self, target):
+        """ Center the camera around the target.  Returns the camera window.
+        """
+        return self.center(target.rect)
+
+    def center(self, rect):
+        """ Center the camera around the world pixel rect.  Returns the
+            camera window.
         """
         
-        left, top, _, _ = target.rect
+        left, top, _, _ = rect
         _, _, width, height = self.window
         
         # Center the target within the camera window to start
@@ -35,6 +41,5 @@ class Camera(object):
         top = max(0, top)                           # stop scrolling at the top
     
         self.window = Rect(left, top, width, height)
-        winSurface = surface.subsurface(self.window)
         
-        return winSurface
+        return self.window
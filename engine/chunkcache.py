@@ -0,0 +1,78 @@
+from collections import OrderedDict
+from utilities.util import Util
+
+class ChunkCache(object):
+    """ Least recently used cache of rendered tile layer chunks.  Chunks are
+        keyed by their chunk location, (x,y) tuple, and are evicted once the
+        total size of the cached surfaces goes over the memory budget.
+    """
+
+    def __init__(self, memoryBudget):
+        self.memoryBudget = memoryBudget
+        self.residentBytes = 0
+        self.chunks = OrderedDict()
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __contains__(self, key):
+        return key in self.chunks
+
+    def get(self, key):
+        """ Get the chunk surface for the given chunk location and mark it as
+            the most recently used.  Returns None if the chunk is not cached.
+        """
+        surface = self.chunks.pop(key, None)
+
+        if surface is not None:
+            self.chunks[key] = surface
+
+        return surface
+
+    def peek(self, key):
+        """ Get the chunk surface for the given chunk location without
+            changing its position in the LRU order.
+        """
+        return self.chunks.get(key)
+
+    def put(self, key, surface):
+        """ Add a rendered chunk surface to the cache, evicting the least
+            recently used chunks if the memory budget is exceeded.
+        """
+        self.discard(key)
+
+        self.chunks[key] = surface
+        self.residentBytes += Util.surface_bytes(surface)
+
+        # Always keep the chunk that was just added even if it alone is over
+        # the budget, otherwise it could never be displayed
+        while self.residentBytes > self.memoryBudget and len(self.chunks) > 1:
+            oldKey = next(iter(self.chunks))
+            self.discard(oldKey)
+
+        return surface
+
+    def discard(self, key):
+        """ Remove the chunk at the given chunk location from the cache if it
+            is there.
+        """
+        surface = self.chunks.pop(key, None)
+
+        if surface is not None:
+            self.residentBytes -= Util.surface_bytes(surface)
+
+        return surface
+
+    def clear(self):
+        self.chunks.clear()
+        self.residentBytes = 0
+
+    def evict_outside(self, window):
+        """ Evict all chunks outside the given window.  The window is in chunk
+            locations, (left, top, width, height).
+        """
+        left, top, width, height = window
+
+        for key in list(self.chunks.keys()):
+            if not (left <= key[0] < left+width and top <= key[1] < top+height):
+                self.discard(key)
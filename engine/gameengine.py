@@ -1,23 +1,54 @@
 import pygame
+import threading
 from pygame.locals import *
-from pygame import Surface
 
+from engine.activity import ActivityManager
+from engine.assets import assets, CONVERT
+from engine.baselayer import BaseLayer
 from engine.camera import Camera
-from engine.tileengine import TileEngine
-from entity.character import Character
+from engine.input import InputPipeline
+from engine.sharding import ShardedSimulation
+from engine.spatialhash import SpatialHash
+from engine.startup import timeline, baked_map
+from engine.tileengine import TileEngine, CHUNK_SIZE
+from engine.timing import Timings
+from engine.worldformat import WORLD_EXTENSION
+from engine.worldstore import WorldStore
+from entity.character import Character, PLAYER_SHEET
+from entity.projectile import ProjectileSystem
 from entity import item
 import gamestate
 
 # Size of the game tiles / grid
 TILE_SIZE = 32
 
-# World map size (number of tiles, not pixels)
-WORLD_MAP_SIZE = (100, 100)
-WORLD_MAP_PIXEL_SIZE = (WORLD_MAP_SIZE[0]*TILE_SIZE, WORLD_MAP_SIZE[1]*TILE_SIZE)
+# Size of the spatial index cells in pixels
+SPATIAL_CELL_SIZE = 4*TILE_SIZE
 
-# Name of the world map file
+# Frames Per Second limiter.  The game world is updated in fixed steps of 
+# SKIP_TICKS milliseconds.
+FPS_LIMIT = 50
+SKIP_TICKS = 1000 / FPS_LIMIT
+MAX_FRAMESKIP = 10
+
+# Name of the world map file, either a PNG tile map or a world file that is
+# streamed as the camera moves
 WORLD_MAP_FILE = "images/worldmap1.png"
 
+# Bake PNG world maps into world files cached on disk the first time they are
+# loaded, refer to engine.startup.baked_map()
+BAKE_MAPS = True
+
+# Background image, fixed on the screen behind the world
+BACKGROUND_IMAGE = "images/background.png"
+
+# Images decoded in the background while the game starts
+PRELOAD_IMAGES = ["images/rock-texture.png", PLAYER_SHEET, "images/weapon-sprite.png", BACKGROUND_IMAGE]
+
+# Base name of the saved world files, the world map is only used to create 
+# the saved world the first time.  None doesn't save the world.
+WORLD_SAVE_NAME = None
+
 class GameEngine(object):
     
     def __init__(self, initialWidth, initialHeight):
@@ -29,30 +60,67 @@ class GameEngine(object):
             
         self.clock = pygame.time.Clock()
         
-        # Initialize the camera
-        self.camera = Camera(self.winWidth, self.winHeight, WORLD_MAP_PIXEL_SIZE[0], WORLD_MAP_PIXEL_SIZE[1])
+        # Held while changing the game world, the world may be simulated in
+        # another thread
+        self.worldLock = threading.RLock()
         
-        # Load the base (world surface)
-        self.base = self.load_base()
+        # Last known mouse position in window pixels
+        self.mousePosition = (0,0)
         
-        # Load the background
-        self.background = self.load_background()
+        # Input read each frame, with the key state and input latency
+        self.input = InputPipeline()
+        
+        # Number of game ticks the world has been advanced by
+        self.tick = 0
+        
+        # Timing of the game subsystems, only while debugging
+        self.timings = Timings(self.debugging)
+        self.characterScope = self.timings.register('characters')
+        self.projectileScope = self.timings.register('projectiles')
         
         # Initialize the tile engine
-        self.tileengine = TileEngine.fromfilename(WORLD_MAP_FILE, TILE_SIZE) 
+        with timeline.step('tile map'):
+            self.tileengine = self.load_tile_map()
+        
+        # The world map size (pixels) is the size of the tile map
+        self.worldWidth = self.tileengine.worldSize[0] * TILE_SIZE
+        self.worldHeight = self.tileengine.worldSize[1] * TILE_SIZE
+        
+        # Initialize the camera
+        self.camera = Camera(self.winWidth, self.winHeight, self.worldWidth, self.worldHeight)
+        
+        # Load the background
+        with timeline.step('background'):
+            self.background = self.load_background()
+            
+            # Load the base (back layer of the world)
+            self.base = self.load_base()
                 
-        # Initialize the player sprites
+        # Initialize the player sprites.  Characters are also kept in a 
+        # spatial index so they can be found by location.
         self.characters = pygame.sprite.Group()
-        self.player = Character([255, 0, 0], (1600,1000))
-        self.characters.add(self.player)
+        self.spatialIndex = SpatialHash(SPATIAL_CELL_SIZE)
         
-        self.player.equipment.add(item.TileTool(), 1)
-        self.player.currentItem = self.player.equipment.get(1)
-        self.player.equipment.add(item.Weapon(), 2)
-        self.player.equipment.add(item.EnemyTool(), 3)
+        # Characters at rest sleep until disturbed, the player never does
+        self.activity = ActivityManager(self.spatialIndex)
+        self.activity.watch(self.tileengine)
+        
+        # Simulation of the characters other than the player on worker
+        # processes, refer to enable_sharding()
+        self.sharding = None
+        
+        with timeline.step('player'):
+            self.player = Character([255, 0, 0], (1600,1000))
+            self.add_character(self.player)
+            self.activity.keep_awake(self.player)
+            
+            self.player.equipment.add(item.TileTool(), 1)
+            self.player.currentItem = self.player.equipment.get(1)
+            self.player.equipment.add(item.Weapon(), 2)
+            self.player.equipment.add(item.EnemyTool(), 3)
         
         # Initialize projectiles
-        self.projectiles = pygame.sprite.Group()
+        self.projectiles = ProjectileSystem()
         
         # Initialize different states of the game
         self.playState = gamestate.PlayState()
@@ -60,29 +128,133 @@ class GameEngine(object):
         self.inventoryState = gamestate.InventoryState(self.player.inventory)
         self.currentState = self.playState
     
+    def step(self, current_time):
+        """ Advance the game world by one game tick
+        """
+        # Load the tiles around the camera of a streamed world
+        self.tileengine.stream(self.camera.window)
+        
+        # Update the characters on the world map
+        with self.characterScope:
+            if self.sharding:
+                # The workers step the other characters during the rest of
+                # the tick
+                self.activity.update(self, [self.player], current_time)
+                self.sharding.begin_step(self)
+            else:
+                self.activity.update(self, self.characters, current_time)
+        
+        # Update the projectiles
+        with self.projectileScope:
+            self.projectiles.update(self, current_time)
+        
+        if self.sharding:
+            with self.characterScope:
+                self.sharding.end_step(self, current_time)
+        
+        self.tick += 1
+    
+    def add_character(self, character):
+        """ Add a character to the world
+        """
+        self.characters.add(character)
+        self.spatialIndex.add(character)
+        self.activity.add(character)
+        
+        if self.sharding and character is not self.player:
+            self.sharding.add(character)
+        
+        return character
+    
+    def remove_character(self, character):
+        """ Remove a character from the world
+        """
+        self.characters.remove(character)
+        self.spatialIndex.remove(character)
+        self.activity.remove(character)
+        
+        if self.sharding and character in self.sharding:
+            self.sharding.remove(character)
+        
+        return character
+    
+    def enable_sharding(self, workers):
+        """ Simulate the characters other than the player on the given number
+            of worker processes, one region of the world each.  It is off
+            unless enabled, more workers only help with a core for each of
+            them, measure with benchmark.py.
+        """
+        self.sharding = ShardedSimulation(self.tileengine, workers, self.activity)
+        self.activity.sharding = self.sharding
+        
+        for character in self.characters:
+            if character is not self.player:
+                self.sharding.add(character)
+        
+        # The workers keep the sleeping state of their characters
+        self.activity.sleeping.clear()
+    
+    def disable_sharding(self):
+        """ Stop the worker processes and simulate all the characters here
+            again
+        """
+        if self.sharding:
+            self.sharding.close()
+            self.activity.sleeping.update(self.sharding.restore(self.spatialIndex))
+            self.activity.sharding = None
+            self.sharding = None
+    
+    def character_at(self, worldPosition, ignoreList=None):
+        """ Get the character at the given world pixel location or None if 
+            there is no character there.
+        """
+        characters = self.spatialIndex.query_point(worldPosition, ignoreList)
+        
+        if characters:
+            return characters[0]
+        
+        return None
+    
+    def load_tile_map(self):
+        """ Load the tile map of the world, from the saved world if there is
+            one
+        """
+        self.worldStore = WorldStore(WORLD_SAVE_NAME) if WORLD_SAVE_NAME else None
+        
+        if self.worldStore and self.worldStore.exists():
+            return self.worldStore.load(TILE_SIZE)
+        
+        if WORLD_MAP_FILE.endswith(WORLD_EXTENSION):
+            tileengine = TileEngine.fromworldfile(WORLD_MAP_FILE, TILE_SIZE)
+        elif BAKE_MAPS:
+            tileengine = TileEngine.fromworldfile(baked_map(WORLD_MAP_FILE, CHUNK_SIZE), TILE_SIZE)
+        else:
+            tileengine = TileEngine.fromfilename(WORLD_MAP_FILE, TILE_SIZE) 
+        
+        if self.worldStore:
+            self.worldStore.create(tileengine)
+        
+        return tileengine
+    
     def load_background(self):
         """ Load the background for the world
         """
-        background = pygame.image.load('images/background.png')
-        background.convert()
-            
-        return background
+        return assets.load_image(BACKGROUND_IMAGE, CONVERT)
 
     def load_base(self):
-        """ Load the base (back surface) for the world
+        """ Load the base (back layer) for the world
         """
-        width,height = (WORLD_MAP_SIZE[0]*TILE_SIZE,WORLD_MAP_SIZE[1]*TILE_SIZE)
-        
-        image = Surface((TILE_SIZE, TILE_SIZE))
-        image.convert()
+        width,height = (self.worldWidth, self.worldHeight)
         
-        base = pygame.Surface((width,height))
-        base.convert()
+        base = BaseLayer(width, height)
         
         # Fill in sky with blue
-        base.fill(Color(0,0,255), Rect(0, 0, width, height/2))
+        base.add_band(0, height/2, Color(0,0,255))
         
         # Fill in ground with brown
-        base.fill(Color("#573B0C"), Rect(0, height/2, width, height/2))
+        base.add_band(height/2, height - height/2, Color("#573B0C"))
+        
+        # The background stays fixed on the screen
+        base.add_parallax(self.background, 0)
             
         return base
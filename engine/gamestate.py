@@ -1,11 +1,30 @@
 import sys
 import pygame
 from pygame.locals import *
+from engine.input import merge_bindings
 from menu.menu import MainMenu
 
 FLAGS = pygame.RESIZABLE | pygame.HWSURFACE | pygame.DOUBLEBUF
 
+# Name of the timing trace files written when a recording is stopped
+TRACE_FILE = 'trace'
+
 class GameState(object):
+    """ State of the game, deciding how input is handled.  Events are
+        dispatched through lookup tables: eventHandlers maps an event type
+        to the name of the method handling it, keyBindings maps a key to the
+        method run when it is pressed and mouseBindings a mouse button to
+        the method run when it is clicked.  Subclasses extend the tables of
+        their super class with merge_bindings().
+    """
+    
+    eventHandlers = {KEYDOWN: 'key_down'}
+    
+    keyBindings = {K_BACKQUOTE: 'toggle_debugging',
+                   K_F12: 'toggle_recording'}
+    
+    mouseBindings = {}
+    
     def __init__(self):
         pass
     
@@ -15,102 +34,165 @@ class GameState(object):
             self.handle_event(event, gameengine)
     
     def handle_event(self, event, gameengine):
-        if event.type == KEYDOWN:
-            if event.key == K_BACKQUOTE:
-                gameengine.debugging = not gameengine.debugging
+        handler = self.eventHandlers.get(event.type)
+        
+        if handler:
+            getattr(self, handler)(event, gameengine)
+    
+    def key_down(self, event, gameengine):
+        action = self.keyBindings.get(event.key)
+        
+        if action:
+            getattr(self, action)(event, gameengine)
+    
+    def mouse_down(self, event, gameengine):
+        action = self.mouseBindings.get(event.button)
+        
+        if action:
+            getattr(self, action)(event, gameengine)
+    
+    def quit(self, event, gameengine):
+        pygame.quit()
+        sys.exit()
+    
+    def show_game(self, event, gameengine):
+        # Switch to playing state
+        gameengine.currentState = gameengine.playState
+    
+    def toggle_debugging(self, event, gameengine):
+        # Timings are only taken while debugging
+        gameengine.debugging = not gameengine.debugging
+        gameengine.timings.enabled = gameengine.debugging
+    
+    def toggle_recording(self, event, gameengine):
+        # Start recording timings or stop and export the recording
+        timings = gameengine.timings
+        
+        if timings.recording:
+            timings.stop_recording()
+            timings.export_chrome_trace(TRACE_FILE + '.json')
+            timings.export_csv(TRACE_FILE + '.csv')
+        else:
+            timings.start_recording()
     
 class PlayState(GameState):
+    
+    eventHandlers = merge_bindings(GameState.eventHandlers,
+                                   {QUIT: 'quit',
+                                    VIDEORESIZE: 'resize',
+                                    MOUSEBUTTONDOWN: 'mouse_down',
+                                    MOUSEMOTION: 'mouse_motion'})
+    
+    keyBindings = merge_bindings(GameState.keyBindings,
+                                 {K_SPACE: 'jump',
+                                  K_PLUS: 'speed_up',
+                                  K_KP_PLUS: 'speed_up',
+                                  K_MINUS: 'slow_down',
+                                  K_KP_MINUS: 'slow_down',
+                                  K_ESCAPE: 'show_menu',
+                                  K_TAB: 'show_inventory'},
+                                 dict((key, 'equip') for key in range(K_0, K_9 + 1)))
+    
+    mouseBindings = {1: 'use_primary',      # Left mouse click
+                     3: 'use_secondary'}    # Right mouse click
+    
     def __init__(self):
         super(PlayState, self).__init__()
+    
+    def handle_events(self, events, gameengine):
+        super(PlayState, self).handle_events(events, gameengine)
         
-    def handle_event(self, event, gameengine):
-        if event.type == QUIT:
-            # Quit event
-            pygame.quit()
-            sys.exit()
-        elif event.type == VIDEORESIZE:
-            # User resized the game window so reset the screen surface and camera
-            gameengine.winWidth = event.w
-            gameengine.winHeight = event.h 
-            
-            gameengine.camera.window = Rect(gameengine.camera.window.left, gameengine.camera.window.top, event.w, event.h)
-            
-            pygame.display.set_mode(event.size, FLAGS)
-                            
-        elif event.type == KEYDOWN:
-            if event.key == K_a:
-                gameengine.player.xdirection = -1;
-            elif event.key == K_d:
-                gameengine.player.xdirection = 1;
-            elif event.key == K_SPACE:
-                gameengine.player.jump()
-            elif event.key == K_PLUS or event.key == K_KP_PLUS:
-                gameengine.player.speed = min(10,gameengine.player.speed + 1)
-            elif event.key == K_MINUS or event.key == K_KP_MINUS:
-                gameengine.player.speed = max(1,gameengine.player.speed - 1)
-            elif event.key >= K_0 and event.key <= K_9:
-                # Switch equipped item
-                selectedItem = gameengine.player.equipment.get(event.key-K_0)
-                if selectedItem:
-                    gameengine.player.currentItem = selectedItem
-            elif event.key == K_ESCAPE:
-                # Switch to menu state
-                gameengine.currentState = gameengine.menuState
-            elif event.key == K_TAB:
-                # Switch to inventory state
-                gameengine.currentState = gameengine.inventoryState
-            else:
-                super(PlayState, self).handle_event(event, gameengine)
-
-        elif event.type == KEYUP:
-            if event.key == K_a or event.key == K_d:
-                gameengine.player.xdirection = 0;
-            elif event.type == K_d:
-                gameengine.player.xdirection = 0;
-        elif event.type == MOUSEBUTTONDOWN:
-            # Translate the mouse click location into the world map 
-            # location
-            worldPosition = gameengine.camera.window_to_map(event.pos)
+        # Walk while A or D is held
+        keys = gameengine.input.keys
+        gameengine.player.xdirection = keys.is_held(K_d) - keys.is_held(K_a)
+    
+    def resize(self, event, gameengine):
+        # User resized the game window so reset the screen surface and camera
+        gameengine.winWidth = event.w
+        gameengine.winHeight = event.h 
+        
+        gameengine.camera.window = Rect(gameengine.camera.window.left, gameengine.camera.window.top, event.w, event.h)
+        
+        pygame.display.set_mode(event.size, FLAGS)
+    
+    def mouse_motion(self, event, gameengine):
+        if event.buttons[0] or event.buttons[2]:
+            # Dragging with a mouse button held, from the last mouse position
+            startPosition = (event.pos[0] - event.rel[0], event.pos[1] - event.rel[1])
             
-            if event.button == 1:   # Left mouse click
-                gameengine.player.currentItem.do_primary(worldPosition,gameengine)
-            elif event.button == 3: # Right mouse click
-                gameengine.player.currentItem.do_secondary(worldPosition,gameengine)
+            gameengine.player.currentItem.do_drag(gameengine.camera.window_to_map(startPosition),
+                                                  gameengine.camera.window_to_map(event.pos),
+                                                  event.buttons, gameengine)
+    
+    def click_world(self, event, gameengine):
+        """ Get the world map location of a mouse click that goes through to
+            the world
+        """
+        # Translate the mouse click location into the world map location
+        worldPosition = gameengine.camera.window_to_map(event.pos)
+        
+        # Wake any character clicked on
+        gameengine.activity.wake_point(worldPosition)
+        
+        return worldPosition
+    
+    def use_primary(self, event, gameengine):
+        gameengine.player.currentItem.do_primary(self.click_world(event, gameengine), gameengine)
+    
+    def use_secondary(self, event, gameengine):
+        gameengine.player.currentItem.do_secondary(self.click_world(event, gameengine), gameengine)
+    
+    def jump(self, event, gameengine):
+        gameengine.player.jump()
+    
+    def speed_up(self, event, gameengine):
+        gameengine.player.speed = min(10,gameengine.player.speed + 1)
+    
+    def slow_down(self, event, gameengine):
+        gameengine.player.speed = max(1,gameengine.player.speed - 1)
+    
+    def equip(self, event, gameengine):
+        # Switch equipped item
+        selectedItem = gameengine.player.equipment.get(event.key-K_0)
+        if selectedItem:
+            gameengine.player.currentItem = selectedItem
+    
+    def show_menu(self, event, gameengine):
+        # Switch to menu state
+        gameengine.currentState = gameengine.menuState
+    
+    def show_inventory(self, event, gameengine):
+        # Switch to inventory state
+        gameengine.currentState = gameengine.inventoryState
 
 class InventoryState(PlayState):
     """ Game state where an inventory is displayed
     """
     
+    keyBindings = merge_bindings(PlayState.keyBindings, {K_TAB: 'show_game'})
+    
+    mouseBindings = merge_bindings(PlayState.mouseBindings, {1: 'select_item'})
+    
     def __init__(self, inventory):
         super(PlayState, self).__init__()
         
         self.inventory = inventory
     
-    def handle_event(self, event, gameengine):
-        if event.type == KEYDOWN:
-            if event.key == K_TAB:
-                # Switch to playing state
-                gameengine.currentState = gameengine.playState
-            else:
-                # Didn't handle this event, let the super class
-                # try and handle it
-                super(InventoryState, self).handle_event(event, gameengine)
-        elif event.type == MOUSEBUTTONDOWN:
-            # Translate the mouse click location into the world map 
-            # location
-            if event.button == 1:   # Left mouse click
-                collision = self.inventory.do_primary(event.pos, gameengine)
-                
-                if not collision:
-                    # Didn't handle this event, let the super class
-                    # try and handle it
-                    super(InventoryState, self).handle_event(event, gameengine)
-            else:
-                super(InventoryState, self).handle_event(event, gameengine)
-        else:
-            # Didn't handle this event, let the super class
-            # try and handle it
-            super(InventoryState, self).handle_event(event, gameengine)
+    def select_item(self, event, gameengine):
+        collision = self.inventory.do_primary(event.pos, gameengine)
+        
+        if not collision:
+            # Not on the inventory, use the equipped item on the world
+            self.use_primary(event, gameengine)
+    
+    def mouse_motion(self, event, gameengine):
+        # Drags on the inventory don't go through to the world
+        startPosition = (event.pos[0] - event.rel[0], event.pos[1] - event.rel[1])
+        
+        if self.inventory.rect.collidepoint(startPosition) or self.inventory.rect.collidepoint(event.pos):
+            return
+        
+        super(InventoryState, self).mouse_motion(event, gameengine)
     
     def displayInventory(self, screen):
         self.inventory.display(screen)
@@ -119,26 +201,24 @@ class MenuState(GameState):
     """ Game state where the menu is displayed
     """
     
+    eventHandlers = {QUIT: 'quit',
+                     KEYDOWN: 'key_down',
+                     MOUSEBUTTONDOWN: 'select_menu_item'}
+    
+    # Escape closes the menu and switches back to playing state
+    keyBindings = {K_ESCAPE: 'show_game'}
+    
     def __init__(self):
         super(MenuState, self).__init__()
         self.menu = MainMenu()
-         
-    def handle_event(self, event, gameengine):
-        if event.type == QUIT:
-            # Quit event
-            pygame.quit()
-            sys.exit()
-        elif event.type == KEYDOWN:
-            if event.key == K_ESCAPE:
-                # Close the menu and switch back to playing state
-                gameengine.currentState = gameengine.playState
-                
-        elif event.type == MOUSEBUTTONDOWN:
-            # Check if the mouse click position collides with any menu
-            # item, meaning the user clicked a menu item
-            for menuItem in self.menu.menuItems:
-                if menuItem.rect.collidepoint(event.pos):
-                    menuItem.action()
+    
+    def select_menu_item(self, event, gameengine):
+        # Check if the mouse click position is on a menu item, meaning the
+        # user clicked a menu item
+        menuItem = self.menu.item_at(event.pos)
+        
+        if menuItem:
+            menuItem.action()
              
     def displayMenu(self, screen):
         self.menu.display(screen)
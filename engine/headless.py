@@ -0,0 +1,90 @@
+import os
+import pygame
+from pygame.locals import *
+from engine.gameengine import GameEngine, SKIP_TICKS
+from engine.input import InputPipeline
+from engine.renderer import Renderer
+
+class HeadlessSimulation(object):
+    """ Runs the game without a screen.  The game world is advanced in fixed
+        steps of SKIP_TICKS game milliseconds, independent of the wall clock,
+        and input comes from a script instead of the user, so the same script
+        always produces the same game.  Nothing is drawn unless render() is
+        called.
+    """
+
+    def __init__(self, width=1024, height=768, script=None):
+        # Use SDL's dummy video driver so no display is needed.  The display
+        # mode still has to be set so images can be converted.
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        pygame.init()
+        self.screen = pygame.display.set_mode((width, height))
+
+        self.gameengine = GameEngine(width, height)
+
+        # There's no keyboard behind scripted input, keep the key state from
+        # the events
+        self.gameengine.input = InputPipeline(scripted=True)
+        self.renderer = None
+
+        # Scripted events keyed by the game tick they happen on
+        self.script = {}
+        for tick, event in script or []:
+            self.add_event(tick, event)
+
+        self.tick = 0
+        self.currentTime = 0
+
+        # Time spent in each part of the simulation
+        self.timings = self.gameengine.timings
+        self.timings.enabled = True
+        self.eventScope = self.timings.register('events')
+
+    def add_event(self, tick, event):
+        """ Script an event to be handled on the given game tick
+        """
+        self.script.setdefault(tick, []).append(event)
+
+    def step(self):
+        """ Advance the game world by one game tick
+        """
+        gameengine = self.gameengine
+        self.timings.begin_frame()
+
+        with self.eventScope:
+            events = gameengine.input.process(self.script.pop(self.tick, []))
+
+            for event in events:
+                if event.type in (MOUSEMOTION, MOUSEBUTTONDOWN, MOUSEBUTTONUP):
+                    gameengine.mousePosition = event.pos
+
+            gameengine.currentState.handle_events(events, gameengine)
+
+        # Follow the player like the game does every frame, the world is
+        # streamed around the camera
+        gameengine.camera.update(gameengine.player)
+
+        if gameengine.currentState != gameengine.menuState:
+            gameengine.step(self.currentTime)
+
+        self.tick += 1
+        self.currentTime += SKIP_TICKS
+
+    def run(self, ticks):
+        """ Advance the game world by the given number of game ticks
+        """
+        for _ in range(ticks):
+            self.step()
+
+    def render(self):
+        """ Draw the current camera view of the game.  Returns the surface
+            drawn on.
+        """
+        if self.renderer is None:
+            self.renderer = Renderer(self.timings)
+
+        gameengine = self.gameengine
+        gameengine.camera.update(gameengine.player)
+        self.renderer.draw(self.screen, gameengine)
+
+        return self.screen
@@ -0,0 +1,163 @@
+import pygame
+from time import time
+
+# Number of times per second throttled HUD lines are refreshed
+HUD_REFRESH_RATE = 4
+
+class Hud(object):
+    """ Heads up display of text lines, like the debugging overlay.  Each line
+        is a fixed label followed by a value.  A line is only rasterized again
+        when its formatted value changes, values are rasterized from a cache
+        of glyphs, and all the lines are composed into one surface so the HUD
+        is a single blit.  Throttled lines, for values that change every
+        frame like the FPS, are only refreshed HUD_REFRESH_RATE times per
+        second.
+    """
+
+    def __init__(self, font, color=(255,255,255), refreshRate=HUD_REFRESH_RATE, lineHeight=20):
+        self.font = font
+        self.color = color
+        self.refreshInterval = 1.0 / refreshRate
+        self.lineHeight = lineHeight
+
+        self.lines = []
+        self.glyphs = {}
+        self.nextRefresh = 0
+        self.surface = None
+        self.dirty = True
+
+    def add_line(self, label, value, throttled=False):
+        """ Add a line to the HUD.  The value is a function returning the
+            formatted value of the line.
+        """
+        line = HudLine(self.font.render(label, True, self.color), value, throttled)
+        self.lines.append(line)
+        self.dirty = True
+
+        return line
+
+    def glyph(self, character):
+        """ Get the rendered glyph for the character
+        """
+        glyph = self.glyphs.get(character)
+
+        if glyph is None:
+            glyph = self.glyphs[character] = self.font.render(character, True, self.color)
+
+        return glyph
+
+    def render_value(self, text):
+        """ Rasterize the value text from the glyph cache
+        """
+        glyphs = [self.glyph(character) for character in text]
+        width = sum(glyph.get_width() for glyph in glyphs)
+
+        surface = pygame.Surface((max(1, width), self.font.get_height()), pygame.SRCALPHA, 32)
+        surface.fill((0,0,0,0))
+
+        left = 0
+        for glyph in glyphs:
+            surface.blit(glyph, (left, 0))
+            left += glyph.get_width()
+
+        return surface
+
+    def update(self):
+        """ Refresh the line values, rasterizing only the lines whose value
+            changed.  Returns the lines that changed.
+        """
+        now = time()
+        refreshThrottled = now >= self.nextRefresh
+
+        if refreshThrottled:
+            self.nextRefresh = now + self.refreshInterval
+
+        changed = []
+
+        for line in self.lines:
+            if line.throttled and not refreshThrottled:
+                continue
+
+            text = line.value()
+
+            if text != line.text:
+                line.text = text
+                line.valueImage = self.render_value(text)
+                changed.append(line)
+
+        if changed:
+            self.dirty = True
+
+        return changed
+
+    def compose(self):
+        """ Compose all the lines into the HUD surface
+        """
+        width = max([line.width() for line in self.lines] + [1])
+        height = max(1, len(self.lines) * self.lineHeight)
+
+        if self.surface is None or self.surface.get_size() != (width, height):
+            self.surface = pygame.Surface((width, height), pygame.SRCALPHA, 32)
+
+        self.surface.fill((0,0,0,0))
+
+        top = 0
+        for line in self.lines:
+            line.rect = pygame.Rect(0, top, line.width(), self.lineHeight)
+            self.surface.blit(line.labelImage, (0, top))
+
+            if line.valueImage:
+                self.surface.blit(line.valueImage, (line.labelImage.get_width(), top))
+
+            top += self.lineHeight
+
+        self.dirty = False
+
+    def draw(self, screen, position=(5,5)):
+        """ Draw the HUD onto the screen at the given position.  Returns the
+            screen rects that changed since the last draw.
+        """
+        changed = self.update()
+        dirtyRects = []
+
+        if self.dirty:
+            oldSize = self.surface.get_size() if self.surface else (0,0)
+            self.compose()
+
+            if self.surface.get_size() != oldSize:
+                # The whole HUD moved around, both the old and new areas
+                # changed
+                dirtyRects.append(pygame.Rect(position, oldSize))
+                dirtyRects.append(pygame.Rect(position, self.surface.get_size()))
+            else:
+                # Only the changed lines, across the whole HUD width as the
+                # old value may have been wider
+                width = self.surface.get_width()
+                dirtyRects.extend(pygame.Rect(position[0], position[1] + line.rect.top, width, self.lineHeight)
+                                  for line in changed)
+
+        screen.blit(self.surface, position)
+
+        return dirtyRects
+
+
+class HudLine(object):
+    """ Line of a HUD.  Holds the rasterized label and value.
+    """
+
+    def __init__(self, labelImage, value, throttled=False):
+        self.labelImage = labelImage
+        self.value = value
+        self.throttled = throttled
+
+        self.text = None
+        self.valueImage = None
+        self.rect = None
+
+    def width(self):
+        width = self.labelImage.get_width()
+
+        if self.valueImage:
+            width += self.valueImage.get_width()
+
+        return width
@@ -0,0 +1,175 @@
+import pygame
+from pygame.locals import *
+
+# Event types the game handles, all others are blocked from the event queue.
+# KEYUP is only used to keep the key state of scripted input.
+ALLOWED_EVENTS = [QUIT, VIDEORESIZE, KEYDOWN, KEYUP, MOUSEBUTTONDOWN, MOUSEMOTION]
+
+# Event types whose latency is measured, the input the user waits to see
+# the result of
+MEASURED_EVENTS = (KEYDOWN, KEYUP, MOUSEBUTTONDOWN)
+
+# Number of frames the average input latency is taken over
+LATENCY_SAMPLES = 30
+
+def filter_events(allowed=ALLOWED_EVENTS):
+    """ Only let the allowed event types onto the event queue.  The display
+        has to be initialized.
+    """
+    pygame.event.set_blocked(None)
+    pygame.event.set_allowed(allowed)
+
+def merge_bindings(*tables):
+    """ Get a binding table of all the bindings of the tables, later tables
+        override the bindings of earlier ones
+    """
+    merged = {}
+
+    for table in tables:
+        merged.update(table)
+
+    return merged
+
+def coalesce_motion(events):
+    """ Replace every run of mouse motion events with the same buttons held
+        by a single motion event, with the last position and the motion of
+        the whole run
+    """
+    coalesced = []
+    run = None
+
+    for event in events:
+        if event.type == MOUSEMOTION:
+            if run and run.buttons == event.buttons:
+                rel = (run.rel[0] + event.rel[0], run.rel[1] + event.rel[1])
+                run = pygame.event.Event(MOUSEMOTION, pos=event.pos, rel=rel, buttons=event.buttons)
+                coalesced[-1] = run
+                continue
+
+            run = event
+        else:
+            run = None
+
+        coalesced.append(event)
+
+    return coalesced
+
+
+class KeyState(object):
+    """ Snapshot of the keys held down, taken once per frame so held keys are
+        read from the keyboard state instead of pairs of KEYDOWN and KEYUP
+        events, which miss keys released while the window didn't have focus.
+
+        Scripted input has no keyboard behind it, so with scripted set the
+        state is kept from the events instead.
+    """
+
+    def __init__(self, scripted=False):
+        self.scripted = scripted
+        self.pressed = None
+        self.held = set()
+
+    def update(self, events):
+        """ Take the snapshot for this frame's events
+        """
+        if not self.scripted:
+            self.pressed = pygame.key.get_pressed()
+            return
+
+        for event in events:
+            if event.type == KEYDOWN:
+                self.held.add(event.key)
+            elif event.type == KEYUP:
+                self.held.discard(event.key)
+
+    def is_held(self, key):
+        if self.scripted:
+            return key in self.held
+
+        return bool(self.pressed and self.pressed[key])
+
+
+class InputLatency(object):
+    """ Measures the input-to-photon latency: the number of frames and
+        milliseconds from an input event being received until a frame
+        showing its result is on the screen.
+
+        Every input event is stamped with the time and frame it was received
+        and the game tick it was handled on.  Input only shows once the game
+        world has been advanced past that tick and drawn, so an event is
+        done when a frame of a later tick is presented.  Events are received
+        when the event queue is read, pygame doesn't say when they happened.
+    """
+
+    def __init__(self):
+        self.frame = 0
+        self.pending = []
+
+        # Latency of the last input and the average of the last
+        # LATENCY_SAMPLES inputs
+        self.frames = 0
+        self.milliseconds = 0
+        self.samples = []
+
+    def received(self, events, current_time, tick):
+        """ Stamp the input events received this frame, to be handled on the
+            given game tick
+        """
+        for event in events:
+            if event.type in MEASURED_EVENTS:
+                self.pending.append((current_time, self.frame, tick))
+
+    def presented(self, current_time, tick=None):
+        """ A frame showing the game world as of the given game tick is on
+            the screen.  None means the frame shows all input handled so far,
+            like the menu which is drawn straight from its state.
+        """
+        if self.pending:
+            done = [stamp for stamp in self.pending if tick is None or stamp[2] < tick]
+
+            if done:
+                self.pending = [stamp for stamp in self.pending if tick is not None and stamp[2] >= tick]
+
+                for stamp in done:
+                    self.frames = self.frame - stamp[1] + 1
+                    self.milliseconds = current_time - stamp[0]
+                    self.samples.append(self.frames)
+
+                del self.samples[:-LATENCY_SAMPLES]
+
+        self.frame += 1
+
+    def average(self):
+        """ Get the average latency in frames of the last inputs
+        """
+        if not self.samples:
+            return 0.0
+
+        return sum(self.samples) / float(len(self.samples))
+
+
+class InputPipeline(object):
+    """ Reads the input of a frame: the events since the last frame, with
+        mouse motion coalesced, and the key state snapshot
+    """
+
+    def __init__(self, scripted=False):
+        self.keys = KeyState(scripted)
+        self.latency = InputLatency()
+
+    def poll(self, current_time, tick):
+        """ Get the events from the event queue, stamped for measuring their
+            latency
+        """
+        events = self.process(pygame.event.get())
+        self.latency.received(events, current_time, tick)
+
+        return events
+
+    def process(self, events):
+        """ Prepare the events of a frame to be handled
+        """
+        events = coalesce_motion(events)
+        self.keys.update(events)
+
+        return events
@@ -0,0 +1,173 @@
+import pygame
+from pygame.locals import Rect
+
+class LayerCache(object):
+    """ Screen sized cache of the static layers of the camera view: the base
+        (including the background) and the tiles.
+
+        The composed view is reused as is while the camera stands still.  When
+        the camera moves by (dx, dy) the cached pixels are shifted with
+        Surface.scroll() and only the newly exposed strips are drawn, base
+        and tiles, so the work follows how far the camera moved.  Tile edits
+        in view only redraw the edited tiles.  The only full screen copy is
+        the blit of the view onto the screen.
+
+        A base with layers anchored to the screen rather than the world, like
+        a fixed background, can't be shifted along with the tiles.  Then the
+        base is split into a back layer, up to the last of those, and the
+        front layer of the world-anchored parts over it.  The front layer and
+        the tiles are kept in a shifted cache of their own, drawn over the
+        back layer.  A back layer fixed on the screen is rendered once, any
+        other is rendered again on frames where the camera moved.  Parts
+        hidden under an opaque fixed background aren't drawn at all.
+    """
+
+    def __init__(self):
+        self.window = None
+        self.view = None
+        self.viewValid = False
+
+        # Back layer of a base that can't be shifted, with its rendered
+        # view if it is fixed on the screen, and the cache of the front
+        # layer and tiles drawn over it
+        self.back = None
+        self.backView = None
+        self.front = None
+        self.tileLayer = None
+        self.scrollable = True
+
+        # Screen rects of the cache that need to be drawn again, and world
+        # pixel rects of the tiles edited since the last draw
+        self.invalidRects = []
+        self.editedRects = []
+        self.tileengine = None
+        self.base = None
+
+    def tiles_edited(self, window):
+        """ Remember the edited tiles, they are invalidated on the next
+            draw if they are in view then.  The window is tile size.
+        """
+        tileSize = self.tileengine.tileSize
+        self.editedRects.append(Rect(window[0]*tileSize, window[1]*tileSize, window[2]*tileSize, window[3]*tileSize))
+
+    def draw(self, screen, gameengine):
+        """ Draw the static layers of the current camera view onto the screen
+        """
+        window = gameengine.camera.window
+        tileengine = gameengine.tileengine
+        moved = False
+
+        if self.tileengine is not tileengine:
+            self.tileengine = tileengine
+            tileengine.add_listener(self.tiles_edited)
+            self.view = None
+
+        if self.base is not gameengine.base:
+            self.base = gameengine.base
+            self.view = None
+
+        if self.view is None or self.view.get_size() != window.size:
+            # Nothing to reuse, draw the whole view
+            self.scrollable = self.base.scrollable()
+            self.view = pygame.Surface(window.size)
+            self.back, self.front = (None, self.base) if self.scrollable else self.base.split(window.size)
+            self.backView = None
+            self.tileLayer = None
+
+            if not self.scrollable:
+                self.tileLayer = pygame.Surface(window.size, pygame.SRCALPHA, 32)
+
+                if self.back.fixed():
+                    self.backView = pygame.Surface(window.size)
+                    self.back.render(self.backView, window)
+            self.window = Rect(window)
+            self.invalidRects = [self.view.get_rect()]
+            self.viewValid = False
+
+        elif window != self.window:
+            dx = self.window.left - window.left
+            dy = self.window.top - window.top
+            self.window = Rect(window)
+            moved = True
+
+            if abs(dx) >= window.width or abs(dy) >= window.height:
+                self.invalidRects = [self.view.get_rect()]
+            else:
+                self.scroll(dx, dy)
+
+        for rect in self.editedRects:
+            if rect.colliderect(window):
+                self.invalidRects.append(rect.move(-window.left, -window.top))
+
+        self.editedRects = []
+
+        if self.invalidRects:
+            for rect in self.invalidRects:
+                self.redraw(rect)
+
+            self.invalidRects = []
+
+        tileengine.evict_chunks(window)
+
+        if not self.scrollable and not self.viewValid:
+            if moved:
+                # The view would be composed again on the next move anyway,
+                # draw the layers straight onto the screen
+                self.draw_back(screen, window)
+                screen.blit(self.tileLayer, (0,0))
+                return
+
+            self.draw_back(self.view, window)
+            self.view.blit(self.tileLayer, (0,0))
+            self.viewValid = True
+
+        screen.blit(self.view, (0,0))
+
+    def draw_back(self, target, window):
+        """ Draw the back layer of a base that can't be shifted
+        """
+        if self.backView is not None:
+            target.blit(self.backView, (0,0))
+        else:
+            self.back.render(target, window)
+
+    def scroll(self, dx, dy):
+        """ Shift the cache by (dx, dy) and invalidate the strips uncovered by
+            the shift.
+        """
+        cache = self.view if self.scrollable else self.tileLayer
+        width, height = cache.get_size()
+        cache.scroll(dx, dy)
+
+        if dx > 0:
+            self.invalidRects.append(Rect(0, 0, dx, height))
+        elif dx < 0:
+            self.invalidRects.append(Rect(width + dx, 0, -dx, height))
+
+        if dy > 0:
+            self.invalidRects.append(Rect(0, 0, width, dy))
+        elif dy < 0:
+            self.invalidRects.append(Rect(0, height + dy, width, -dy))
+
+        self.viewValid = False
+
+    def redraw(self, rect):
+        """ Draw the cache in the screen rect, from the base and tile engine
+        """
+        rect = rect.clip(self.view.get_rect())
+
+        if rect.width == 0 or rect.height == 0:
+            return
+
+        worldRect = rect.move(self.window.topleft)
+
+        if self.scrollable:
+            target = self.view.subsurface(rect)
+        else:
+            self.tileLayer.fill((0,0,0,0), rect)
+            target = self.tileLayer.subsurface(rect)
+            self.viewValid = False
+
+        self.front.render(target, worldRect)
+
+        self.tileengine.draw(target, worldRect, False)
@@ -0,0 +1,292 @@
+import pygame
+from engine.assets import assets
+from engine.hud import Hud
+from engine.layercache import LayerCache
+from engine.timing import FRAME
+from utilities.util import Util
+
+# With more dirty rects than this in a frame the whole screen is updated
+MAX_DIRTY_RECTS = 256
+
+# Characters this many pixels outside the camera window are still drawn, as
+# the rotated images of their items stick out of the character
+CULL_MARGIN = 64
+
+class Renderer(object):
+    """ Draws the camera view of the game onto the screen.  The display
+        consists of the following layers from background to foreground
+        1. Background
+        2. Tiles (from tile engine)
+        3. Entities (player player, mobs, npc's, etc...)
+        4. Menu
+
+        With dirty rects enabled the renderer also tracks which parts of the
+        screen changed since the last frame (moved sprites, edited tiles and
+        changed UI/HUD lines) so only those need to be pushed to the display.
+        Any camera scroll changes the whole screen.
+    """
+
+    def __init__(self, timings, dirtyRects=False):
+        self.arialFnt = assets.font('Arial', 16)
+
+        self.timings = timings
+        self.debugHud = None
+        self.layerCache = LayerCache()
+
+        # Dirty rect tracking, the state of the last frame
+        self.dirtyRects = dirtyRects
+        self.lastWindow = None
+        self.lastState = None
+        self.lastDebugging = None
+        self.spriteRects = {}
+        self.projectileRects = []
+        self.tileengine = None
+        self.tileEdits = []
+
+        # Culling, the screen rects of the drawn sprites are written into
+        # reused buffers.  There are two rect pools swapped every frame as
+        # the rects of the last frame are needed for dirty rect tracking.
+        self.rectPools = ([], [])
+        self.blitList = []
+        self.drawnCharacters = 0
+        self.culledCharacters = 0
+        self.drawnProjectiles = 0
+
+        # Number of pixels pushed to the display in the last frame
+        self.pixelsPushed = 0
+        self.tileScope = timings.register('draw tiles')
+        self.characterScope = timings.register('draw characters')
+        self.projectileScope = timings.register('draw projectiles')
+
+    def draw(self, screen, gameengine, snapshot=None):
+        """ Draw the current camera view of the game onto the screen.  The
+            entities are drawn from the snapshot if one is given, otherwise
+            from the world as it is.  Returns the list of screen rects that
+            changed since the last frame or None if the whole screen has to be
+            updated.
+        """
+        camera = gameengine.camera
+
+        inMenu = gameengine.currentState == gameengine.menuState
+        inInventory = gameengine.currentState == gameengine.inventoryState
+
+        if self.tileengine is not gameengine.tileengine:
+            # Keep track of tile edits to know which tiles changed
+            self.tileengine = gameengine.tileengine
+            self.tileengine.add_listener(self.tiles_edited)
+
+        spriteRects = {}
+        hudRects = []
+        inventoryDirty = inInventory and gameengine.inventoryState.inventory.dirty
+
+        # Blit the background and the tiles (only the camera view)
+        with self.tileScope:
+            self.layerCache.draw(screen, gameengine)
+
+        # Now blit the characters on the screen adjusting for camera location
+        # Also blit the player's item, if equipped
+        with self.characterScope:
+            self.draw_sprites(screen, gameengine, snapshot, spriteRects)
+
+        # Blit all the projectiles
+        with self.projectileScope:
+            positions = snapshot.projectiles if snapshot is not None else None
+            projectilePositions = gameengine.projectiles.draw(screen, camera.window, positions)
+            self.drawnProjectiles = len(projectilePositions)
+
+        # Display the inventory
+        if inInventory:
+            gameengine.inventoryState.displayInventory(screen)
+
+        # Display the menu
+        if inMenu:
+            gameengine.menuState.displayMenu(screen)
+
+        # Debugging info
+        if gameengine.debugging:
+            hudRects = self.draw_debugging(screen, gameengine)
+
+        if not self.dirtyRects:
+            self.pixelsPushed = screen.get_width() * screen.get_height()
+            return None
+
+        # Work out what changed since the last frame
+        size = gameengine.projectiles.size
+        projectileRects = [pygame.Rect(position, (size, size)) for position in projectilePositions]
+
+        fullUpdate = (camera.window != self.lastWindow or
+                      gameengine.currentState != self.lastState or
+                      gameengine.debugging != self.lastDebugging)
+
+        dirtyRects = None
+        if not fullUpdate:
+            dirtyRects = self.changed_rects(camera.window, spriteRects, projectileRects, hudRects)
+
+            if inventoryDirty:
+                dirtyRects.append(gameengine.inventoryState.inventory.rect)
+
+            fullUpdate = len(dirtyRects) > MAX_DIRTY_RECTS
+
+        self.lastWindow = pygame.Rect(camera.window)
+        self.lastState = gameengine.currentState
+        self.lastDebugging = gameengine.debugging
+        self.spriteRects = spriteRects
+        self.projectileRects = projectileRects
+        self.tileEdits = []
+
+        if fullUpdate:
+            self.pixelsPushed = screen.get_width() * screen.get_height()
+            return None
+
+        screenRect = screen.get_rect()
+        dirtyRects = [screenRect.clip(rect) for rect in dirtyRects]
+        self.pixelsPushed = sum(rect.width * rect.height for rect in dirtyRects)
+
+        return dirtyRects
+
+    def draw_sprites(self, screen, gameengine, snapshot, spriteRects):
+        """ Draw the characters and their items in view, from the snapshot if
+            one is given.  Only the characters near the camera window are
+            looked at, the rest are culled.  The screen rects drawn at are
+            remembered in the sprite rects.
+        """
+        window = gameengine.camera.window
+        screenRect = screen.get_rect()
+
+        # Reuse the rects of the frame before last
+        self.rectPools = (self.rectPools[1], self.rectPools[0])
+        pool = self.rectPools[0]
+        blitList = self.blitList
+        del blitList[:]
+
+        if snapshot is not None:
+            # The spatial index may be changing in the simulation thread,
+            # the snapshot only holds the sprites near the camera
+            sprites = snapshot.sprites
+        else:
+            sprites = []
+            for character in gameengine.spatialIndex.query_rect(window.inflate(2*CULL_MARGIN, 2*CULL_MARGIN)):
+                sprites.append((character, character.image, character.rect.topleft))
+
+                item = character.currentItem
+                if item and item.image:
+                    sprites.append((item, item.image, item.rect.topleft))
+
+        drawnCharacters = 0
+        for sprite, image, location in sprites:
+            if len(blitList) == len(pool):
+                pool.append(pygame.Rect(0, 0, 0, 0))
+
+            rect = pool[len(blitList)]
+            rect.topleft = (location[0] - window.left, location[1] - window.top)
+            rect.size = image.get_size()
+
+            if rect.colliderect(screenRect):
+                spriteRects[sprite] = rect
+                blitList.append((image, rect))
+
+                if sprite in gameengine.characters:
+                    drawnCharacters += 1
+
+        Util.blit_all(screen, blitList)
+
+        self.drawnCharacters = drawnCharacters
+        self.culledCharacters = len(gameengine.characters) - drawnCharacters
+
+    def changed_rects(self, window, spriteRects, projectileRects, hudRects):
+        """ Get the screen rects that changed since the last frame
+        """
+        dirtyRects = list(hudRects)
+
+        # Sprites that moved, appeared or disappeared
+        for sprite, rect in spriteRects.items():
+            lastRect = self.spriteRects.get(sprite)
+
+            if lastRect != rect:
+                dirtyRects.append(rect)
+
+                if lastRect:
+                    dirtyRects.append(lastRect)
+
+        for sprite, lastRect in self.spriteRects.items():
+            if sprite not in spriteRects:
+                dirtyRects.append(lastRect)
+
+        # Projectiles are always moving
+        dirtyRects.extend(self.projectileRects)
+        dirtyRects.extend(projectileRects)
+
+        # Edited tiles
+        dirtyRects.extend(rect.move(-window.left, -window.top) for rect in self.tileEdits)
+
+        return dirtyRects
+
+    def tiles_edited(self, window):
+        """ Remember the world pixel rect of the edited tiles
+        """
+        tileSize = self.tileengine.tileSize
+        self.tileEdits.append(pygame.Rect(window[0]*tileSize, window[1]*tileSize, window[2]*tileSize, window[3]*tileSize))
+
+    def draw_debugging(self, screen, gameengine):
+        """ Draw the debugging info overlay.  Returns the screen rects that
+            changed.
+        """
+        if self.debugHud is None:
+            self.debugHud = self.create_debug_hud(gameengine)
+
+        return self.debugHud.draw(screen)
+
+    def create_debug_hud(self, gameengine):
+        """ Create the HUD of debugging info
+        """
+        hud = Hud(self.arialFnt)
+        player = gameengine.player
+        latency = gameengine.input.latency
+
+        hud.add_line('Position: ', lambda: '%d, %d' % (player.rect.left, player.rect.top))
+        hud.add_line('FPS: ', lambda: '%.1f' % gameengine.clock.get_fps(), True)
+
+        # Last, p95 and max time of each scope in milliseconds
+        for name in ('characters', 'projectiles', 'draw tiles', 'draw characters', 'draw projectiles', 'flip', FRAME):
+            hud.add_line(name + ': ', self.scope_value(name), True)
+
+        hud.add_line('Characters: ', lambda: '%d, Projectiles: %d' % (len(gameengine.characters), len(gameengine.projectiles)))
+        hud.add_line('Activity: ', self.activity_value(gameengine), True)
+        hud.add_line('Drawn: ', lambda: '%d characters (%d culled), %d projectiles (%d culled)' %
+                     (self.drawnCharacters, self.culledCharacters, self.drawnProjectiles,
+                      len(gameengine.projectiles) - self.drawnProjectiles), True)
+        hud.add_line('Input latency: ', lambda: '%d frames, %d ms (average %.1f frames)' %
+                     (latency.frames, latency.milliseconds, latency.average()), True)
+        hud.add_line('Pixels pushed: ', lambda: '%d' % self.pixelsPushed, True)
+        hud.add_line('Assets: ', lambda: '%d hits, %d misses, %d KB' % (assets.hits, assets.misses, assets.residentBytes // 1024), True)
+
+        return hud
+
+    def activity_value(self, gameengine):
+        """ Get a function formatting the number of active, sleeping and
+            updated characters
+        """
+        activity = gameengine.activity
+
+        def value():
+            sleeping = len(activity.sleeping)
+            updated = activity.updated
+
+            if gameengine.sharding:
+                sleeping += gameengine.sharding.sleeping()
+                updated += gameengine.sharding.updated
+
+            return '%d active, %d sleeping, %d updated' % (len(gameengine.characters) - sleeping, sleeping, updated)
+
+        return value
+
+    def scope_value(self, name):
+        """ Get a function formatting the timings of the named scope
+        """
+        timings = self.timings
+
+        def value():
+            stats = timings.stats(name)
+            return '%.2f ms (p95 %.2f, max %.2f)' % (1000 * timings.last(name), 1000 * stats['p95'], 1000 * stats['max'])
+
+        return value
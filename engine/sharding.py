@@ -0,0 +1,512 @@
+import multiprocessing
+import numpy
+
+# State of a simulated character, one record per slot of the shared record
+# table.  The owner is the region of the worker stepping the record, the
+# next owner the region it moved into, which takes over on the next tick.
+# The last tick is the tick the record was last stepped, woken or frozen on.
+CHARACTER_RECORD = numpy.dtype([('left', numpy.int32),
+                                ('top', numpy.int32),
+                                ('width', numpy.int16),
+                                ('height', numpy.int16),
+                                ('speed', numpy.int16),
+                                ('xdirection', numpy.int8),
+                                ('onGround', numpy.bool_),
+                                ('ydirection', numpy.float64),
+                                ('gravity', numpy.float64),
+                                ('maxFallingSpeed', numpy.float64),
+                                ('active', numpy.bool_),
+                                ('asleep', numpy.bool_),
+                                ('owner', numpy.int16),
+                                ('nextOwner', numpy.int16),
+                                ('phase', numpy.int32),
+                                ('lastTick', numpy.int32)])
+
+# Number of slots of the shared record table to start with, the table
+# doubles when it fills up
+INITIAL_CAPACITY = 1024
+
+class ShardedSimulation(object):
+    """ Simulates the characters other than the player on a pool of worker
+        processes.  The world is split into vertical strips of tiles, one
+        region per worker, and each worker steps the characters in its region
+        every game tick.  Characters crossing into another region are stepped
+        by its worker from the next tick on.
+
+        The records of the characters, the tile grid and the loaded chunks
+        of a streamed world are all in shared memory, so only a few bytes
+        telling the workers to step cross between the processes.  The
+        workers step while the game process updates the player and the
+        projectiles, and are waited for at the end of the tick.
+
+        Workers put characters to sleep and update far away ones at a
+        reduced rate the same way ActivityManager does, waking them goes
+        through the activity manager as for any other character.  The game
+        process keeps the Character sprites only as proxies for drawing and
+        for interacting with the player, and only updates the ones that
+        moved.
+    """
+
+    def __init__(self, tileengine, workers, activity):
+        self.tileengine = tileengine
+        self.activity = activity
+        self.tileSize = tileengine.tileSize
+
+        # Move the tile grid and the loaded chunks into shared memory
+        worldWidth, worldHeight = tileengine.worldSize
+        self.sharedGrid = multiprocessing.RawArray('B', worldWidth * worldHeight)
+        grid = numpy.frombuffer(self.sharedGrid, numpy.uint8).reshape(tileengine.worldSize)
+        grid[:] = tileengine.grid
+        tileengine.grid = grid
+        tileengine.gridMap = None
+
+        chunkCount = tileengine.chunkCount
+        self.sharedLoaded = multiprocessing.RawArray('B', chunkCount[0] * chunkCount[1])
+        loaded = numpy.frombuffer(self.sharedLoaded, numpy.bool_).reshape(chunkCount)
+        loaded[:] = tileengine.loadedChunks
+        tileengine.loadedChunks = loaded
+
+        self.regions = workers
+        self.regionWidth = -(-worldWidth * self.tileSize // workers)
+
+        # Characters by record slot, the slots freed by removed characters
+        # and the number of slots ever used
+        self.characters = {}
+        self.freeSlots = []
+        self.used = 0
+
+        # Changes to the records made while the workers may be stepping,
+        # written to the table at the start of the next tick
+        self.added = []
+        self.removed = []
+        self.woken = {}
+
+        # Number of characters the workers updated in the last tick
+        self.updated = 0
+        self.stepping = False
+
+        self.capacity = 0
+        self.solidTypes = None
+        self.sharedRecords = None
+        self.records = None
+        self.connections = []
+        self.workers = []
+
+        self.allocate(INITIAL_CAPACITY)
+
+    def __len__(self):
+        return len(self.characters)
+
+    def __contains__(self, character):
+        return getattr(character, 'recordId', None) in self.characters
+
+    def allocate(self, capacity):
+        """ Move the records into a shared record table of the given number
+            of slots, and start the workers on it
+        """
+        self.close()
+
+        sharedRecords = multiprocessing.RawArray('B', capacity * CHARACTER_RECORD.itemsize)
+        records = numpy.frombuffer(sharedRecords, CHARACTER_RECORD, capacity)
+
+        if self.records is not None:
+            records[:self.capacity] = self.records
+
+        # Left, top and x direction of the records as last copied to the
+        # proxies
+        synced = numpy.zeros((3, capacity), numpy.int32)
+
+        if self.records is not None:
+            synced[:, :self.capacity] = self.synced
+
+        self.capacity = capacity
+        self.sharedRecords = sharedRecords
+        self.records = records
+        self.synced = synced
+
+        # The workers are only told which tile types are solid when they
+        # start
+        tileengine = self.tileengine
+        self.solidTypes = list(tileengine.solidTypes)
+
+        for region in range(self.regions):
+            connection, workerConnection = multiprocessing.Pipe()
+            worker = multiprocessing.Process(target=run_worker, name='region %d' % region,
+                                             args=(workerConnection, sharedRecords, capacity,
+                                                   self.sharedGrid, tileengine.worldSize,
+                                                   self.sharedLoaded, tileengine.chunkCount,
+                                                   tileengine.chunkPixelSize, self.solidTypes,
+                                                   self.tileSize, region,
+                                                   self.regionWidth, self.regions,
+                                                   self.activity.lodInterval))
+            worker.daemon = True
+            worker.start()
+
+            self.connections.append(connection)
+            self.workers.append(worker)
+
+    def add(self, character):
+        """ Start simulating the character
+        """
+        if self.freeSlots:
+            slot = self.freeSlots.pop()
+        else:
+            slot = self.used
+            self.used += 1
+
+        rect = character.rect
+        region = int(region_of(rect.left, self.regionWidth, self.regions))
+
+        character.recordId = slot
+        self.characters[slot] = character
+        self.added.append((slot, (rect.left, rect.top, rect.width, rect.height, character.speed,
+                                  character.xdirection, character.onGround, character.ydirection,
+                                  character.gravity, character.maxFallingSpeed, True,
+                                  character in self.activity.sleeping, region, region,
+                                  self.activity.phases.get(character, 0),
+                                  self.activity.lastTicks.get(character, self.activity.tick))))
+
+    def remove(self, character):
+        """ Stop simulating the character
+        """
+        slot = character.recordId
+        del self.characters[slot]
+        self.removed.append(slot)
+        self.woken.pop(slot, None)
+
+    def wake(self, character):
+        slot = getattr(character, 'recordId', None)
+
+        if slot in self.characters:
+            self.woken[slot] = self.activity.tick
+
+    def sleeping(self):
+        """ Get the number of simulated characters asleep
+        """
+        records = self.records[:self.used]
+        return int(numpy.count_nonzero(records['active'] & records['asleep']))
+
+    def begin_step(self, gameengine):
+        """ Start the workers on advancing the simulated characters by one
+            game tick.  They step while the game process goes on with the
+            tick, until end_step().
+        """
+        self.flush()
+
+        # Start the workers again on tile types registered since
+        if self.tileengine.solidTypes != self.solidTypes:
+            self.allocate(self.capacity)
+
+        # Hand off the characters that crossed into another region last tick
+        used = self.records[:self.used]
+        used['owner'] = used['nextOwner']
+
+        activity = self.activity
+        near = gameengine.camera.window.inflate(2*activity.lodDistance, 2*activity.lodDistance)
+        message = (activity.tick, self.used, tuple(near), self.tileengine.world is not None)
+
+        for connection in self.connections:
+            connection.send(message)
+
+        self.stepping = True
+
+    def flush(self):
+        """ Write the characters added, removed and woken since the last tick
+            to the record table.  The workers must not be stepping.
+        """
+        if self.used > self.capacity:
+            capacity = self.capacity
+
+            while capacity < self.used:
+                capacity *= 2
+
+            self.allocate(capacity)
+
+        records = self.records
+
+        for slot, record in self.added:
+            records[slot] = record
+            # Copy it to the proxy on the next sync
+            self.synced[0, slot] = ~record[0]
+
+        for slot in self.removed:
+            records['active'][slot] = False
+
+        # Time stood still for the characters that were asleep
+        for slot, tick in self.woken.items():
+            if records['asleep'][slot]:
+                records['asleep'][slot] = False
+                records['lastTick'][slot] = tick
+
+        self.freeSlots.extend(self.removed)
+        self.added = []
+        self.removed = []
+        self.woken = {}
+
+    def end_step(self, gameengine, current_time):
+        """ Wait for the workers to finish the tick and update the proxies of
+            the characters that moved.  Only the proxies that changed cells
+            are moved in the spatial index, and only the images of the ones
+            in the camera window or that turned around are updated, the rest
+            are drawn culled.
+        """
+        if not self.stepping:
+            return
+
+        self.updated = sum(connection.recv() for connection in self.connections)
+        self.stepping = False
+
+        records = self.records[:self.used]
+        lefts, tops, xdirections = records['left'], records['top'], records['xdirection']
+        synced = self.synced[:, :self.used]
+
+        changed = numpy.flatnonzero(records['active'] & ((lefts != synced[0]) | (tops != synced[1]) |
+                                                         (xdirections != synced[2])))
+
+        if not len(changed):
+            return
+
+        left, top, xdirection = lefts[changed], tops[changed], xdirections[changed]
+        syncedLeft, syncedTop = synced[0, changed], synced[1, changed]
+        width, height = records['width'][changed], records['height'][changed]
+
+        # Characters that overlap other cells of the spatial index
+        cellSize = gameengine.spatialIndex.cellSize
+        movedCells = ((left // cellSize != syncedLeft // cellSize) |
+                      (top // cellSize != syncedTop // cellSize) |
+                      ((left + width - 1) // cellSize != (syncedLeft + width - 1) // cellSize) |
+                      ((top + height - 1) // cellSize != (syncedTop + height - 1) // cellSize))
+
+        # Characters that are drawn or turned around
+        windowLeft, windowTop, windowWidth, windowHeight = gameengine.camera.window
+        redrawn = (((left < windowLeft + windowWidth) & (left + width > windowLeft) &
+                    (top < windowTop + windowHeight) & (top + height > windowTop)) |
+                   (xdirection != synced[2, changed]))
+
+        characters = self.characters
+        spatialIndex = gameengine.spatialIndex
+
+        for slot, position, direction, move, redraw in zip(
+                changed.tolist(), zip(left.tolist(), top.tolist()), xdirection.tolist(),
+                movedCells.tolist(), redrawn.tolist()):
+            character = characters.get(slot)
+
+            if character is None:
+                continue
+
+            character.rect.topleft = position
+            character.xdirection = direction
+
+            if move:
+                spatialIndex.move(character)
+
+            if redraw:
+                character.update_image(current_time)
+
+        synced[0, changed] = left
+        synced[1, changed] = top
+        synced[2, changed] = xdirection
+
+    def restore(self, spatialIndex):
+        """ Copy the state of all the records back to the characters, to
+            simulate them in the game process again.  The workers must be
+            stopped.  Returns the characters that are asleep.
+        """
+        self.flush()
+        records = self.records
+        asleep = []
+
+        for slot, character in self.characters.items():
+            character.rect.topleft = (int(records['left'][slot]), int(records['top'][slot]))
+            character.xdirection = int(records['xdirection'][slot])
+            character.onGround = bool(records['onGround'][slot])
+            character.ydirection = float(records['ydirection'][slot])
+            spatialIndex.move(character)
+            self.activity.lastTicks[character] = int(records['lastTick'][slot])
+
+            if records['asleep'][slot]:
+                asleep.append(character)
+
+        return asleep
+
+    def close(self):
+        """ Stop the worker processes
+        """
+        if self.stepping:
+            for connection in self.connections:
+                connection.recv()
+
+            self.stepping = False
+
+        for connection in self.connections:
+            connection.send(None)
+
+        for worker in self.workers:
+            worker.join()
+
+        self.connections = []
+        self.workers = []
+
+
+def region_of(left, regionWidth, regions):
+    """ Get the regions of the world pixel x locations
+    """
+    return numpy.clip(left // regionWidth, 0, regions - 1)
+
+def step_records(records, grid, solid, tileSize, ticks):
+    """ Advance the characters by the given numbers of game ticks, the same
+        way as Character.update() moves a character, all at once.  The solid
+        array tells which tile type ids are solid.  Updates the records in
+        place and returns them.
+    """
+    left, top = records['left'].astype(numpy.int64), records['top'].astype(numpy.int64)
+    width, height = records['width'].astype(numpy.int64), records['height'].astype(numpy.int64)
+    xdirection, ydirection = records['xdirection'].copy(), records['ydirection'].copy()
+
+    # Move left or right
+    dx = numpy.sign(xdirection) * records['speed'].astype(numpy.int64) * ticks
+
+    # Move up or down, slowed by gravity
+    dy = numpy.zeros(len(records), numpy.int64)
+    falling = ~records['onGround']
+
+    for tick in range(int(ticks.max()) if len(ticks) else 0):
+        moving = falling & (ticks > tick)
+        ydirection[moving] = numpy.minimum(ydirection[moving] + records['gravity'][moving],
+                                           records['maxFallingSpeed'][moving])
+        dy[moving] += ydirection[moving].astype(numpy.int64)
+
+    # Move through the tile map stopping at any tiles in the way.  Sweeping
+    # along the rows is sweeping along the columns of the transposed grid.
+    left, contactX = sweep_records(grid, solid, tileSize, left, width, top, height, dx)
+    top, contactY = sweep_records(grid.T, solid, tileSize, top, height, left, width, dy)
+
+    xdirection[contactX != 0] = 0
+    ydirection[contactY != 0] = 0
+
+    below = numpy.ones(len(records), numpy.int64)
+    onGround = sweep_records(grid.T, solid, tileSize, top, height, left, width, below)[1] > 0
+
+    records['left'] = left
+    records['top'] = top
+    records['xdirection'] = xdirection
+    records['onGround'] = onGround
+    records['ydirection'] = ydirection
+
+    return records
+
+def sweep_records(grid, solid, tileSize, position, size, across, acrossSize, distance):
+    """ Move the rects along the columns of the grid by the distances,
+        stopping against the first solid tile, the way sweep_horizontal()
+        moves one rect.  The position and size are along the columns, across
+        and acrossSize along the rows.  Returns (positions, contacts).
+    """
+    positions = position + distance
+    contacts = numpy.zeros(len(position), numpy.int8)
+
+    # The columns entered by the leading edge, from the first to the last
+    forward = distance > 0
+    step = numpy.where(forward, 1, -1)
+    first = numpy.where(forward, (position + size - 1) // tileSize + 1, position // tileSize - 1)
+    last = numpy.where(forward, (position + size - 1 + distance) // tileSize, (position + distance) // tileSize)
+    lines = numpy.where(distance != 0, (last - first) * step + 1, 0)
+
+    firstRow = across // tileSize
+    rows = (across + acrossSize - 1) // tileSize - firstRow + 1
+    worldWidth, worldHeight = grid.shape
+
+    # Check one column of each rect still moving at a time
+    moving = numpy.flatnonzero(lines > 0)
+    line = 0
+
+    while len(moving):
+        column = first[moving] + line * step[moving]
+
+        # Locations outside the tile map are solid
+        hit = (column < 0) | (column >= worldWidth)
+
+        for offset in range(int(rows[moving].max())):
+            row = firstRow[moving] + offset
+            checked = ~hit & (offset < rows[moving])
+            outside = checked & ((row < 0) | (row >= worldHeight))
+            inside = checked & ~outside
+            hit |= outside
+            hit[inside] = solid[grid[column[inside], row[inside]]]
+
+        stopped = moving[hit]
+        forwardStopped = forward[stopped]
+        positions[stopped] = numpy.where(forwardStopped, column[hit] * tileSize - size[stopped],
+                                         (column[hit] + 1) * tileSize)
+        contacts[stopped] = numpy.where(forwardStopped, 1, -1)
+
+        line += 1
+        moving = moving[~hit]
+        moving = moving[lines[moving] > line]
+
+    return positions, contacts
+
+def step_region(records, region, regionWidth, regions, grid, loaded, chunkPixelSize, solid,
+                tileSize, tick, near, lodInterval, streaming):
+    """ Advance the characters of the region by one game tick, the ones that
+        are awake, the far away ones at a reduced rate, and put the ones that
+        came to rest to sleep, as ActivityManager.update() does.  Returns the
+        number of characters updated.
+    """
+    slots = numpy.flatnonzero(records['active'] & ~records['asleep'] & (records['owner'] == region))
+
+    if not len(slots):
+        return 0
+
+    # Far away characters are only updated on their phase
+    left, top = records['left'][slots], records['top'][slots]
+    right, bottom = left + records['width'][slots], top + records['height'][slots]
+    nearLeft, nearTop, nearWidth, nearHeight = near
+    isNear = (left < nearLeft + nearWidth) & (right > nearLeft) & (top < nearTop + nearHeight) & (bottom > nearTop)
+    slots = slots[isNear | (records['phase'][slots] % lodInterval == tick % lodInterval)]
+
+    # Characters on tiles that aren't loaded yet are frozen
+    if streaming and len(slots):
+        chunkX = (records['left'][slots] + records['width'][slots] // 2) // chunkPixelSize
+        chunkY = (records['top'][slots] + records['height'][slots] // 2) // chunkPixelSize
+        inside = (chunkX >= 0) & (chunkY >= 0) & (chunkX < loaded.shape[0]) & (chunkY < loaded.shape[1])
+        isLoaded = ~inside
+        isLoaded[inside] = loaded[chunkX[inside], chunkY[inside]]
+        records['lastTick'][slots[~isLoaded]] = tick
+        slots = slots[isLoaded]
+
+    if not len(slots):
+        return 0
+
+    # Make up for the ticks skipped since the last update
+    before = records[slots]
+    ticks = numpy.minimum(tick - before['lastTick'], lodInterval)
+    stepped = step_records(before.copy(), grid, solid, tileSize, ticks)
+    stepped['lastTick'] = tick
+
+    stepped['asleep'] = (stepped['onGround'] & (stepped['xdirection'] == 0) &
+                         (stepped['left'] == before['left']) & (stepped['top'] == before['top']))
+    stepped['nextOwner'] = region_of(stepped['left'], regionWidth, regions)
+    records[slots] = stepped
+
+    return len(slots)
+
+def run_worker(connection, sharedRecords, capacity, sharedGrid, worldSize, sharedLoaded, chunkCount,
+               chunkPixelSize, solidTypes, tileSize, region, regionWidth, regions, lodInterval):
+    """ Main loop of a worker process simulating the characters of one region
+    """
+    solid = numpy.array(solidTypes, numpy.bool_)
+    records = numpy.frombuffer(sharedRecords, CHARACTER_RECORD, capacity)
+    grid = numpy.frombuffer(sharedGrid, numpy.uint8).reshape(worldSize)
+    loaded = numpy.frombuffer(sharedLoaded, numpy.bool_).reshape(chunkCount)
+
+    while True:
+        message = connection.recv()
+
+        if message is None:
+            break
+
+        tick, used, near, streaming = message
+
+        connection.send(step_region(records[:used], region, regionWidth, regions, grid, loaded,
+                                    chunkPixelSize, solid, tileSize, tick, near, lodInterval,
+                                    streaming))
@@ -0,0 +1,150 @@
+import threading
+import pygame
+from pygame.locals import Rect
+from engine.gameengine import SKIP_TICKS, MAX_FRAMESKIP
+
+# Only the characters within this many pixels of the camera window are put in
+# a snapshot.  The camera follows the interpolated player so it can be up to
+# a tick behind the simulation.
+SNAPSHOT_MARGIN = 256
+
+class Snapshot(object):
+    """ Immutable record of where the entities were at the end of a game
+        tick: the image and world pixel location of every character and
+        carried item near the camera, in drawing order, and the positions and velocities of
+        the projectiles.  Snapshots are never changed once published so the renderer can read
+        them without holding the world lock.  The tick is the number of game
+        ticks the world had been advanced by.
+    """
+
+    def __init__(self, time, sprites, projectiles, velocities, tick=0):
+        self.time = time
+        self.tick = tick
+        self.sprites = sprites
+        self.projectiles = projectiles
+        self.velocities = velocities
+
+    @classmethod
+    def fromgameengine(cls, gameengine, time):
+        """ Take a snapshot of the game world.  The world lock must be held.
+        """
+        sprites = []
+        near = gameengine.camera.window.inflate(2*SNAPSHOT_MARGIN, 2*SNAPSHOT_MARGIN)
+
+        for character in gameengine.spatialIndex.query_rect(near):
+            sprites.append((character, character.image, character.rect.topleft))
+
+            item = character.currentItem
+            if item and item.image:
+                sprites.append((item, item.image, item.rect.topleft))
+
+        projectiles = gameengine.projectiles
+        count = projectiles.count
+
+        return cls(time, sprites, projectiles.positions[:count].copy(), projectiles.velocities[:count].copy(),
+                   gameengine.tick)
+
+    def interpolate(self, previous, alpha):
+        """ Get the snapshot the given fraction (0 to 1) of the way from the
+            previous snapshot to this one
+        """
+        lastLocations = dict((sprite, location) for sprite, _, location in previous.sprites)
+        sprites = []
+
+        for sprite, image, location in self.sprites:
+            lastLocation = lastLocations.get(sprite, location)
+
+            location = (int(round(lastLocation[0] + (location[0] - lastLocation[0]) * alpha)),
+                        int(round(lastLocation[1] + (location[1] - lastLocation[1]) * alpha)))
+
+            sprites.append((sprite, image, location))
+
+        # Projectiles move in a straight line, step back from this snapshot
+        # along their velocity
+        projectiles = self.projectiles - self.velocities * (1.0 - alpha)
+
+        return Snapshot(previous.time + (self.time - previous.time) * alpha, sprites, projectiles, self.velocities,
+                        self.tick)
+
+    def rect(self, sprite):
+        """ Get the world pixel rect of the sprite in this snapshot
+        """
+        for other, image, location in self.sprites:
+            if other is sprite:
+                return Rect(location, image.get_size())
+
+        return sprite.rect
+
+
+class SimulationThread(threading.Thread):
+    """ Advances the game world in its own thread at the fixed game tick rate,
+        independent of how fast frames are drawn.  After every tick a
+        snapshot of the entities is published; the last two snapshots are
+        double buffered and the render loop draws the world interpolated
+        between them, so motion stays smooth at frame rates above the tick
+        rate.
+
+        The world is only changed while holding the world lock.  Anything
+        changing the world outside this thread, like handling input, must
+        hold it too.
+    """
+
+    def __init__(self, gameengine):
+        threading.Thread.__init__(self, name='simulation')
+        self.daemon = True
+
+        self.gameengine = gameengine
+        self.lock = gameengine.worldLock
+        self.running = False
+        self.stopped = threading.Event()
+
+        # The two latest snapshots, (previous, current), replaced as a whole
+        now = pygame.time.get_ticks()
+        with self.lock:
+            snapshot = Snapshot.fromgameengine(gameengine, now)
+        self.snapshots = (snapshot, snapshot)
+
+    def run(self):
+        gameengine = self.gameengine
+        nextGameTick = pygame.time.get_ticks()
+        self.running = True
+
+        while self.running:
+            delay = nextGameTick - pygame.time.get_ticks()
+
+            if delay > 0:
+                self.stopped.wait(delay / 1000.0)
+                continue
+
+            # Don't try to catch up on ticks missed while the game was paused
+            # or the machine was busy
+            if -delay > MAX_FRAMESKIP * SKIP_TICKS:
+                nextGameTick = pygame.time.get_ticks()
+
+            with self.lock:
+                if gameengine.currentState != gameengine.menuState:
+                    gameengine.step(nextGameTick)
+
+                snapshot = Snapshot.fromgameengine(gameengine, nextGameTick)
+
+            self.snapshots = (self.snapshots[1], snapshot)
+            nextGameTick += SKIP_TICKS
+
+    def stop(self):
+        self.running = False
+        self.stopped.set()
+
+    def frame(self, current_time):
+        """ Get the snapshot of the world to draw at the given time,
+            interpolated between the last two ticks
+        """
+        previous, current = self.snapshots
+
+        if current.time == previous.time:
+            return current
+
+        # Drawing always lags one tick behind the simulation, the frame is
+        # drawn between the previous and current tick
+        alpha = (current_time - current.time) / float(current.time - previous.time)
+
+        return current.interpolate(previous, max(0.0, min(1.0, alpha)))
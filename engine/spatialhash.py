@@ -0,0 +1,170 @@
+class SpatialHash(object):
+    """ Spatial index of entities on the world map.  The world is divided
+        into a uniform grid of cells and each entity is stored in every cell
+        its rect overlaps, so finding the entities in an area only needs to
+        look at the cells covering that area.  Entities are always returned
+        in the order they were added, so overlapping sprites are drawn in the
+        same order on every run.
+        http://en.wikipedia.org/wiki/Spatial_hashing
+    """
+
+    def __init__(self, cellSize=128):
+        self.cellSize = cellSize
+
+        # Entities in each cell keyed by cell location, (x,y) tuple
+        self.cells = {}
+
+        # Range of cells each entity is in keyed by entity, (left, top,
+        # right, bottom) inclusive cell locations
+        self.entityCells = {}
+
+        # Order the entities were added in keyed by entity, cells are sets
+        # which have no stable order
+        self.order = {}
+        self.nextOrder = 0
+
+    def __len__(self):
+        return len(self.entityCells)
+
+    def __contains__(self, entity):
+        return entity in self.entityCells
+
+    def __iter__(self):
+        return iter(sorted(self.entityCells, key=self.order.get))
+
+    def cell_range(self, rect):
+        """ Get the inclusive range of cells, (left, top, right, bottom),
+            overlapped by the given pixel rect.
+        """
+        left, top, width, height = rect
+
+        return (left // self.cellSize, top // self.cellSize,
+                (left + max(1, width) - 1) // self.cellSize,
+                (top + max(1, height) - 1) // self.cellSize)
+
+    def add(self, entity):
+        """ Add an entity to the index at the location of its rect
+        """
+        if entity in self.entityCells:
+            self.move(entity)
+            return
+
+        cellRange = self.cell_range(entity.rect)
+        self.entityCells[entity] = cellRange
+        self.order[entity] = self.nextOrder
+        self.nextOrder += 1
+        self.insert(entity, cellRange)
+
+    def remove(self, entity):
+        """ Remove an entity from the index.  Does nothing if the entity is
+            not in the index.
+        """
+        cellRange = self.entityCells.pop(entity, None)
+
+        if cellRange is not None:
+            del self.order[entity]
+            self.delete(entity, cellRange)
+
+    def move(self, entity):
+        """ Update the location of an entity whose rect has changed.  Only
+            the cells the entity left or entered are touched.
+        """
+        oldRange = self.entityCells.get(entity)
+
+        if oldRange is None:
+            self.add(entity)
+            return
+
+        newRange = self.cell_range(entity.rect)
+
+        if newRange == oldRange:
+            return
+
+        self.entityCells[entity] = newRange
+        self.delete(entity, oldRange, newRange)
+        self.insert(entity, newRange, oldRange)
+
+    def insert(self, entity, cellRange, skipRange=None):
+        """ Add the entity to all the cells in the cell range except those
+            also in the skip range.
+        """
+        left, top, right, bottom = cellRange
+
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                if skipRange and skipRange[0] <= x <= skipRange[2] and skipRange[1] <= y <= skipRange[3]:
+                    continue
+
+                cell = self.cells.get((x,y))
+
+                if cell is None:
+                    cell = self.cells[(x,y)] = set()
+
+                cell.add(entity)
+
+    def delete(self, entity, cellRange, skipRange=None):
+        """ Remove the entity from all the cells in the cell range except
+            those also in the skip range.
+        """
+        left, top, right, bottom = cellRange
+
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                if skipRange and skipRange[0] <= x <= skipRange[2] and skipRange[1] <= y <= skipRange[3]:
+                    continue
+
+                cell = self.cells.get((x,y))
+
+                if cell is not None:
+                    cell.discard(entity)
+
+                    # Drop empty cells so the index does not grow with every
+                    # cell an entity has ever been in
+                    if not cell:
+                        del self.cells[(x,y)]
+
+    def query_rect(self, rect, ignoreList=None):
+        """ Get all the entities whose rect collides with the given pixel
+            rect, skipping any entities in the ignore list.
+        """
+        left, top, right, bottom = self.cell_range(rect)
+        results = []
+        seen = set()
+
+        for x in range(left, right + 1):
+            for y in range(top, bottom + 1):
+                cell = self.cells.get((x,y))
+
+                if not cell:
+                    continue
+
+                for entity in cell:
+                    if entity in seen:
+                        continue
+
+                    seen.add(entity)
+
+                    if ignoreList and entity in ignoreList:
+                        continue
+
+                    if entity.rect.colliderect(rect):
+                        results.append(entity)
+
+        results.sort(key=self.order.get)
+
+        return results
+
+    def query_point(self, point, ignoreList=None):
+        """ Get all the entities whose rect contains the given pixel location,
+            skipping any entities in the ignore list.
+        """
+        cell = self.cells.get((point[0] // self.cellSize, point[1] // self.cellSize))
+
+        if not cell:
+            return []
+
+        results = [entity for entity in cell
+                   if not (ignoreList and entity in ignoreList) and entity.rect.collidepoint(point)]
+        results.sort(key=self.order.get)
+
+        return results
@@ -0,0 +1,107 @@
+import hashlib
+import os
+import threading
+from contextlib import contextmanager
+from time import time
+from engine.tileengine import MAP_COLORS
+from engine.worldformat import convert_map, WorldFile, WORLD_EXTENSION, VERSION
+
+# Directory of the baked world files of the PNG tile maps
+MAP_CACHE_DIR = 'cache'
+
+# Size of the blocks map files are hashed in
+HASH_BLOCK_SIZE = 1024 * 1024
+
+class StartupTimeline(object):
+    """ Timeline of the game startup.  Each step is recorded with its start
+        and end time from when the timeline was created, up to the first
+        frame.
+    """
+
+    def __init__(self):
+        self.start = time()
+        self.steps = []
+        self.firstFrame = None
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def step(self, name):
+        """ Record the time taken by the step, use it as a context manager
+            around the work
+        """
+        start = time()
+
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.steps.append((name, start - self.start, time() - start, threading.current_thread().name))
+
+    def first_frame(self):
+        """ Mark the first frame as shown.  Returns the time to first frame in
+            seconds.
+        """
+        if self.firstFrame is None:
+            self.firstFrame = time() - self.start
+
+        return self.firstFrame
+
+    def report(self):
+        """ Get the timeline as lines of text
+        """
+        lines = ['%-24s %-12s at %7.1f ms took %7.1f ms' % (name, thread, 1000 * start, 1000 * duration)
+                 for name, start, duration, thread in sorted(self.steps, key=lambda step: step[1])]
+
+        if self.firstFrame is not None:
+            lines.append('Time to first frame: %.1f ms' % (1000 * self.firstFrame))
+
+        return lines
+
+
+def file_hash(filename, digest=None):
+    """ Get the hex SHA-1 digest of the file's contents, added to the
+        given digest if there is one
+    """
+    if digest is None:
+        digest = hashlib.sha1()
+
+    with open(filename, 'rb') as hashedFile:
+        block = hashedFile.read(HASH_BLOCK_SIZE)
+
+        while block:
+            digest.update(block)
+            block = hashedFile.read(HASH_BLOCK_SIZE)
+
+    return digest.hexdigest()
+
+def baked_map(mapFilename, chunkSize, cacheDir=MAP_CACHE_DIR):
+    """ Get the world file baked from the PNG tile map, baking it if the map
+        hasn't been baked before.  Baked maps are keyed by the hash of the
+        map file, the world file version and the map colors, so a changed
+        map or conversion is baked again.  A baked map that can't be opened
+        is baked again too.
+    """
+    digest = hashlib.sha1()
+    digest.update(('%d:%s:' % (VERSION, ','.join('%d=%s' % color for color in sorted(MAP_COLORS.items())))).encode('utf-8'))
+
+    worldFilename = os.path.join(cacheDir, '%s-%d%s' % (file_hash(mapFilename, digest), chunkSize, WORLD_EXTENSION))
+
+    if os.path.exists(worldFilename):
+        try:
+            WorldFile(worldFilename).close()
+        except Exception:
+            os.remove(worldFilename)
+
+    if not os.path.exists(worldFilename):
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+
+        # Bake to a temporary file so an interrupted bake is never used
+        temporaryFile = worldFilename + '.tmp'
+        convert_map(mapFilename, temporaryFile, chunkSize)
+        os.rename(temporaryFile, worldFilename)
+
+    return worldFilename
+
+# Timeline of this run of the game
+timeline = StartupTimeline()
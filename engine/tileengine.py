@@ -1,18 +1,106 @@
+import mmap
+import threading
+import numpy
 import pygame
+from engine.assets import assets, CONVERT_ALPHA
+from engine.chunkcache import ChunkCache
+from engine.worldformat import WorldFile
+
+# Size of a tile layer chunk (number of tiles, not pixels).  The tile layer is
+# rendered and cached one chunk at a time.
+CHUNK_SIZE = 16
+
+# Maximum number of bytes of rendered chunk surfaces kept in memory
+CHUNK_MEMORY_BUDGET = 32 * 1024 * 1024
+
+# Chunks further than this many chunks outside the camera window are evicted
+CHUNK_EVICT_DISTANCE = 2
+
+# When streaming a world file, chunks up to this many chunks outside the
+# camera window in the direction the camera is moving are loaded ahead
+CHUNK_PREFETCH_DISTANCE = 2
+
+# When streaming a world file, the tiles of chunks further than this many
+# chunks outside the camera window are unloaded
+CHUNK_UNLOAD_DISTANCE = 4
+
+# Tile type id of a location without a tile
+EMPTY = 0
+
+# Tile types in a tile map file, keyed by the red value of the pixel color
+MAP_COLORS = {0: 'rock'}
 
 class TileEngine(object):
     """ Tile engine that works with the tile layer of the game
         http://en.wikipedia.org/wiki/Tile_engine
+
+        The tile layer is stored as a grid of tile type ids indexed by tile
+        location, grid[x,y].  Everything shared by tiles of the same type,
+        like the image, is held by the registered TileType.
     """
 
-    def __init__(self, worldSize=(0,0), tileSize=32):
+    def __init__(self, worldSize=(0,0), tileSize=32, chunkSize=CHUNK_SIZE, chunkMemoryBudget=CHUNK_MEMORY_BUDGET):
+        self.worldSize=worldSize
         self.tileSize=tileSize
-        self.tiles=[[None for _ in range(worldSize[0])] for _ in range(worldSize[1])]
-        self.tileWorldSurface = None 
+        self.grid = numpy.zeros(worldSize, numpy.uint8)
+
+        # Surface tiles (tiles with at least one empty adjacent tile) are 
+        # tracked as the grid is edited, rather than searched for
+        self.surfaceMask = numpy.zeros(worldSize, numpy.bool_)
+
+        # Registry of tile types, indexed by tile type id.  The empty tile
+        # type has no TileType.
+        self.tileTypes = [None]
+        self.tileTypeNames = {}
+        self.solidTypes = [False]
+        self.register_tile_type(TileType('rock', "images/rock-texture.png"))
+        self.register_tile_type(TileType('block', color=(0,0,0), size=(tileSize,tileSize)))
+        
+        # The tile layer is split into chunks that are rendered on demand 
+        # when they become visible, rather than one surface for the whole
+        # world
+        self.chunkSize = chunkSize
+        self.chunkPixelSize = chunkSize * tileSize
+        self.chunkCount = (-(-worldSize[0] // chunkSize), -(-worldSize[1] // chunkSize))
+        self.chunks = ChunkCache(chunkMemoryBudget)
+        
+        # Tiles streamed from a world file are only loaded into the grid one
+        # chunk at a time as the camera gets near, refer to stream().  The
+        # grid of a world that isn't streamed is loaded up front.
+        self.world = None
+        self.worldTypeIds = None
+        self.loadedChunks = numpy.ones(self.chunkCount, numpy.bool_)
+        self.streamWindow = None
+        self.unloadDistance = CHUNK_UNLOAD_DISTANCE
+        self.keptChunks = None
+        
+        # The locations of the chunks loaded by load_chunk(), so unloading
+        # them doesn't need to look through all of loadedChunks
+        self.streamedChunks = set()
+        
+        # Chunks of a streamed world edited since the world file was
+        # written, and the tiles of the ones that were unloaded since.
+        # Their tiles are loaded from here instead of the world file.
+        self.editedChunks = numpy.zeros(self.chunkCount, numpy.bool_)
+        self.unloadedTiles = {}
+        
+        # Memory maps holding the grid and the surface mask of a streamed
+        # world, whose pages are given back once their chunks are unloaded
+        self.gridMap = None
+        self.surfaceMap = None
+        
+        # Held while loading a chunk.  With the threaded simulation chunks
+        # are streamed by the simulation thread and rendered, which loads
+        # them too, by the render thread.
+        self.loadLock = threading.Lock()
+        
+        # Functions called with the tile window, (left, top, width, height),
+        # of every edit to the tile map
+        self.listeners = []
         
         
     @classmethod
-    def fromfilename(cls, filename, tileSize=32):
+    def fromfilename(cls, filename, tileSize=32, chunkMemoryBudget=CHUNK_MEMORY_BUDGET):
         """ Create a new TileEngine using the provided file as the tile map. 
             The file is expected to be an image file where the pixel color maps 
             to the tile type at that location.
@@ -21,26 +109,93 @@ class TileEngine(object):
         surface = pygame.image.load(filename)
         width, height = surface.get_size()
         
-        engine = cls((width,height), tileSize)
-        
-        engine.tileWorldSurface = pygame.Surface((width*tileSize, height*tileSize), pygame.SRCALPHA, 32)
-        engine.tileWorldSurface.convert_alpha()
+        engine = cls((width,height), tileSize, chunkMemoryBudget=chunkMemoryBudget)
         
-        for x in range(0,width):
-            for y in range(0,height):
-                color = surface.get_at((x,y))
-                value = color.r
+        # Map the pixel colors to tile types in one pass over the whole map
+        red = pygame.surfarray.array3d(surface)[:,:,0]
                 
-                if value == 0:
-                    tile = Tile("images/rock-texture.png")
-                    engine.place_tile((x,y), tile)
+        for value, name in MAP_COLORS.items():
+            engine.grid[red == value] = engine.find_tile_type(name).id
+        
+        engine.update_surface_tiles()
 
         return engine
     
+    @classmethod
+    def fromworldfile(cls, filename, tileSize=32, chunkMemoryBudget=CHUNK_MEMORY_BUDGET):
+        """ Create a new TileEngine streaming the tiles from the provided
+            world file, refer to engine.worldformat.  Only the header of the 
+            file is read up front.
+        """
+        world = WorldFile(filename)
+        
+        engine = cls(world.worldSize, tileSize, world.chunkSize, chunkMemoryBudget)
+        engine.grid, engine.gridMap = allocate_pages(world.worldSize, numpy.uint8)
+        engine.surfaceMask, engine.surfaceMap = allocate_pages(world.worldSize, numpy.bool_)
+        engine.loadedChunks[:] = False
+        engine.open_world(world)
+        
+        return engine
+    
+    def open_world(self, world):
+        """ Stream the chunks that aren't loaded yet from the world file
+        """
+        self.world = world
+        
+        # The world file has all the edits made so far
+        self.editedChunks[:] = False
+        self.unloadedTiles = {}
+        
+        # Map the tile type ids of the file to the registered tile types
+        self.worldTypeIds = numpy.array([self.tileTypeNames[name].id if name in self.tileTypeNames else EMPTY
+                                         for name in world.typeNames], numpy.uint8)
+    
+    def register_tile_type(self, tileType):
+        """ Register a new tile type, assigning it a tile type id.  Returns the
+            registered tile type.
+        """
+        if len(self.tileTypes) > numpy.iinfo(self.grid.dtype).max:
+            raise Exception("Too many tile types")
+
+        tileType.id = len(self.tileTypes)
+
+        self.tileTypes.append(tileType)
+        self.tileTypeNames[tileType.name] = tileType
+        self.solidTypes.append(tileType.solid)
+
+        return tileType
+
+    def find_tile_type(self, name):
+        """ Get the registered tile type with the given name
+        """
+        return self.tileTypeNames[name]
+
+    def get_tile_id(self, location):
+        """ Get the tile type id at the specified tile location
+        """
+        return self.grid.item(location[0], location[1])
+
+    def is_solid(self, location):
+        """ Check if the tile at the specified tile location blocks movement.
+            Locations outside the tile map are always solid.
+        """
+        x, y = location
+        
+        if x < 0 or y < 0 or x >= self.worldSize[0] or y >= self.worldSize[1]:
+            return True
+        
+        return self.solidTypes[self.grid.item(x, y)]
+
     def get_tile(self, location):
-        """ Get the tile at the specified tile location
+        """ Get the tile at the specified tile location or None if there is
+            no tile at that location.
         """
-        return self.tiles[location[0]][location[1]]
+        tileId = self.grid.item(location[0], location[1])
+
+        if tileId == EMPTY:
+            return None
+
+        return Tile(self.tileTypes[tileId], location, self.tileSize)
     
     def get_tile_pixel(self, location):
         """ Get the tile at the specified world pixel location
@@ -58,51 +213,503 @@ class TileEngine(object):
         """  
         return (location[0]*self.tileSize, location[1]*self.tileSize)  
     
-    def place_tile(self, location, tile):
-        """ Place the given tile at the given tile location. Returns the tile 
-            that was placed.
+    def place_tile(self, location, tileType):
+        """ Place a tile of the given tile type at the given tile location.
+            Returns the tile that was placed.
         """
         
-        # Set the tile's internal location
-        tile.rect.topleft = self.tile_to_pixel((location[0],location[1]))
+        self.load_chunk(self.tile_to_chunk(location))
+        self.grid[location[0], location[1]] = tileType.id
+        self.update_surface_tiles((location[0]-1, location[1]-1, 3, 3))
         
-        self.tiles[location[0]][location[1]] = tile
+        # Update the owning chunk, if it is rendered.  Chunks that are not 
+        # rendered will pick up the tile when they are next rendered.
+        chunk = self.chunks.peek(self.tile_to_chunk(location))
         
-        # Update the world tile surface
-        self.tileWorldSurface.blit(tile.image, (location[0]*self.tileSize,location[1]*self.tileSize))
+        if chunk is not None:
+            position = self.chunk_offset(location)
+            chunk.fill((0,0,0,0), pygame.Rect(position, (self.tileSize, self.tileSize)))
+            chunk.blit(tileType.image, position)
         
-        return tile
+        self.notify((location[0], location[1], 1, 1))
+        
+        return Tile(tileType, location, self.tileSize)
     
     def remove_tile(self, location, background):
         """ Remove the tile at the given tile location. Returns the removed 
             tile or None if no tile was found at that location.
         """
-        tile = self.tiles[location[0]][location[1]]
-        self.tiles[location[0]][location[1]] = None
+        self.load_chunk(self.tile_to_chunk(location))
+        tile = self.get_tile(location)
+        self.grid[location[0], location[1]] = EMPTY
+        self.update_surface_tiles((location[0]-1, location[1]-1, 3, 3))
         
-        # Update the world tile surface by filling the removed tile space with
+        # Update the owning chunk by filling the removed tile space with
         # transparency  
-        tileSubsurface = self.tileWorldSurface.subsurface(pygame.Rect(location[0]*self.tileSize,location[1]*self.tileSize, self.tileSize, self.tileSize))
-        tileSubsurface.fill((0,0,0,0))
+        chunk = self.chunks.peek(self.tile_to_chunk(location))
+        
+        if chunk is not None:
+            position = self.chunk_offset(location)
+            chunk.fill((0,0,0,0), pygame.Rect(position, (self.tileSize, self.tileSize)))
+        
+        self.notify((location[0], location[1], 1, 1))
         
         return tile
+    
+    def set_tiles(self, window, tiles):
+        """ Set all the tiles in the window at once.  The window is tile 
+            size and must be within the tile map, and the tiles are the tile
+            type ids of the window, indexed [x,y], or a single tile type id.
+            The grid, the surface tiles and the rendered chunks are updated
+            once for the whole window and the listeners are told once.
+        """
+        left, top, width, height = window
+        
+        self.stream_tiles(window)
+        
+        self.grid[left:left+width, top:top+height] = tiles
+        self.update_surface_tiles((left-1, top-1, width+2, height+2))
+        self.repaint(window)
+        
+        self.notify(window)
+    
+    def repaint(self, window):
+        """ Draw the tiles in the window (tile size) again on the rendered
+            chunks.  Chunks that are not rendered will pick up the tiles when
+            they are next rendered.
+        """
+        left, top, width, height = window
+        chunkSize = self.chunkSize
+        
+        for chunkX in range(left // chunkSize, (left + width - 1) // chunkSize + 1):
+            for chunkY in range(top // chunkSize, (top + height - 1) // chunkSize + 1):
+                chunk = self.chunks.peek((chunkX, chunkY))
+                
+                if chunk is None:
+                    continue
+                
+                # The part of the window on this chunk, in tiles
+                chunkLeft, chunkTop = chunkX * chunkSize, chunkY * chunkSize
+                areaLeft, areaTop = max(left, chunkLeft), max(top, chunkTop)
+                areaRight = min(left + width, chunkLeft + chunkSize)
+                areaBottom = min(top + height, chunkTop + chunkSize)
+                
+                chunk.fill((0,0,0,0), pygame.Rect((areaLeft - chunkLeft) * self.tileSize, (areaTop - chunkTop) * self.tileSize,
+                                                  (areaRight - areaLeft) * self.tileSize, (areaBottom - areaTop) * self.tileSize))
+                
+                areaGrid = self.grid[areaLeft:areaRight, areaTop:areaBottom]
+                xs, ys = numpy.nonzero(areaGrid)
+                
+                for x, y in zip(xs.tolist(), ys.tolist()):
+                    chunk.blit(self.tileTypes[areaGrid.item(x, y)].image,
+                               ((areaLeft - chunkLeft + x) * self.tileSize, (areaTop - chunkTop + y) * self.tileSize))
+    
+    def clip_window(self, window):
+        """ Constrain the window (tile size) to the tile map
+        """
+        left = max(0, window[0])
+        top = max(0, window[1])
+        right = min(self.worldSize[0], window[0] + window[2])
+        bottom = min(self.worldSize[1], window[1] + window[3])
+        
+        return (left, top, max(0, right - left), max(0, bottom - top))
+    
+    def fill_rect(self, window, tileType):
+        """ Fill the window (tile size) with tiles of the given tile type
+        """
+        window = self.clip_window(window)
+        
+        if window[2] and window[3]:
+            self.set_tiles(window, tileType.id)
+    
+    def clear_rect(self, window):
+        """ Remove all the tiles in the window (tile size)
+        """
+        window = self.clip_window(window)
+        
+        if window[2] and window[3]:
+            self.set_tiles(window, EMPTY)
+    
+    def apply_stencil(self, location, stencil, tileType, replace=True):
+        """ Set the tiles where the stencil, a boolean array indexed [x,y],
+            is true to the given tile type, or remove them if the tile type
+            is None.  The stencil's top-left corner is placed at the tile 
+            location.  Unless replace is True only empty locations are 
+            filled.
+        """
+        width, height = stencil.shape
+        left, top, clippedWidth, clippedHeight = self.clip_window((location[0], location[1], width, height))
+        
+        if not clippedWidth or not clippedHeight:
+            return
+        
+        window = (left, top, clippedWidth, clippedHeight)
+        stencil = stencil[left-location[0]:left-location[0]+clippedWidth, top-location[1]:top-location[1]+clippedHeight]
+        
+        # Load the chunks before reading the current tiles of a streamed world
+        self.stream_tiles(window)
+        
+        current = self.grid[left:left+clippedWidth, top:top+clippedHeight]
+        tiles = current.copy()
+        
+        if tileType is None:
+            tiles[stencil] = EMPTY
+        elif replace:
+            tiles[stencil] = tileType.id
+        else:
+            tiles[stencil & (tiles == EMPTY)] = tileType.id
+        
+        # Nothing to do if no tile changes, like a brush dragged within a 
+        # tile or over tiles already filled
+        xs, ys = numpy.nonzero(tiles != current)
+        
+        if not len(xs):
+            return
+        
+        # Only edit the tiles that changed
+        changedLeft, changedTop = int(xs.min()), int(ys.min())
+        changedRight, changedBottom = int(xs.max()) + 1, int(ys.max()) + 1
+        
+        self.set_tiles((left + changedLeft, top + changedTop, changedRight - changedLeft, changedBottom - changedTop),
+                       tiles[changedLeft:changedRight, changedTop:changedBottom])
+    
+    def brush_line(self, start, end, tileType, radius=0, replace=True):
+        """ Paint a line of tiles of the given tile type, or remove them if
+            the tile type is None, between the start and end tile locations.
+            The brush is a square reaching radius tiles around the line.
+        """
+        steps = max(abs(end[0] - start[0]), abs(end[1] - start[1])) + 1
+        xs = numpy.rint(numpy.linspace(start[0], end[0], steps)).astype(numpy.intp)
+        ys = numpy.rint(numpy.linspace(start[1], end[1], steps)).astype(numpy.intp)
+        
+        left, top = xs.min() - radius, ys.min() - radius
+        stencil = numpy.zeros((xs.max() - left + radius + 1, ys.max() - top + radius + 1), numpy.bool_)
+        
+        # Stamp the brush at every point of the line
+        for dx in range(2*radius + 1):
+            for dy in range(2*radius + 1):
+                stencil[xs - left - radius + dx, ys - top - radius + dy] = True
+        
+        self.apply_stencil((int(left), int(top)), stencil, tileType, replace)
+    
+    def stream_tiles(self, window):
+        """ Load the chunks of a streamed world overlapping the window (tile
+            size)
+        """
+        if self.world is None:
+            return
+        
+        left, top, width, height = window
+        
+        for chunkX in range(left // self.chunkSize, (left + width - 1) // self.chunkSize + 1):
+            for chunkY in range(top // self.chunkSize, (top + height - 1) // self.chunkSize + 1):
+                self.load_chunk((chunkX, chunkY))
+    
+    def add_listener(self, listener):
+        """ Add a function to be called with the tile window, (left, top, 
+            width, height), of every edit to the tile map.
+        """
+        self.listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        """ Stop calling a function added with add_listener()
+        """
+        if listener in self.listeners:
+            self.listeners.remove(listener)
+    
+    def notify(self, window):
+        """ Tell all the listeners the tiles in the window were edited
+        """
+        # The world file doesn't have these tiles, keep them when unloading
+        left, top, width, height = window
+        chunkSize = self.chunkSize
+        self.editedChunks[left // chunkSize:(left + width - 1) // chunkSize + 1,
+                          top // chunkSize:(top + height - 1) // chunkSize + 1] = True
+        
+        for listener in self.listeners:
+            listener(window)
+
+    def tile_to_chunk(self, location):
+        """ Get the chunk location, (x,y) tuple, of the chunk owning the given
+            tile location.
+        """
+        return (location[0]//self.chunkSize, location[1]//self.chunkSize)
+    
+    def chunk_offset(self, location):
+        """ Get the pixel offset, (x,y) tuple, of the given tile location 
+            within its owning chunk.
+        """
+        return ((location[0] % self.chunkSize) * self.tileSize, 
+                (location[1] % self.chunkSize) * self.tileSize)
+    
+    def chunk_window(self, window):
+        """ Get the window of chunk locations, (left, top, width, height), 
+            covering the given pixel window, constrained to the world map.
+        """
+        chunkCount = self.chunkCount
+        
+        left = max(0, window[0] // self.chunkPixelSize)
+        top = max(0, window[1] // self.chunkPixelSize)
+        right = min(chunkCount[0], (window[0] + window[2] - 1) // self.chunkPixelSize + 1)
+        bottom = min(chunkCount[1], (window[1] + window[3] - 1) // self.chunkPixelSize + 1)
+        
+        return (left, top, max(0, right-left), max(0, bottom-top))
+    
+    def render_chunk(self, chunkLocation):
+        """ Render the tiles of the chunk at the given chunk location onto a 
+            new surface.
+        """
+        chunk = pygame.Surface((self.chunkPixelSize, self.chunkPixelSize), pygame.SRCALPHA, 32)
+        chunk.fill((0,0,0,0))
+        
+        left = chunkLocation[0] * self.chunkSize
+        top = chunkLocation[1] * self.chunkSize
+        
+        chunkGrid = self.grid[left:left+self.chunkSize, top:top+self.chunkSize]
+                
+        xs, ys = numpy.nonzero(chunkGrid)
+        
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            tileType = self.tileTypes[chunkGrid.item(x, y)]
+            chunk.blit(tileType.image, (x * self.tileSize, y * self.tileSize))
+        
+        return chunk
+    
+    def get_chunk(self, chunkLocation):
+        """ Get the rendered chunk at the given chunk location, rendering it 
+            if it is not already cached.
+        """
+        chunk = self.chunks.get(chunkLocation)
+        
+        if chunk is None:
+            self.load_chunk(chunkLocation)
+            chunk = self.chunks.put(chunkLocation, self.render_chunk(chunkLocation))
+        
+        return chunk
+    
+    def draw(self, screen, window, evict=True):
+        """ Draw the tile layer visible in the given pixel window onto the 
+            screen.  Only the chunks overlapping the window are rendered and,
+            unless evict is False, chunks far from the window are evicted.
+        """
+        left, top, width, height = self.chunk_window(window)
+        
+        for chunkX in range(left, left + width):
+            for chunkY in range(top, top + height):
+                chunk = self.get_chunk((chunkX, chunkY))
+                screen.blit(chunk, (chunkX * self.chunkPixelSize - window[0], 
+                                    chunkY * self.chunkPixelSize - window[1]))
+        
+        if evict:
+            self.evict_chunks(window)
+    
+    def evict_chunks(self, window):
+        """ Evict the rendered chunks far from the given pixel window
+        """
+        left, top, width, height = self.chunk_window(window)
+        distance = CHUNK_EVICT_DISTANCE
+        self.chunks.evict_outside((left - distance, top - distance, 
+                                   width + 2*distance, height + 2*distance))
+
+    def load_chunk(self, chunkLocation):
+        """ Load the tiles of the chunk at the given chunk location from the
+            world file into the grid, if they are not loaded yet.  The tiles
+            of an edited chunk that was unloaded are loaded as they were.
+        """
+        chunkX, chunkY = chunkLocation
+        
+        if self.loadedChunks.item(chunkX, chunkY):
+            return
+        
+        with self.loadLock:
+            # Another thread may have loaded it while waiting
+            if self.loadedChunks.item(chunkX, chunkY):
+                return
+            
+            left, top = chunkX * self.chunkSize, chunkY * self.chunkSize
+            width = min(self.chunkSize, self.worldSize[0] - left)
+            height = min(self.chunkSize, self.worldSize[1] - top)
+            
+            tiles = self.unloadedTiles.pop(chunkLocation, None)
+            
+            if tiles is not None:
+                self.grid[left:left+width, top:top+height] = tiles
+            else:
+                tiles = self.world.read_chunk(chunkLocation)
+                
+                if tiles is not None:
+                    self.grid[left:left+width, top:top+height] = self.worldTypeIds[tiles[:width,:height]]
+            
+            # The surface tiles along the edges of the loaded neighbours change too
+            self.update_surface_tiles((left-1, top-1, width+2, height+2))
+            
+            # Only mark the chunk loaded once its tiles are in, a chunk 
+            # rendered before that would stay empty
+            self.loadedChunks[chunkX, chunkY] = True
+            self.streamedChunks.add((chunkX, chunkY))
+    
+    def unload_chunk(self, chunkLocation):
+        """ Remove the tiles of the chunk at the given chunk location from the
+            grid, keeping them aside if the chunk was edited.  Call 
+            free_pages() afterwards to give the memory back.
+        """
+        chunkX, chunkY = chunkLocation
+        
+        with self.loadLock:
+            if not self.loadedChunks.item(chunkX, chunkY):
+                return
+            
+            left, top = chunkX * self.chunkSize, chunkY * self.chunkSize
+            width = min(self.chunkSize, self.worldSize[0] - left)
+            height = min(self.chunkSize, self.worldSize[1] - top)
+            
+            if self.editedChunks.item(chunkX, chunkY):
+                self.unloadedTiles[chunkLocation] = self.grid[left:left+width, top:top+height].copy()
+            
+            # Mark the chunk unloaded first, so its tiles aren't rendered or
+            # saved while they are removed
+            self.loadedChunks[chunkX, chunkY] = False
+            self.streamedChunks.discard((chunkX, chunkY))
+            self.grid[left:left+width, top:top+height] = EMPTY
+            self.update_surface_tiles((left-1, top-1, width+2, height+2))
+            self.chunks.discard(chunkLocation)
+    
+    def unload_chunks(self, window):
+        """ Unload the chunks of a streamed world further than the unload
+            distance, in chunks, outside the pixel window
+        """
+        left, top, width, height = self.chunk_window(window)
+        distance = self.unloadDistance
+        keptChunks = (left - distance, top - distance, width + 2*distance, height + 2*distance)
+        
+        # Nothing to unload until the window crosses into other chunks
+        if keptChunks == self.keptChunks:
+            return
+        
+        self.keptChunks = keptChunks
+        
+        left, top, width, height = keptChunks
+        unloaded = [(x, y) for x, y in self.streamedChunks
+                    if not (left <= x < left + width and top <= y < top + height)]
+        
+        for chunkLocation in unloaded:
+            self.unload_chunk(chunkLocation)
+        
+        for x in sorted(set(x for x, y in unloaded)):
+            self.free_pages(x)
+    
+    def free_pages(self, chunkX):
+        """ Give the memory pages of the grid and the surface mask holding
+            only tiles of unloaded chunks, in and around the column of chunks
+            at chunkX, back to the system.  They read as empty afterwards.
+        """
+        maps = [memoryMap for memoryMap in (self.gridMap, self.surfaceMap) if memoryMap is not None]
+        
+        if not maps:
+            return
+        
+        worldWidth, worldHeight = self.worldSize
+        chunkSize = self.chunkSize
+        pageSize = mmap.PAGESIZE
+        
+        # The pages overlapping the chunk column, which may reach into the
+        # neighbouring columns of tiles.  The grid is stored column by
+        # column, grid[x,y] is at byte x * worldHeight + y.
+        start = chunkX * chunkSize * worldHeight // pageSize * pageSize
+        end = min(worldWidth * worldHeight, -(-min(worldWidth, (chunkX + 1) * chunkSize) * worldHeight // pageSize) * pageSize)
+        firstColumn, lastColumn = start // worldHeight, -(-end // worldHeight)
+        
+        # Which bytes of the pages hold tiles of loaded chunks
+        columnChunks = numpy.arange(firstColumn, lastColumn) // chunkSize
+        loadedRows = numpy.repeat(self.loadedChunks[columnChunks], chunkSize, axis=1)[:, :worldHeight]
+        loaded = loadedRows.ravel()[start - firstColumn * worldHeight:end - firstColumn * worldHeight]
+        
+        pages = -(-len(loaded) // pageSize)
+        loadedPages = numpy.zeros(pages * pageSize, numpy.bool_)
+        loadedPages[:len(loaded)] = loaded
+        free = ~loadedPages.reshape((pages, pageSize)).any(axis=1)
+        
+        # Runs of free pages, as (first page, end page)
+        edges = numpy.flatnonzero(numpy.diff(numpy.concatenate(([False], free, [False]))))
+        
+        for first, last in zip(edges[::2].tolist(), edges[1::2].tolist()):
+            offset = start + first * pageSize
+            length = min(end, start + last * pageSize) - offset
+            
+            for memoryMap in maps:
+                memoryMap.madvise(mmap.MADV_DONTNEED, offset, length)
+    
+    def is_loaded(self, location):
+        """ Check if the tiles around the given world pixel location are 
+            loaded
+        """
+        chunkX = location[0] // self.chunkPixelSize
+        chunkY = location[1] // self.chunkPixelSize
+        
+        if chunkX < 0 or chunkY < 0 or chunkX >= self.chunkCount[0] or chunkY >= self.chunkCount[1]:
+            return True
+        
+        return self.loadedChunks.item(chunkX, chunkY)
+    
+    def stream(self, window):
+        """ Load the chunks of a streamed world in the given pixel window,
+            and ahead of the window in the direction it moved since the last
+            call
+        """
+        if self.world is None:
+            return
+        
+        left, top, width, height = self.chunk_window(window)
+        
+        if self.streamWindow is not None:
+            # Extend the window in the direction of travel
+            distance = CHUNK_PREFETCH_DISTANCE
+            dx = window[0] - self.streamWindow[0]
+            dy = window[1] - self.streamWindow[1]
+            
+            if dx < 0:
+                left, width = left - distance, width + distance
+            elif dx > 0:
+                width += distance
+            
+            if dy < 0:
+                top, height = top - distance, height + distance
+            elif dy > 0:
+                height += distance
+        
+        self.streamWindow = tuple(window)
+        
+        right = min(self.chunkCount[0], left + width)
+        bottom = min(self.chunkCount[1], top + height)
+        left, top = max(0, left), max(0, top)
+        
+        # Only look at the chunks that still have to be loaded
+        xs, ys = numpy.nonzero(~self.loadedChunks[left:right, top:bottom])
+        
+        for x, y in zip(xs.tolist(), ys.tolist()):
+            self.load_chunk((left + x, top + y))
+        
+        self.unload_chunks(window)
 
     def get_tiles(self, window=(0,0,0,0)):
         """ Get all the tiles in the specified window.  The window is tile size. 
         """
-        results = []
         
-        # Loop through all the tiles in the window
-        for x in range(window[0],window[0]+window[2]+1):
-            for y in range(window[1],window[1]+window[3]+1):
-                tile = self.tiles[x][y]
+        # The window includes its right and bottom edges.  Constrain it to
+        # within the tile map.
+        left = max(0, window[0])
+        top = max(0, window[1])
+        right = min(self.worldSize[0], window[0]+window[2]+1)
+        bottom = min(self.worldSize[1], window[1]+window[3]+1)
                 
-                if tile == None:
-                    continue
-                else:
-                    results.append(tile)
+        if right <= left or bottom <= top:
+            return []
                     
-        return results
+        windowGrid = self.grid[left:right, top:bottom]
+        xs, ys = numpy.nonzero(windowGrid)
+
+        return [Tile(self.tileTypes[windowGrid.item(x, y)], (left+x, top+y), self.tileSize)
+                for x, y in zip(xs.tolist(), ys.tolist())]
     
     def get_tiles_pixel(self, window=(0,0,0,0)):
         """ Get all the tiles in the specified window.  The window is pixel 
@@ -111,61 +718,216 @@ class TileEngine(object):
         window = tuple(x/self.tileSize for x in window)
         return self.get_tiles(window)
     
+    def sweep(self, rect, dx, dy):
+        """ Move the rect, (left, top, width, height) in pixels, by (dx, dy) 
+            through the tile map, first horizontally and then vertically, 
+            stopping against the first solid tile in each direction.  Only the
+            tiles the rect crosses are checked.
+            
+            Returns (left, top, contactX, contactY) where left and top are the
+            resolved position and each contact is 1 or -1 for the direction 
+            of the solid tile that stopped the movement or 0 if there was no
+            contact. 
+        """
+        left, top, width, height = rect
+        
+        left, contactX = self.sweep_horizontal(left, top, width, height, dx)
+        top, contactY = self.sweep_vertical(left, top, width, height, dy)
+        
+        return (left, top, contactX, contactY)
+    
+    def sweep_horizontal(self, left, top, width, height, dx):
+        """ Move the rect horizontally by dx, stopping against the first solid
+            tile.  Returns (left, contact).
+        """
+        return sweep_horizontal(self.grid, self.solidTypes, self.tileSize, left, top, width, height, dx)
+    
+    def sweep_vertical(self, left, top, width, height, dy):
+        """ Move the rect vertically by dy, stopping against the first solid
+            tile.  Returns (top, contact).
+        """
+        return sweep_vertical(self.grid, self.solidTypes, self.tileSize, left, top, width, height, dy)
+    
     def get_surface_tiles(self, window=(0,0,0,0)):
         """ Get all surface tiles in the specified window.  The window is tile 
             size. Surface tiles are tiles that have at least one empty adjacent
             tile. 
         """
-        results = []
+        left = max(0, window[0])
+        top = max(0, window[1])
+        windowMask = self.surfaceMask[left:window[0]+window[2], top:window[1]+window[3]]
+        xs, ys = numpy.nonzero(windowMask)
         
-        # Loop through all the tiles in the window
-        for x in range(window[0],window[0]+window[2]):
-            for y in range(window[1],window[1]+window[3]):
-                tile = self.tiles[x][y]
+        return [Tile(self.tileTypes[self.grid.item(left+x, top+y)], (left+x, top+y), self.tileSize)
+                for x, y in zip(xs.tolist(), ys.tolist())]
                 
-                if tile == None:
-                    continue
-                
-                # Check the adjacent tiles to determine if this is a 
-                # surface tile
-                # Locations to check (up, down, left and right) constrained
-                # to within the tile map
-                checks = [(x,max(0,y-1)),
-                          (x,min(len(self.tiles[x])-1,y+1)),
-                          (max(0,x-1),y),
-                          (min(len(self.tiles)-1,x+1),y)]
+    def is_surface_tile(self, location):
+        """ Check if there is a surface tile at the given tile location
+        """
+        return self.surfaceMask.item(location[0], location[1])
                 
-                for check in checks:
-                    checkTile = self.get_tile((check[0],check[1]))
-                    if(checkTile == None):
-                        # Found adjacent empty tile, this is a surface tile
-                        results.append(tile)
-                        break
+    def update_surface_tiles(self, window=None):
+        """ Recompute which tiles are surface tiles in the specified window.  
+            The window is tile size.  The whole tile map is recomputed if no
+            window is given.
+        """
+        width, height = self.worldSize
                     
-        return results
+        if window is None:
+            window = (0, 0, width, height)
+        
+        left = max(0, window[0])
+        top = max(0, window[1])
+        right = min(width, window[0]+window[2])
+        bottom = min(height, window[1]+window[3])
+        
+        if right <= left or bottom <= top:
+            return
+        
+        # Include the neighbours of the window.  Locations outside the tile 
+        # map are never empty, so tiles along the map edge are not surface 
+        # tiles because of the edge.
+        outerLeft, outerTop = max(0, left-1), max(0, top-1)
+        outerRight, outerBottom = min(width, right+1), min(height, bottom+1)
+        
+        empty = numpy.zeros((outerRight-outerLeft+2, outerBottom-outerTop+2), numpy.bool_)
+        empty[1:-1,1:-1] = self.grid[outerLeft:outerRight, outerTop:outerBottom] == EMPTY
+        
+        # A tile is a surface tile if any of the adjacent tiles (left, right,
+        # up and down) is empty
+        adjacentEmpty = empty[:-2,1:-1] | empty[2:,1:-1] | empty[1:-1,:-2] | empty[1:-1,2:]
+        surface = adjacentEmpty & ~empty[1:-1,1:-1]
+        
+        self.surfaceMask[left:right, top:bottom] = surface[left-outerLeft:right-outerLeft,
+                                                           top-outerTop:bottom-outerTop]
     
 
-class Tile(pygame.sprite.Sprite):
-    def __init__(self, image=None, color=(128, 128, 128), initial_position=(0,0), size=(32,32)):
-        # All sprite classes should extend pygame.sprite.Sprite. This
-        # gives you several important internal methods that you probably
-        # don't need or want to write yourself. Even if you do rewrite
-        # the internal methods, you should extend Sprite, so things like
-        # isinstance(obj, pygame.sprite.Sprite) return true on it.
-        pygame.sprite.Sprite.__init__(self)
+class TileType(object):
+    """ Type of tile.  Holds the image and properties shared by every tile of
+        this type.
+    """
+
+    def __init__(self, name, image=None, color=(128, 128, 128), solid=True, size=(32,32)):
+        self.id = None
+        self.name = name
+        self.solid = solid
       
         if image:
-            self.image = pygame.image.load(image)
-            self.image.convert()
-            self.image.set_alpha(255)
+            self.image = assets.load_image(image, CONVERT_ALPHA)
         else:
             self.image = pygame.Surface(size)
             self.image.fill(color)
             self.image.set_alpha(255)
         
-        # Make our top-left corner the passed-in location.
-        self.rect = self.image.get_rect()
-        self.rect.topleft = initial_position
 
-    def update(self, current_time):
-        pass
+class Tile(object):
+    """ A tile at a tile location.  Tiles are not stored by the tile engine,
+        they are created from the tile grid when requested.
+    """
+
+    def __init__(self, tileType, location, tileSize=32):
+        self.tileType = tileType
+        self.location = location
+        self.rect = pygame.Rect(location[0]*tileSize, location[1]*tileSize, tileSize, tileSize)
+
+    @property
+    def image(self):
+        return self.tileType.image
+
+
+def allocate_pages(shape, dtype):
+    """ Get a zeroed array on a memory map of its own, whose pages can be
+        given back to the system.  Returns the array and the memory map, or
+        a plain array and None where pages can't be given back.
+    """
+    size = int(numpy.prod(shape)) * numpy.dtype(dtype).itemsize
+    
+    if not size or not hasattr(mmap.mmap, 'madvise'):
+        return numpy.zeros(shape, dtype), None
+    
+    memoryMap = mmap.mmap(-1, size, flags=mmap.MAP_PRIVATE | mmap.MAP_ANONYMOUS)
+    
+    return numpy.frombuffer(memoryMap, dtype).reshape(shape), memoryMap
+
+def sweep_horizontal(grid, solidTypes, tileSize, left, top, width, height, dx):
+    """ Move the rect horizontally by dx, stopping against the first solid
+        tile.  Returns (left, contact).  The grid is indexed grid[x,y] and
+        solidTypes tells which tile type ids are solid.
+    """
+    if dx == 0:
+        return (left, 0)
+    
+    firstRow = top // tileSize
+    lastRow = (top + height - 1) // tileSize
+    
+    if dx > 0:
+        # Check the columns entered by the right edge, left to right
+        column = (left + width - 1) // tileSize + 1
+        lastColumn = (left + width - 1 + dx) // tileSize
+        step = 1
+    else:
+        # Check the columns entered by the left edge, right to left
+        column = left // tileSize - 1
+        lastColumn = (left + dx) // tileSize
+        step = -1
+    
+    worldWidth, worldHeight = grid.shape
+    
+    while column * step <= lastColumn * step:
+        # Locations outside the tile map are solid
+        solid = column < 0 or column >= worldWidth
+        row = firstRow
+        
+        while not solid and row <= lastRow:
+            solid = row < 0 or row >= worldHeight or solidTypes[grid.item(column, row)]
+            row += 1
+        
+        if solid and step > 0:
+            return (column * tileSize - width, 1)
+        elif solid:
+            return ((column + 1) * tileSize, -1)
+        
+        column += step
+    
+    return (left + dx, 0)
+
+def sweep_vertical(grid, solidTypes, tileSize, left, top, width, height, dy):
+    """ Move the rect vertically by dy, stopping against the first solid
+        tile.  Returns (top, contact), refer to sweep_horizontal().
+    """
+    if dy == 0:
+        return (top, 0)
+    
+    firstColumn = left // tileSize
+    lastColumn = (left + width - 1) // tileSize
+    
+    if dy > 0:
+        # Check the rows entered by the bottom edge, top to bottom
+        row = (top + height - 1) // tileSize + 1
+        lastRow = (top + height - 1 + dy) // tileSize
+        step = 1
+    else:
+        # Check the rows entered by the top edge, bottom to top
+        row = top // tileSize - 1
+        lastRow = (top + dy) // tileSize
+        step = -1
+    
+    worldWidth, worldHeight = grid.shape
+    
+    while row * step <= lastRow * step:
+        # Locations outside the tile map are solid
+        solid = row < 0 or row >= worldHeight
+        column = firstColumn
+        
+        while not solid and column <= lastColumn:
+            solid = column < 0 or column >= worldWidth or solidTypes[grid.item(column, row)]
+            column += 1
+        
+        if solid and step > 0:
+            return (row * tileSize - height, 1)
+        elif solid:
+            return ((row + 1) * tileSize, -1)
+        
+        row += step
+    
+    return (top + dy, 0)
@@ -0,0 +1,229 @@
+import csv
+import json
+import sys
+import threading
+from collections import deque
+from time import time
+
+# Number of samples kept per scope for the rolling statistics
+SAMPLE_WINDOW = 300
+
+# Name of the frame scope, the time from one frame to the next
+FRAME = 'frame'
+
+class Timings(object):
+    """ Registry of named timing scopes.  Subsystems register a scope once and
+        time their work with it every frame.  Rolling percentiles are kept for
+        every scope, both per use and per frame (the total of all uses within
+        a frame), and a recording session can be exported as a Chrome trace
+        (chrome://tracing) or CSV.
+
+        When the registry is disabled scopes do nothing but check the flag.
+    """
+
+    def __init__(self, enabled=True, window=SAMPLE_WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.scopes = {}
+
+        self.frame = 0
+        self.frameStart = None
+        self.frameTimes = deque(maxlen=window)
+
+        # Trace events, (name, start, duration, frame), of the recording
+        # session
+        self.recording = False
+        self.recordStart = 0
+        self.events = []
+
+        # Whether timings were enabled before the recording session, which
+        # always takes timings
+        self.enabledBeforeRecording = enabled
+
+        # Held while adding a sample, scopes may be used from more than one
+        # thread
+        self.lock = threading.Lock()
+
+    def register(self, name):
+        """ Get the timing scope with the given name, creating it if needed
+        """
+        scope = self.scopes.get(name)
+
+        if scope is None:
+            scope = self.scopes[name] = TimingScope(self, name)
+
+        return scope
+
+    def begin_frame(self):
+        """ Mark the start of a new frame
+        """
+        if not self.enabled:
+            self.frameStart = None
+            return
+
+        now = time()
+
+        if self.frameStart is not None:
+            self.frameTimes.append(now - self.frameStart)
+
+            if self.recording:
+                self.events.append((FRAME, self.frameStart, now - self.frameStart, self.frame))
+
+        for scope in self.scopes.values():
+            scope.end_frame()
+
+        self.frame += 1
+        self.frameStart = now
+
+    def start_recording(self):
+        """ Start a new recording session of trace events
+        """
+        self.events = []
+        self.recordStart = time()
+        self.recording = True
+
+        self.enabledBeforeRecording = self.enabled
+        self.enabled = True
+
+    def stop_recording(self):
+        self.recording = False
+        self.enabled = self.enabledBeforeRecording
+
+    def last(self, name):
+        """ Get the last time of the named scope in seconds
+        """
+        scope = self.scopes.get(name)
+
+        if scope is None or not scope.samples:
+            return 0.0
+
+        return scope.samples[-1]
+
+    def stats(self, name, perFrame=False):
+        """ Get the rolling statistics of the named scope as a dictionary of
+            p50, p95, p99 and max times in seconds.  The frame statistics
+            are returned for FRAME.
+        """
+        if name == FRAME:
+            samples = self.frameTimes
+        elif name in self.scopes and perFrame:
+            samples = self.scopes[name].frameSamples
+        elif name in self.scopes:
+            samples = self.scopes[name].samples
+        else:
+            samples = ()
+
+        return percentiles(samples)
+
+    def export_chrome_trace(self, filename):
+        """ Write the recorded trace events in the Chrome trace event format
+        """
+        traceEvents = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                        'ts': (start - self.recordStart) * 1000000.0,
+                        'dur': duration * 1000000.0,
+                        'args': {'frame': frame}}
+                       for name, start, duration, frame in self.events]
+
+        with open(filename, 'w') as traceFile:
+            json.dump({'traceEvents': traceEvents, 'displayTimeUnit': 'ms'}, traceFile)
+
+    def export_csv(self, filename):
+        """ Write the recorded trace events as CSV, one row per event
+        """
+        # The csv module wants binary files on Python 2 and files without
+        # newline translation on Python 3
+        if sys.version_info[0] < 3:
+            csvFile = open(filename, 'wb')
+        else:
+            csvFile = open(filename, 'w', newline='')
+
+        with csvFile:
+            writer = csv.writer(csvFile)
+            writer.writerow(['frame', 'scope', 'start_ms', 'duration_ms'])
+
+            for name, start, duration, frame in self.events:
+                writer.writerow([frame, name, '%.3f' % ((start - self.recordStart) * 1000.0), '%.3f' % (duration * 1000.0)])
+
+
+class TimingScope(object):
+    """ Named timing scope.  Use it as a context manager around the work to be
+        timed.  Scopes can be nested and used from several threads at once,
+        the start times are kept on a stack per thread.
+    """
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+        self.local = threading.local()
+
+        self.total = 0.0
+        self.count = 0
+        self.frameTotal = 0.0
+        self.samples = deque(maxlen=timings.window)
+        self.frameSamples = deque(maxlen=timings.window)
+
+    def starts(self):
+        """ Get the stack of start times of this thread
+        """
+        starts = getattr(self.local, 'starts', None)
+
+        if starts is None:
+            starts = self.local.starts = []
+
+        return starts
+
+    def __enter__(self):
+        if self.timings.enabled:
+            self.starts().append(time())
+
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if not self.timings.enabled:
+            return False
+
+        # The stack is empty when timings were enabled after the scope was
+        # entered
+        starts = getattr(self.local, 'starts', None)
+
+        if not starts:
+            return False
+
+        start = starts.pop()
+
+        duration = time() - start
+        timings = self.timings
+
+        with timings.lock:
+            self.total += duration
+            self.count += 1
+            self.frameTotal += duration
+            self.samples.append(duration)
+
+            if timings.recording:
+                timings.events.append((self.name, start, duration, timings.frame))
+
+        return False
+
+    def end_frame(self):
+        """ Record the total time of this scope in the frame that just ended
+        """
+        with self.timings.lock:
+            self.frameSamples.append(self.frameTotal)
+            self.frameTotal = 0.0
+
+
+def percentiles(samples):
+    """ Get the p50, p95, p99 and max of the samples as a dictionary
+    """
+    ordered = sorted(samples)
+
+    if not ordered:
+        return {'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+
+    last = len(ordered) - 1
+
+    return {'p50': ordered[int(last * 0.50)],
+            'p95': ordered[int(last * 0.95)],
+            'p99': ordered[int(last * 0.99)],
+            'max': ordered[last]}
@@ -0,0 +1,75 @@
+import pygame
+
+class Panel(object):
+    """ Retained-mode UI panel.  The panel is composed into one cached
+        surface that is only composed again once invalidated, when something
+        on it changes, so drawing an unchanged panel is a single blit.
+        Subclasses compose the panel in compose().
+    """
+
+    def __init__(self, surfaceSize=(1,1), alpha=None, colorkey=None):
+        self.surfaceSize = surfaceSize
+        self.alpha = alpha
+        self.colorkey = colorkey
+
+        self.surface = None
+
+        # Whether the panel looks different since it was last drawn
+        self.dirty = True
+
+    def invalidate(self):
+        self.dirty = True
+
+    def resize(self, surfaceSize):
+        if surfaceSize != self.surfaceSize:
+            self.surfaceSize = surfaceSize
+            self.surface = None
+            self.dirty = True
+
+    def compose(self, surface):
+        """ Draw the panel onto its cached surface
+        """
+        pass
+
+    def get_surface(self):
+        """ Get the composed surface of the panel, composing it again if it
+            was invalidated
+        """
+        if self.surface is None:
+            if self.colorkey is None:
+                # Transparent where nothing is drawn
+                self.surface = pygame.Surface(self.surfaceSize, pygame.SRCALPHA, 32)
+            else:
+                # Transparent where the color key is drawn, with the panel
+                # alpha applied to the rest
+                self.surface = pygame.Surface(self.surfaceSize)
+                self.surface.set_colorkey(self.colorkey)
+
+                if self.alpha is not None:
+                    self.surface.set_alpha(self.alpha)
+
+            self.dirty = True
+
+        if self.dirty:
+            self.surface.fill(self.colorkey if self.colorkey is not None else (0,0,0,0))
+            self.compose(self.surface)
+            self.dirty = False
+
+        return self.surface
+
+    def draw(self, screen, position):
+        screen.blit(self.get_surface(), position)
+
+
+def grid_index(position, origin, cellSize, spacing, columns):
+    """ Get the index of the cell of a grid at the position, or None if the
+        position isn't on a cell.  Cells are laid out in rows of the given
+        number of columns from the origin, spacing pixels apart.
+    """
+    column, offsetX = divmod(position[0] - origin[0], cellSize[0] + spacing)
+    row, offsetY = divmod(position[1] - origin[1], cellSize[1] + spacing)
+
+    if column < 0 or column >= columns or row < 0 or offsetX >= cellSize[0] or offsetY >= cellSize[1]:
+        return None
+
+    return row * columns + column
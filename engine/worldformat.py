@@ -0,0 +1,173 @@
+""" Chunked binary world format.  A world file is laid out as
+
+    header       HEADER_SIZE bytes: magic, version, flags, world width and
+                 height in tiles, chunk size in tiles, the number of tile
+                 types and the generation of the world
+    type names   TYPE_NAME_SIZE bytes per tile type id, the null padded name
+                 of the tile type, the empty tile (id 0) has no name
+    chunk index  the file offset and length of every chunk, ordered by chunk
+                 x then y, offset 0 for a chunk without any tiles
+    chunks       chunk size x chunk size tile type ids per stored chunk,
+                 indexed [x,y], zlib compressed if the COMPRESSED flag is set
+
+    Chunks along the right and bottom edge of the world are stored full size.
+    The generation is increased every time a saved world is rewritten, refer
+    to engine.worldstore.
+    The file is memory mapped so opening a world takes the same time whatever
+    its size and chunks are only read when they are needed.
+
+    Convert a PNG tile map to a world file with
+
+    python -m engine.worldformat images/worldmap1.png worldmap1.world
+"""
+import argparse
+import mmap
+import struct
+import zlib
+import numpy
+
+# File name extension of world files
+WORLD_EXTENSION = '.world'
+
+MAGIC = b'SQWD'
+VERSION = 2
+HEADER = struct.Struct('<4sHHIIHHI')
+HEADER_SIZE = 32
+TYPE_NAME_SIZE = 32
+INDEX_DTYPE = numpy.dtype([('offset', '<u8'), ('length', '<u4')])
+
+# Header flags
+COMPRESSED = 1
+
+class WorldFile(object):
+    """ Memory mapped world file
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.file = open(filename, 'rb')
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.flags, width, height, self.chunkSize, typeCount, self.generation = HEADER.unpack_from(self.map, 0)
+
+        if magic != MAGIC or version != VERSION:
+            raise Exception("%s is not a version %d world file" % (filename, VERSION))
+
+        self.worldSize = (width, height)
+        self.chunkCount = (-(-width // self.chunkSize), -(-height // self.chunkSize))
+
+        offset = HEADER_SIZE
+        self.typeNames = []
+        for _ in range(typeCount):
+            name = self.map[offset:offset+TYPE_NAME_SIZE].rstrip(b'\0')
+            self.typeNames.append(name.decode('utf-8'))
+            offset += TYPE_NAME_SIZE
+
+        self.index = numpy.frombuffer(self.map, INDEX_DTYPE, self.chunkCount[0] * self.chunkCount[1],
+                                      offset).reshape(self.chunkCount)
+
+    def read_chunk(self, chunkLocation):
+        """ Get the tile type ids of the chunk at the chunk location as a read
+            only array backed by the file, or None if the chunk has no tiles
+        """
+        offset, length = self.index.item(chunkLocation[0], chunkLocation[1])
+
+        if offset == 0:
+            return None
+
+        if self.flags & COMPRESSED:
+            tiles = numpy.frombuffer(zlib.decompress(self.map[offset:offset+length]), numpy.uint8)
+        else:
+            tiles = numpy.frombuffer(self.map, numpy.uint8, length, offset)
+
+        return tiles.reshape((self.chunkSize, self.chunkSize))
+
+    def close(self):
+        self.index = None
+        self.map.close()
+        self.file.close()
+
+
+def write_world(filename, worldSize, chunkSize, typeNames, read_chunk, flags=0, generation=0):
+    """ Write a world file.  The type names are the names of the tile type
+        ids, starting with the empty tile.  The tiles of each chunk are
+        given by the read_chunk function, called with the chunk location and
+        returning an array of tile type ids indexed [x,y] or None for a chunk
+        without any tiles.  Chunks without any tiles are not stored.
+    """
+    width, height = worldSize
+    chunkCount = (-(-width // chunkSize), -(-height // chunkSize))
+
+    index = numpy.zeros(chunkCount, INDEX_DTYPE)
+    offset = HEADER_SIZE + TYPE_NAME_SIZE * len(typeNames) + index.nbytes
+
+    with open(filename, 'wb') as worldFile:
+        worldFile.write(HEADER.pack(MAGIC, VERSION, flags, width, height, chunkSize, len(typeNames),
+                                    generation).ljust(HEADER_SIZE, b'\0'))
+
+        for name in typeNames:
+            worldFile.write(name.encode('utf-8')[:TYPE_NAME_SIZE].ljust(TYPE_NAME_SIZE, b'\0'))
+
+        # The index is written once all the chunks are
+        worldFile.seek(offset)
+
+        for chunkX in range(chunkCount[0]):
+            for chunkY in range(chunkCount[1]):
+                tiles = read_chunk((chunkX, chunkY))
+
+                if tiles is None or not tiles.any():
+                    continue
+
+                chunk = numpy.zeros((chunkSize, chunkSize), numpy.uint8)
+                chunk[:tiles.shape[0], :tiles.shape[1]] = tiles
+
+                data = zlib.compress(chunk) if flags & COMPRESSED else chunk
+                length = len(data) if flags & COMPRESSED else chunk.nbytes
+
+                worldFile.write(data)
+                index[chunkX, chunkY] = (offset, length)
+                offset += length
+
+        worldFile.seek(HEADER_SIZE + TYPE_NAME_SIZE * len(typeNames))
+        index.tofile(worldFile)
+
+def grid_chunks(grid, chunkSize):
+    """ Get a function reading the chunks of a grid of tile type ids, for
+        write_world()
+    """
+    def read_chunk(chunkLocation):
+        left, top = chunkLocation[0] * chunkSize, chunkLocation[1] * chunkSize
+        return grid[left:left+chunkSize, top:top+chunkSize]
+
+    return read_chunk
+
+def convert_map(mapFilename, worldFilename, chunkSize):
+    """ Convert a PNG tile map, where the pixel color maps to the tile type,
+        to a world file
+    """
+    import pygame
+    from engine.tileengine import MAP_COLORS
+
+    red = pygame.surfarray.array3d(pygame.image.load(mapFilename))[:,:,0]
+    grid = numpy.zeros(red.shape, numpy.uint8)
+    typeNames = [u'']
+
+    for value, name in sorted(MAP_COLORS.items()):
+        grid[red == value] = len(typeNames)
+        typeNames.append(name)
+
+    write_world(worldFilename, grid.shape, chunkSize, typeNames, grid_chunks(grid, chunkSize))
+
+def main():
+    from engine.tileengine import CHUNK_SIZE
+
+    parser = argparse.ArgumentParser(description="Convert a PNG tile map to a world file")
+    parser.add_argument('map', help="PNG tile map to convert")
+    parser.add_argument('world', help="world file to write")
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help="size of a chunk in tiles")
+    args = parser.parse_args()
+
+    convert_map(args.map, args.world, args.chunk_size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+import atexit
+import os
+import struct
+import threading
+import numpy
+from engine.tileengine import TileEngine, EMPTY
+from engine.worldformat import WorldFile, write_world, WORLD_EXTENSION, COMPRESSED
+
+# File name extension of tile edit journals
+JOURNAL_EXTENSION = '.journal'
+
+# Journals bigger than this many bytes are compacted into the snapshot when
+# the world is loaded
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+
+# Number of seconds between journal flushes
+JOURNAL_FLUSH_INTERVAL = 1.0
+
+JOURNAL_MAGIC = b'SQWJ'
+JOURNAL_VERSION = 1
+JOURNAL_HEADER = struct.Struct('<4sHI')
+
+# Record of a tile edit: the tile window (left, top, width, height), followed
+# by the tile type ids of the window indexed [x,y]
+JOURNAL_RECORD = struct.Struct('<iiHH')
+
+class WorldStore(object):
+    """ Saved world, a snapshot of the tile grid and a journal of the tile
+        edits made since the snapshot was written.
+
+        The snapshot is a compressed world file (refer to engine.worldformat)
+        that is streamed when loaded.  Every tile edit is appended to the
+        journal by a background thread, in batches, so saving only costs the
+        edits made since the last checkpoint.  Loading replays the journal
+        onto the snapshot, and once the journal is bigger than the compact
+        size it is folded into a new snapshot.  Snapshot and journal carry a
+        generation number so a journal is never replayed onto a snapshot it
+        wasn't written for.
+    """
+
+    def __init__(self, basename, compactSize=JOURNAL_COMPACT_SIZE):
+        self.snapshotFile = basename + WORLD_EXTENSION
+        self.journalFile = basename + JOURNAL_EXTENSION
+        self.compactSize = compactSize
+
+        self.tileengine = None
+        self.journal = None
+
+        atexit.register(self.close)
+
+    def exists(self):
+        return os.path.exists(self.snapshotFile)
+
+    def load(self, tileSize):
+        """ Load the saved world.  Returns the tile engine, attached to the
+            store so its edits are journaled.
+        """
+        self.close()
+
+        tileengine = TileEngine.fromworldfile(self.snapshotFile, tileSize)
+        generation = tileengine.world.generation
+
+        journalSize = 0
+        if os.path.exists(self.journalFile):
+            journalSize = self.replay(tileengine, generation)
+
+        self.attach(tileengine, generation, journalSize)
+
+        if journalSize > self.compactSize:
+            self.checkpoint()
+
+        return tileengine
+
+    def create(self, tileengine):
+        """ Save the tile engine's world as a new saved world, attaching it to
+            the store
+        """
+        self.close()
+        self.write_snapshot(tileengine, 0)
+
+        if os.path.exists(self.journalFile):
+            os.remove(self.journalFile)
+
+        self.attach(tileengine, 0)
+
+    def attach(self, tileengine, generation, journalSize=None):
+        """ Start journaling the tile edits of the tile engine.  The journal
+            is cut to the given size first, dropping any record torn by a
+            crash, so new records aren't appended after its bytes.  A tile
+            engine attached before is detached.
+        """
+        self.close()
+
+        if journalSize is not None and os.path.exists(self.journalFile):
+            if os.path.getsize(self.journalFile) > journalSize:
+                with open(self.journalFile, 'r+b') as journalFile:
+                    journalFile.truncate(journalSize)
+
+        self.tileengine = tileengine
+        self.journal = Journal(self.journalFile, generation)
+
+        tileengine.add_listener(self.tiles_edited)
+
+    def tiles_edited(self, window):
+        """ Journal the tile edit
+        """
+        left, top, width, height = window
+        tiles = self.tileengine.grid[left:left+width, top:top+height]
+
+        self.journal.append(JOURNAL_RECORD.pack(left, top, tiles.shape[0], tiles.shape[1]), tiles.copy())
+
+    def replay(self, tileengine, generation):
+        """ Apply the journaled tile edits to the tile engine.  Returns the
+            size of the journal in bytes up to the end of its last complete
+            record.
+        """
+        with open(self.journalFile, 'rb') as journalFile:
+            data = journalFile.read()
+
+        if len(data) < JOURNAL_HEADER.size:
+            return 0
+
+        magic, version, journalGeneration = JOURNAL_HEADER.unpack_from(data, 0)
+
+        # The journal of an older snapshot was already folded into this one
+        if magic != JOURNAL_MAGIC or version != JOURNAL_VERSION or journalGeneration != generation:
+            os.remove(self.journalFile)
+            return 0
+
+        typeIds = tileengine.worldTypeIds
+        offset = JOURNAL_HEADER.size
+
+        while offset + JOURNAL_RECORD.size <= len(data):
+            left, top, width, height = JOURNAL_RECORD.unpack_from(data, offset)
+            end = offset + JOURNAL_RECORD.size + width * height
+
+            # A record cut short by a crash ends the journal
+            if end > len(data):
+                break
+
+            tiles = numpy.frombuffer(data, numpy.uint8, width * height, offset + JOURNAL_RECORD.size)
+            offset = end
+
+            tileengine.set_tiles((left, top, width, height), typeIds[tiles.reshape((width, height))])
+
+        return offset
+
+    def save(self):
+        """ Write the journaled edits that haven't been written yet
+        """
+        if self.journal:
+            self.journal.flush()
+
+    def checkpoint(self):
+        """ Fold the journal into a new snapshot and start an empty journal
+        """
+        tileengine = self.tileengine
+        generation = self.journal.generation + 1
+
+        self.journal.close()
+        self.write_snapshot(tileengine, generation)
+
+        os.remove(self.journalFile)
+        self.journal = Journal(self.journalFile, generation)
+
+    def write_snapshot(self, tileengine, generation):
+        """ Write the tile engine's world as the snapshot.  Chunks of a
+            streamed world that aren't loaded are copied from its world file,
+            or from the tiles kept of the edited ones.
+        """
+        chunkSize = tileengine.chunkSize
+        world = tileengine.world
+        typeNames = [u''] + [tileType.name for tileType in tileengine.tileTypes[1:]]
+
+        def read_chunk(chunkLocation):
+            with tileengine.loadLock:
+                if tileengine.loadedChunks.item(chunkLocation[0], chunkLocation[1]):
+                    left, top = chunkLocation[0] * chunkSize, chunkLocation[1] * chunkSize
+                    return tileengine.grid[left:left+chunkSize, top:top+chunkSize].copy()
+
+                # Edited chunks that were unloaded again
+                tiles = tileengine.unloadedTiles.get(chunkLocation)
+
+                if tiles is not None:
+                    return tiles
+
+            tiles = world.read_chunk(chunkLocation)
+            return None if tiles is None else tileengine.worldTypeIds[tiles]
+
+        temporaryFile = self.snapshotFile + '.tmp'
+        write_world(temporaryFile, tileengine.worldSize, chunkSize, typeNames, read_chunk, COMPRESSED, generation)
+
+        # Switch a streamed world over to the new snapshot
+        if world is not None:
+            world.close()
+
+        # Renaming over an existing file replaces it atomically, except on
+        # Windows where it fails
+        if os.name == 'nt' and os.path.exists(self.snapshotFile):
+            os.remove(self.snapshotFile)
+        os.rename(temporaryFile, self.snapshotFile)
+
+        if world is not None:
+            tileengine.open_world(WorldFile(self.snapshotFile))
+
+    def close(self):
+        """ Write the remaining journaled edits and stop journaling
+        """
+        if self.tileengine is not None:
+            self.tileengine.remove_listener(self.tiles_edited)
+
+        if self.journal:
+            self.journal.close()
+            self.journal = None
+
+
+class Journal(object):
+    """ Append-only file of tile edit records.  Records are queued by the game
+        and written in batches by a background thread every
+        JOURNAL_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self, filename, generation):
+        self.filename = filename
+        self.generation = generation
+        new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self.file = open(filename, 'ab')
+
+        if new:
+            self.file.write(JOURNAL_HEADER.pack(JOURNAL_MAGIC, JOURNAL_VERSION, generation))
+            self.file.flush()
+
+        self.pending = []
+        self.condition = threading.Condition()
+        self.writeLock = threading.Lock()
+        self.closed = False
+
+        self.writer = threading.Thread(target=self.run, name='journal')
+        self.writer.daemon = True
+        self.writer.start()
+
+    def append(self, header, tiles):
+        """ Queue a record to be written
+        """
+        with self.condition:
+            self.pending.append((header, tiles))
+
+    def run(self):
+        while True:
+            with self.condition:
+                if not self.closed:
+                    self.condition.wait(JOURNAL_FLUSH_INTERVAL)
+
+                if self.closed:
+                    return
+
+            self.flush()
+
+    def flush(self):
+        """ Write the queued records
+        """
+        with self.writeLock:
+            # Don't keep the game waiting to queue records while writing
+            with self.condition:
+                pending, self.pending = self.pending, []
+
+            for header, tiles in pending:
+                self.file.write(header)
+                self.file.write(tiles)
+
+            if pending:
+                self.file.flush()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+        self.writer.join()
+        self.flush()
+        self.file.close()
@@ -0,0 +1,61 @@
+import pygame
+from engine.assets import assets, CONVERT_ALPHA
+
+# Animation states
+STANDING = 0
+WALKING = 1
+
+# Facing directions.  Left facing frames are the right facing frames flipped.
+RIGHT = 0
+LEFT = 1
+
+class FrameTable(object):
+    """ Frames of a sprite sheet, sliced and flipped once and shared by every
+        sprite animated from the sheet.  The frames are stored in one flat
+        list ordered by state, direction and frame, so a sprite only has to
+        keep the index of its current frame.
+    """
+
+    def __init__(self, sheet, frameSize, states):
+        """ The states map each animation state to the columns of its frames
+            in the sprite sheet
+        """
+        self.frameSize = frameSize
+        self.frames = []
+        self.offsets = {}
+        self.lengths = {}
+
+        width, height = frameSize
+
+        for state, columns in sorted(states.items()):
+            self.offsets[state] = len(self.frames)
+            self.lengths[state] = len(columns)
+
+            images = [sheet.subsurface(pygame.Rect(column*width, 0, width, height)) for column in columns]
+
+            self.frames.extend(images)
+            self.frames.extend(pygame.transform.flip(image, True, False) for image in images)
+
+    def index(self, state, direction, frame=0):
+        """ Get the index of a frame in the table
+        """
+        return self.offsets[state] + direction * self.lengths[state] + frame
+
+    def frame_count(self, state):
+        return self.lengths[state]
+
+
+# Frame tables by sprite sheet
+frameTables = {}
+
+def load_frame_table(filename, frameSize, states):
+    """ Get the shared frame table of the sprite sheet, slicing it the first
+        time the sheet is used
+    """
+    key = (filename, frameSize)
+    table = frameTables.get(key)
+
+    if table is None:
+        table = frameTables[key] = FrameTable(assets.load_image(filename, CONVERT_ALPHA), frameSize, states)
+
+    return table
@@ -1,6 +1,11 @@
 import pygame
 import inventory
-from engine.camera import Camera
+from animation import load_frame_table, STANDING, WALKING, RIGHT, LEFT
+
+# Frames of the player sprite sheet: standing, and two walking frames
+PLAYER_SHEET = 'images/player-sprite.png'
+PLAYER_FRAME_SIZE = (30, 32)
+PLAYER_STATES = {STANDING: [0], WALKING: [1, 2]}
 
 class Character(pygame.sprite.Sprite):
     def __init__(self, color, initial_position):
@@ -19,10 +24,12 @@ class Character(pygame.sprite.Sprite):
         #self.image = pygame.Surface([15, 15])
         #self.image.fill(color)
         
-        self.images = pygame.image.load('images/player-sprite.png')
-        self.images.convert_alpha()
+        # The animation frames are shared by all characters, a character
+        # only keeps the index of its current frame
+        self.frames = load_frame_table(PLAYER_SHEET, PLAYER_FRAME_SIZE, PLAYER_STATES)
+        self.frameIndex = self.frames.index(STANDING, RIGHT)
         
-        self.image = self.images.subsurface(pygame.Rect(0,0,30,32))
+        self.image = self.frames.frames[self.frameIndex]
         
         # Make our top-left corner the passed-in location.
         self.rect = self.image.get_rect()
@@ -53,52 +60,43 @@ class Character(pygame.sprite.Sprite):
             self.onGround = False
             self.ydirection = -self.jumpspeed
 
-    def update(self, gameengine, current_time):
-        # Move our position up or down by one pixel
-        if self.xdirection > 0: self.rect.left += self.speed
-        elif self.xdirection < 0: self.rect.left -= self.speed
-        
-        # Get the tiles around the character to check for collisions.  We 
-        # limit the check to the local character camera to limit unnecessary
-        # collision detection on tiles not near the character
-        localCameraWidth = gameengine.tileengine.tileSize * 5
-        localCameraHeight = gameengine.tileengine.tileSize * 5
-        localCamera = Camera(localCameraWidth,localCameraHeight, gameengine.camera.worldMapWidth, gameengine.camera.worldMapWidth)
-        localCamera.update(gameengine.base, self)
-        tiles = gameengine.tileengine.get_tiles_pixel(localCamera.window)
-        
-        # Do collision detection after moving horizontally
-        if self.collide(tiles, True):
-            self.xdirection = 0
-        
-        #if self.ydirection != 0: self.rect.top += 1*self.jumpspeed
-        #elif self.ydirection < 0: self.rect.top -= 1*self.speed
+    def update(self, gameengine, current_time, ticks=1):
+        """ Advance the character by the given number of game ticks at once,
+            far away characters are updated less often
+        """
+        # Move our position left or right
+        dx = 0
+        if self.xdirection > 0: dx = self.speed * ticks
+        elif self.xdirection < 0: dx = -self.speed * ticks
         
+        # Move our position up or down
+        dy = 0
         if not self.onGround:
-            # Slow jumping speed due to gravity
-            self.ydirection = self.ydirection + self.gravity
-            
-            # Check for max falling speed
-            if self.ydirection > self.maxFallingSpeed: self.ydirection = self.maxFallingSpeed
-            
-            self.rect.top += self.ydirection
-        
-        # Do collision detection after moving vertically
-        if self.collide(tiles, False):
-            self.ydirection = 0
+            for _ in range(ticks):
+                # Slow jumping speed due to gravity
+                self.ydirection = self.ydirection + self.gravity
+                
+                # Check for max falling speed
+                if self.ydirection > self.maxFallingSpeed: self.ydirection = self.maxFallingSpeed
+                
+                dy += int(self.ydirection)
         
-        # Check if the character is actually on the ground as it may have
-        # moved off a cliff.  Only necessary if the character moved 
-        # horizontally.
+        # Move through the tile map stopping at any tiles in the way
+        contactX, contactY = self.collide(gameengine.tileengine, dx, dy)
         
-        # Temporary move down 1
-        self.rect.bottom += 1 
+        if contactX:
+            self.xdirection = 0
+        
+        if contactY:
+            self.ydirection = 0
         
-        self.onGround = self.collide(tiles, False)
+        # Check if the character is actually on the ground as it may have
+        # moved off a cliff
+        left, top, width, height = self.rect
+        self.onGround = gameengine.tileengine.sweep_vertical(left, top, width, height, 1)[1] > 0
         
-        # Undo the temporary move down 1 if not on the ground
-        if not self.onGround: 
-            self.rect.bottom -= 1
+        # Keep the spatial index up to date with the new location
+        gameengine.spatialIndex.move(self)
         
         # Update the sprite image
         self.update_image(current_time)
@@ -109,31 +107,15 @@ class Character(pygame.sprite.Sprite):
         
 
 
-    def collide(self, entities=None, horizontal=True):
-        """ Check if this character collides with any of the provided 
-            entities in the horizontal or vertical directions.  
+    def collide(self, tileengine, dx, dy):
+        """ Move this character by (dx, dy) through the tile map, stopping 
+            against any solid tiles.  Returns the (horizontal, vertical) 
+            contact directions, refer to TileEngine.sweep().
         """
+        left, top, contactX, contactY = tileengine.sweep(self.rect, dx, dy)
+        self.rect.topleft = (left, top)
         
-        # Get all the entities that collide with the character
-        collidedEntities = pygame.sprite.spritecollide(self, entities, False, pygame.sprite.collide_rect)
-        
-        for entity in collidedEntities:
-            if horizontal and self.xdirection > 0:
-                self.rect.right = entity.rect.left
-                return True
-            elif horizontal and self.xdirection < 0:
-                self.rect.left = entity.rect.right
-                return -1
-            elif not horizontal and self.ydirection > 0:
-                self.rect.bottom = entity.rect.top
-                self.onGround = True
-                return 1
-            elif not horizontal and self.ydirection < 0:
-                self.rect.top = entity.rect.bottom
-                return -1
-                
-        # No collision detected
-        return 0
+        return (contactX, contactY)
 
     def update_image(self, current_time):
         """ Update the image based on the state
@@ -146,16 +128,16 @@ class Character(pygame.sprite.Sprite):
                 self.walkingImageAlt = not self.walkingImageAlt            
                 self.nextAltWalkingImageTime = current_time + self.updateDelay*30
     
-        offset = 0
-        if self.walkingImageAlt:
-            offset = 30
+        frame = 1 if self.walkingImageAlt else 0
     
         if self.xdirection > 0:
-            self.image = self.images.subsurface(pygame.Rect(30+offset,0,30,32))
+            index = self.frames.index(WALKING, RIGHT, frame)
         elif self.xdirection < 0:
-            self.image = self.images.subsurface(pygame.Rect(30+offset,0,30,32))
-            self.image = pygame.transform.flip(self.image, True, False)
+            index = self.frames.index(WALKING, LEFT, frame)
         else:
-            self.image = self.images.subsurface(pygame.Rect(0,0,30,32))
-                       
-
+            index = self.frames.index(STANDING, RIGHT)
+        
+        # Only swap the image when the frame changed
+        if index != self.frameIndex:
+            self.frameIndex = index
+            self.image = self.frames.frames[index]
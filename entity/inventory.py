@@ -1,49 +1,76 @@
 import pygame
+from engine.ui import Panel, grid_index
 
-class Inventory(object):
-    """ Inventory of items
+# Alpha of the inventory slots
+SLOT_ALPHA = 160
+
+# Color drawn between the slots, left transparent
+GAP_COLOR = (255,0,255)
+
+class Inventory(Panel):
+    """ Inventory of items.  The slots are composed into one panel that is
+        only composed again when a slot changes.
     """
     
     def __init__(self, size=50):
+        super(Inventory, self).__init__(alpha=SLOT_ALPHA, colorkey=GAP_COLOR)
+        
         self.size = size
         self.items=[InventoryItem(x, None) for x in range(size)]
         
+        # Area of the screen covered by the inventory
+        self.rect = pygame.Rect(0,0,0,0)
+        if self.items:
+            self.rect = self.items[0].rect.unionall([item.rect for item in self.items])
+        
+        self.resize(self.rect.size)
+        
     def add(self, item, slot):
         if self.items[slot].item != None:
             raise Exception("Already an item in this slot")
         
         self.items[slot].item = item
+        self.invalidate()
         
         return item
     
     def remove(self, slot):
         item = self.items[slot].item
         self.items[slot].item = None
+        self.invalidate()
         return item
     
     def get(self, slot):
         return self.items[slot].item
     
-    def display(self, screen):
+    def compose(self, surface):
         for item in self.items:
-            item.display(screen)
+            item.display(surface, self.rect.topleft)
+    
+    def display(self, screen):
+        self.draw(screen, self.rect.topleft)
     
     def do_primary(self, position, gameengine):
         return self.collide(position)
     
     def collide(self, position):
         """ Check if this position collides with any inventory item.
-            Basically if the user clicked on an inventory item  
+            Basically if the user clicked on an inventory item.  The slots
+            form a grid so the slot is worked out from the position.
         """
+        if not self.items:
+            return False
         
-        # Get all the entities that collide with the character
-        for item in self.items:
-            if item.rect.collidepoint(position):
-                item.image.fill((0,200,0))
-                return True
+        first = self.items[0]
+        index = grid_index(position, (first.padding, first.padding), first.size, first.padding, first.horizontalCount)
         
         # Did not collide
-        return False
+        if index is None or index >= len(self.items):
+            return False
+        
+        self.items[index].image.fill((0,200,0))
+        self.invalidate()
+        return True
         
 class InventoryItem(pygame.sprite.Sprite):
     """ Item in an inventory.  Somewhat confusing as this is not an Item
@@ -60,19 +87,20 @@ class InventoryItem(pygame.sprite.Sprite):
         self.padding = 10
         self.horizontalCount = 10
         
-        # Initialize slot image
+        # Initialize slot image, the inventory applies the slot alpha
         self.image = pygame.Surface(self.size)
         self.image.fill((0,0,200))
-        self.image.set_alpha(160)
         self.rect = self.image.get_rect()
         
         left = index / self.horizontalCount * (self.size[0] + self.padding) + self.padding
         top = index % self.horizontalCount * (self.size[1] + self.padding) + self.padding
         self.rect.topleft = (top, left) 
         
-    def display(self, screen):
-        screen.blit(self.image, self.rect.topleft)
+    def display(self, screen, origin=(0,0)):
+        """ Draw the slot onto the inventory panel, whose top left corner is
+            at the origin
+        """
+        screen.blit(self.image, (self.rect.left - origin[0], self.rect.top - origin[1]))
         
         if self.item:
             pass
-    
\ No newline at end of file
@@ -1,9 +1,9 @@
 import pygame
 import math
-from engine.tileengine import Tile
+from engine.assets import assets, CONVERT_ALPHA
 from utilities.util import Util
-from entity.projectile import Projectile
 from character import Character
+from rotation import RotationCache
 
 class Item(pygame.sprite.Sprite):
     def __init__(self):
@@ -16,6 +16,12 @@ class Item(pygame.sprite.Sprite):
     def do_secondary(self, worldLocation, gameengine):
         pass
     
+    def do_drag(self, startLocation, endLocation, buttons, gameengine):
+        """ The mouse was dragged from the start to the end world location
+            with the given (left, middle, right) buttons held
+        """
+        pass
+    
     def update(self, gameengine, character):
         pass
     
@@ -36,7 +42,8 @@ class TileTool(Item):
         
         # Place a tile at this location if one is not already there   
         if clickedTile == None:
-            gameengine.tileengine.place_tile(gameengine.tileengine.pixel_to_tile(worldLocation), Tile(None,(0,0,0)))
+            tileType = gameengine.tileengine.find_tile_type('block')
+            gameengine.tileengine.place_tile(gameengine.tileengine.pixel_to_tile(worldLocation), tileType)
     
     def do_secondary(self, worldLocation, gameengine):
         """ Remove a tile at the provided location
@@ -48,6 +55,20 @@ class TileTool(Item):
         # Remove tile at this location if one is located there
         if clickedTile != None:
             gameengine.tileengine.remove_tile(gameengine.tileengine.pixel_to_tile(worldLocation), gameengine.background)
+    
+    def do_drag(self, startLocation, endLocation, buttons, gameengine):
+        """ Place tiles along the dragged line with the left button, or 
+            remove them with the right button, in one bulk edit
+        """
+        tileengine = gameengine.tileengine
+        start = tileengine.pixel_to_tile(startLocation)
+        end = tileengine.pixel_to_tile(endLocation)
+        
+        if buttons[0]:
+            # Only fill the empty locations, like a click does
+            tileengine.brush_line(start, end, tileengine.find_tile_type('block'), replace=False)
+        elif buttons[2]:
+            tileengine.brush_line(start, end, None)
 
 class EnemyTool(Item):
     """ Tool item whose primary action is placing new enemies.  This is for 
@@ -63,30 +84,37 @@ class EnemyTool(Item):
         
         # Create a new character
         character = Character((0,0,0), worldLocation)
-        gameengine.characters.add(character)
+        gameengine.add_character(character)
         
 class Weapon(Item):
     
+    # Rotated images of the weapon, shared by every weapon
+    rotations = None
+    
     def __init__(self):
         super(Weapon, self).__init__()
         
-        loadedImage = pygame.image.load('images/weapon-sprite.png')
-        loadedImage.convert_alpha()
+        if Weapon.rotations is None:
+            Weapon.rotations = RotationCache(self.load_image())
+        
+        self.originalImage = Weapon.rotations.image
+        
+        self.image = self.originalImage;
+        self.rect = self.image.get_rect()
+        self.rect.topleft = (0,0)
+    
+    def load_image(self):
+        loadedImage = assets.load_image('images/weapon-sprite.png', CONVERT_ALPHA)
         
         width, height = loadedImage.get_size()
         
         # Adjust the original image so that we can easily rotate the time 
         # around the entity holding this weapon
         adjustedImage = pygame.Surface((width*2, height), pygame.SRCALPHA, 32)
-        adjustedImage.convert_alpha()
         adjustedImage.fill((0,0,0,0))
         adjustedImage.blit(loadedImage, (width, 0))
         
-        self.originalImage = adjustedImage
-        
-        self.image = self.originalImage;
-        self.rect = self.image.get_rect()
-        self.rect.topleft = (0,0)
+        return adjustedImage.convert_alpha()
         
     def do_primary(self, worldLocation, gameengine):
         angle,flip = self.get_cursor_angle(gameengine, gameengine.player)
@@ -94,16 +122,14 @@ class Weapon(Item):
         if flip:
             angle = -(angle + 180)
         
-        projectile = Projectile(gameengine, angle, 10, gameengine.player.rect.center)
-        
-        gameengine.projectiles.add(projectile)
+        gameengine.projectiles.spawn(angle, 10, gameengine.player.rect.center)
     
     def do_secondary(self, worldLocation, gameengine):
         pass    
 
     def get_cursor_angle(self, gameengine, character):
         playerLocation = gameengine.camera.apply(character).center
-        mousePosition = pygame.mouse.get_pos();
+        mousePosition = gameengine.mousePosition
         
         angle,flip = Util.get_rotate_angle(playerLocation, mousePosition)
         
@@ -114,14 +140,10 @@ class Weapon(Item):
         # player
         angle,flip = self.get_cursor_angle(gameengine, character)
         
-        # Always start using the original image as transforming an already
-        # transformed image will distort the image
-        self.image = self.originalImage
-        self.image = pygame.transform.rotate(self.image, angle)
-        
-        if flip:
-            self.image = pygame.transform.flip(self.image, True, False)
+        # The rotated images are cached at discrete angles
+        self.image, offset = self.rotations.get(angle, flip)
         
         # Rotate resizes the image so we have to center it at the original
         # location
-        self.rect = self.image.get_rect(center=character.rect.center)
+        centerX, centerY = character.rect.center
+        self.rect = pygame.Rect((centerX + offset[0], centerY + offset[1]), self.image.get_size())
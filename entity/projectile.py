@@ -1,78 +1,158 @@
 import pygame
 import math
-from engine.camera import Camera
-
-class Projectile(pygame.sprite.Sprite):
-    """ Any projectile
-    """ 
-    def __init__(self, gameengine, angle, speed, initial_position):
-        
-        pygame.sprite.Sprite.__init__(self)
-        
-        self.angle = angle
-        self.speed = speed
-        
-        self.image = pygame.Surface((5,5))
+import numpy
+from utilities.util import Util
+
+# Number of projectiles there is initially room for, grows as needed
+INITIAL_CAPACITY = 1024
+
+# Number of game ticks a projectile lives for
+PROJECTILE_LIFETIME = 250
+
+# Width and height of a projectile in pixels
+PROJECTILE_SIZE = 5
+
+class ProjectileSystem(object):
+    """ All the live projectiles in the world.  Projectiles are not sprites,
+        they are stored as parallel arrays (position, velocity and remaining
+        lifetime) so the whole set can be moved and checked for collisions
+        in one step.  All projectiles share one image.
+    """
+
+    def __init__(self, capacity=INITIAL_CAPACITY, lifetime=PROJECTILE_LIFETIME, size=PROJECTILE_SIZE):
+        self.count = 0
+        self.lifetime = lifetime
+        self.size = size
+
+        self.positions = numpy.zeros((capacity, 2), numpy.float64)
+        self.velocities = numpy.zeros((capacity, 2), numpy.float64)
+        self.lives = numpy.zeros(capacity, numpy.int32)
+
+        self.image = pygame.Surface((size,size))
         self.image.fill((255,255,255))
         self.image.set_alpha(255)
-        
-        self.rect = self.image.get_rect()
-        self.rect.topleft = initial_position
-        
-        gameengine.projectiles.add(self)
-        
-    def get_velocity(self, angle, speed):
-        xVelocity = float(speed) * math.cos(math.radians(angle))
-        yVelocity = float(speed) * math.sin(math.radians(angle))
-        
-        return (xVelocity, yVelocity)
-    
-    def update(self, gameengine, current_time):        
-        xVelocity, yVelocity = self.get_velocity(self.angle, self.speed)
-        
-        self.rect.left += xVelocity
-        self.rect.top -= yVelocity
-        
-        # Check if the projectile went outside the game map.  If so, remove
-        # it.
-        if not self.rect.colliderect(gameengine.base.get_rect()):
-            gameengine.projectiles.remove(self)
-        
-        # Check if the projectile collided with any characters
-        collided = self.collide(gameengine.characters, [gameengine.player])
-        
-        if collided:
-            # Projectile collided with a player
-            gameengine.projectiles.remove(self)
-        
-        else:
-            # Check if the projectile collided with any tiles
-            localCameraWidth = gameengine.tileengine.tileSize * 5
-            localCameraHeight = gameengine.tileengine.tileSize * 5
-            localCamera = Camera(localCameraWidth,localCameraHeight, gameengine.camera.worldMapWidth, gameengine.camera.worldMapWidth)
-            localCamera.update(gameengine.base, self)
-            tiles = gameengine.tileengine.get_tiles_pixel(localCamera.window)
-            
-            #tiles = gameengine.tileengine.get_tiles_pixel(gameengine.camera.window)
-            collided = self.collide(tiles)
-            
-            if collided:
-                gameengine.projectiles.remove(self)
-            
-    def collide(self, entities=None, ignoreList=None):
-        """ Check if this projectile collides with any of the provided 
-            entities in the horizontal or vertical directions.  
+
+    def __len__(self):
+        return self.count
+
+    def spawn(self, angle, speed, initial_position):
+        """ Add a projectile at the given world pixel location moving at the
+            given angle (degrees) and speed (pixels per tick).
         """
-        
-        # Get all the entities that collide with the player
-        collidedEntities = pygame.sprite.spritecollide(self, entities, False, pygame.sprite.collide_rect)
-        
-        for entity in collidedEntities:
-            # Collision detected
-            if ignoreList and entity in ignoreList:
-                continue
-            else:  
-                return True
-                
-        # No collision detected
-        return False
\ No newline at end of file
+        if self.count == len(self.lives):
+            self.grow(2 * len(self.lives))
+
+        # The velocity never changes so it is only computed once.  The world
+        # y axis points down.
+        index = self.count
+        self.positions[index] = initial_position
+        self.velocities[index] = (float(speed) * math.cos(math.radians(angle)),
+                                  -float(speed) * math.sin(math.radians(angle)))
+        self.lives[index] = self.lifetime
+        self.count += 1
+
+        return index
+
+    def grow(self, capacity):
+        """ Increase the number of projectiles there is room for
+        """
+        for name in ('positions', 'velocities', 'lives'):
+            old = getattr(self, name)
+            new = numpy.zeros((capacity,) + old.shape[1:], old.dtype)
+            new[:self.count] = old[:self.count]
+            setattr(self, name, new)
+
+    def clear(self):
+        self.count = 0
+
+    def update(self, gameengine, current_time):
+        """ Move all the projectiles and remove the ones that expired, left
+            the world map or hit a tile or character.
+        """
+        count = self.count
+
+        if count == 0:
+            return
+
+        positions = self.positions[:count]
+        lives = self.lives[:count]
+
+        positions += self.velocities[:count]
+        lives -= 1
+
+        # Projectiles collide at their center
+        x = positions[:,0] + self.size / 2.0
+        y = positions[:,1] + self.size / 2.0
+
+        # Remove projectiles that expired or went outside the game map
+        tileengine = gameengine.tileengine
+        tileSize = tileengine.tileSize
+        worldWidth, worldHeight = tileengine.worldSize
+
+        alive = (lives > 0) & (x >= 0) & (y >= 0) & (x < worldWidth*tileSize) & (y < worldHeight*tileSize)
+
+        # Remove projectiles that hit a solid tile
+        tileX = numpy.clip((x // tileSize).astype(numpy.intp), 0, worldWidth-1)
+        tileY = numpy.clip((y // tileSize).astype(numpy.intp), 0, worldHeight-1)
+        solidTypes = numpy.asarray(tileengine.solidTypes, numpy.bool_)
+
+        alive &= ~solidTypes[tileengine.grid[tileX, tileY]]
+
+        # Remove projectiles that hit a character.  Only projectiles in a
+        # spatial index cell with a character in it need to be checked.
+        spatialIndex = gameengine.spatialIndex
+
+        if spatialIndex.cells:
+            # Cells are keyed by the complex number x + yj, which is unique
+            # for negative cell locations too
+            cellSize = spatialIndex.cellSize
+            occupied = numpy.array([complex(cellX, cellY) for cellX, cellY in spatialIndex.cells], numpy.complex128)
+            cells = (x // cellSize) + 1j * (y // cellSize)
+            candidates = numpy.flatnonzero(alive & numpy.isin(cells, occupied))
+
+            for index in candidates.tolist():
+                point = (int(x[index]), int(y[index]))
+
+                hits = spatialIndex.query_point(point, [gameengine.player])
+
+                if hits:
+                    alive[index] = False
+
+                    # Being hit wakes a sleeping character
+                    for character in hits:
+                        gameengine.activity.wake(character)
+
+        # Compact the live projectiles to the front of the arrays
+        if not alive.all():
+            keep = numpy.flatnonzero(alive)
+            remaining = len(keep)
+
+            self.positions[:remaining] = positions[keep]
+            self.velocities[:remaining] = self.velocities[:count][keep]
+            self.lives[:remaining] = lives[keep]
+            self.count = remaining
+
+    def draw(self, screen, window, positions=None):
+        """ Draw all the projectiles in the given world pixel window onto the
+            screen.  Other positions than the current ones, like those of a
+            snapshot, can be given.  Returns the screen positions drawn at.
+        """
+        if positions is None:
+            positions = self.positions[:self.count]
+
+        if len(positions) == 0:
+            return []
+
+        left, top, width, height = window
+
+        visible = ((positions[:,0] > left - self.size) & (positions[:,0] < left + width) &
+                   (positions[:,1] > top - self.size) & (positions[:,1] < top + height))
+
+        screenPositions = (positions[visible] - (left, top)).astype(numpy.intp)
+
+        screenPositions = screenPositions.tolist()
+
+        image = self.image
+        Util.blit_all(screen, [(image, position) for position in screenPositions])
+
+        return screenPositions
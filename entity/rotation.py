@@ -0,0 +1,77 @@
+import pygame
+from collections import OrderedDict
+
+# Size of the angle steps rotated images are cached at, in degrees
+ROTATION_STEP = 2
+
+# Maximum number of rotated images kept in a cache.  A whole turn at the
+# default step, flipped and not, is 360 images.
+ROTATION_CACHE_SIZE = 360
+
+class RotationCache(object):
+    """ Least recently used cache of an image rotated (and possibly flipped)
+        at discrete angles.  Angles are rounded to the nearest ROTATION_STEP
+        degrees so the image only has to be transformed the first time an
+        angle is used.  Each entry holds the transformed image and the offset
+        of its top-left corner from the center of rotation, as rotating
+        resizes the image.
+    """
+
+    def __init__(self, image, step=ROTATION_STEP, capacity=ROTATION_CACHE_SIZE):
+        self.image = image
+        self.step = step
+        self.capacity = capacity
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def quantize(self, angle):
+        """ Round the angle to the nearest step
+        """
+        return int(round(angle / float(self.step))) * self.step % 360
+
+    def get(self, angle, flip=False):
+        """ Get the (image, offset) of the image rotated by the angle in
+            degrees and flipped on the y-axis if requested
+        """
+        key = (self.quantize(angle), flip)
+        entry = self.entries.pop(key, None)
+
+        if entry is None:
+            entry = self.transform(key[0], flip)
+
+            if len(self.entries) >= self.capacity:
+                self.entries.popitem(last=False)
+
+        self.entries[key] = entry
+
+        return entry
+
+    def transform(self, angle, flip):
+        """ Rotate and flip the original image.  Always start from the
+            original image as transforming an already transformed image will
+            distort it.
+        """
+        image = pygame.transform.rotate(self.image, angle)
+
+        if flip:
+            image = pygame.transform.flip(image, True, False)
+
+        width, height = image.get_size()
+
+        return (image, (-(width // 2), -(height // 2)))
+
+    def prebake(self):
+        """ Transform the image at every step up front, as far as the cache
+            capacity allows
+        """
+        for angle in range(0, 360, self.step):
+            for flip in (False, True):
+                if len(self.entries) >= self.capacity:
+                    return
+
+                self.get(angle, flip)
+
+    def clear(self):
+        self.entries.clear()
@@ -1,18 +1,52 @@
 import pygame
 from pygame.locals import *
+from engine.assets import assets
+from engine.ui import Panel, grid_index
 
-class Menu(pygame.sprite.Sprite):
-    """ Game menu
+class Menu(Panel):
+    """ Game menu.  The menu items are stacked from the top left corner of
+        the menu, itemSpacing pixels apart, and composed into one panel.
     """
     
-    def __init__(self):
-        pygame.sprite.Sprite.__init__(self)
+    def __init__(self, itemSize=(200,40), itemSpacing=10):
+        super(Menu, self).__init__()
         
+        self.itemSize = itemSize
+        self.itemSpacing = itemSpacing
         self.menuItems = []
+        
+        # Area of the screen covered by the menu
+        self.rect = pygame.Rect(0,0,0,0)
+    
+    def add(self, menuItem):
+        self.menuItems.append(menuItem)
+        self.resize((self.itemSize[0], len(self.menuItems) * (self.itemSize[1] + self.itemSpacing) - self.itemSpacing))
+        
+        return menuItem
+    
+    def compose(self, surface):
+        for index, menuItem in enumerate(self.menuItems):
+            surface.blit(menuItem.image, (0, index * (self.itemSize[1] + self.itemSpacing)))
+    
+    def item_at(self, position):
+        """ Get the menu item at the screen position or None if there is no
+            menu item there
+        """
+        index = grid_index(position, self.rect.topleft, self.itemSize, self.itemSpacing, 1)
+        
+        if index is None or index >= len(self.menuItems):
+            return None
+        
+        return self.menuItems[index]
 
-    def display(self, screen):
-        for menuItem in self.menuItems:
-            menuItem.display(screen)
+    def display(self, screen, position=(0,0)):
+        # Move the menu items along with the menu
+        if position != self.rect.topleft or self.dirty:
+            for index, menuItem in enumerate(self.menuItems):
+                menuItem.rect.topleft = (position[0], position[1] + index * (self.itemSize[1] + self.itemSpacing))
+        
+        self.rect = pygame.Rect(position, self.surfaceSize)
+        self.draw(screen, position)
 
 class MainMenu(Menu):
     """ Main menu
@@ -24,32 +58,26 @@ class MainMenu(Menu):
         self.postion = (0,0)
         
         controlsAction = lambda: 1+1 
-        controlsMenuItem = MenuItem("Controls", controlsAction)
+        self.add(MenuItem("Controls", controlsAction))
         
         quitAction = lambda: pygame.event.post(pygame.event.Event(QUIT)) 
-        quitMenuItem = MenuItem("Quit", quitAction)
-        
-        self.menuItems.append(controlsMenuItem)
-        self.menuItems.append(quitMenuItem)
+        self.add(MenuItem("Quit", quitAction))
 
     def display(self, screen):
-        index = 0
-        for menuItem in self.menuItems:
-            position = (screen.get_rect().center[0], screen.get_rect().center[1] + (index * 50))
-            menuItem.display(screen, position)
-            index += 1
+        # The menu hangs from the center of the screen
+        super(MainMenu, self).display(screen, screen.get_rect().center)
 
-class MenuItem(Menu):
+class MenuItem(pygame.sprite.Sprite):
     """ Game menu item
     """
     
     def __init__(self, text, action):
-        super(MenuItem, self).__init__()
+        pygame.sprite.Sprite.__init__(self)
         
         self.width = 200
         self.height = 40
         
-        self.menuFnt = pygame.font.SysFont('Arial', 32, True)
+        self.menuFnt = assets.font('Arial', 32, True)
         self.action = action
         
         self.image = pygame.Surface((self.width,self.height), pygame.SRCALPHA)
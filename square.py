@@ -1,9 +1,19 @@
+import sys
+import threading
+
 # Third-party
 import pygame
 from pygame.locals import *
-from time import time
+from engine.startup import timeline, baked_map
 import engine.gamestate
-from engine.gameengine import GameEngine
+from engine.assets import assets
+from engine.gameengine import GameEngine, FPS_LIMIT, SKIP_TICKS, MAX_FRAMESKIP
+from engine.gameengine import WORLD_MAP_FILE, BAKE_MAPS, PRELOAD_IMAGES
+from engine.tileengine import CHUNK_SIZE
+from engine.worldformat import WORLD_EXTENSION
+from engine.input import filter_events
+from engine.renderer import Renderer
+from engine.simulation import SimulationThread
 
 # Resolution of the window (what the user sees)
 WIN_WIDTH = 1024
@@ -22,117 +32,157 @@ WORLD_MAP_PIXEL_SIZE = (WORLD_MAP_SIZE[0]*TILE_SIZE, WORLD_MAP_SIZE[1]*TILE_SIZE
 # Color depth (0 means automatically determine this)
 DEPTH = 0
 
-# Frames Per Second limiter
-FPS_LIMIT = 50
-SKIP_TICKS = 1000 / FPS_LIMIT
-MAX_FRAMESKIP = 10
+# Only push the changed parts of the screen to the display instead of the
+# whole screen every frame
+DIRTY_RECTS = False
+
+# Simulate the world in its own thread and draw it interpolated between game
+# ticks
+THREADED_SIMULATION = False
+
+# Frames Per Second limiter of the display with a threaded simulation
+RENDER_FPS_LIMIT = 120
+
+# Number of worker processes to simulate the characters other than the
+# player on, 0 simulates them in the game process
+SIMULATION_WORKERS = 0
+
+
+def load_in_background(screen):
+    """ Decode the images and bake the world map on worker threads, showing
+        a loading screen until they are done
+    """
+    workers = [assets.preload(PRELOAD_IMAGES)]
+    
+    if BAKE_MAPS and not WORLD_MAP_FILE.endswith(WORLD_EXTENSION):
+        def bake():
+            with timeline.step('bake map'):
+                baked_map(WORLD_MAP_FILE, CHUNK_SIZE)
+        
+        workers.append(threading.Thread(target=bake, name='bake'))
+        workers[-1].daemon = True
+        workers[-1].start()
+    
+    font = assets.font('Arial', 32)
+    text = font.render("Loading...", True, (255,255,255))
+    clock = pygame.time.Clock()
+    
+    while any(worker.is_alive() for worker in workers):
+        for event in pygame.event.get():
+            if event.type == QUIT:
+                pygame.quit()
+                sys.exit()
+        
+        screen.fill((0,0,0))
+        screen.blit(text, text.get_rect(center=screen.get_rect().center))
+        pygame.display.update()
+        
+        clock.tick(30)
 
 def main():
     # Initialize pygame
-    pygame.init()
-    screen = pygame.display.set_mode((WIN_WIDTH,WIN_HEIGHT), engine.gamestate.FLAGS, DEPTH)
-    pygame.display.set_caption("Square!")
+    with timeline.step('display'):
+        pygame.init()
+        screen = pygame.display.set_mode((WIN_WIDTH,WIN_HEIGHT), engine.gamestate.FLAGS, DEPTH)
+        pygame.display.set_caption("Square!")
+        
+        # Keep the event types the game doesn't use off the event queue
+        filter_events()
+    
+    with timeline.step('loading screen'):
+        load_in_background(screen)
     
     # Initialize the game engine
-    gameengine = GameEngine(WIN_WIDTH, WIN_HEIGHT)
+    with timeline.step('game engine'):
+        gameengine = GameEngine(WIN_WIDTH, WIN_HEIGHT)
     
     # Initialize the camera
     camera = gameengine.camera
     
     # Misc initialization
-    arialFnt = pygame.font.SysFont('Arial', 16)
-    
-    charUpdateTime = 0
-    tileTime = 0
-    characterTime = 0
+    renderer = Renderer(gameengine.timings, DIRTY_RECTS)
+    timings = gameengine.timings
+    eventScope = timings.register('events')
+    flipScope = timings.register('flip')
     
     nextGameTick = pygame.time.get_ticks()
     
+    if SIMULATION_WORKERS:
+        gameengine.enable_sharding(SIMULATION_WORKERS)
+    
+    simulation = None
+    if THREADED_SIMULATION:
+        simulation = SimulationThread(gameengine)
+        simulation.start()
+    
     # Loop until the user exits the game
     while True: 
-        gameengine.currentState.handle_events(pygame.event.get(), gameengine)
+        timings.begin_frame()
         
-        inMenu = gameengine.currentState == gameengine.menuState
-        inInventory = gameengine.currentState == gameengine.inventoryState
+        with eventScope:
+            gameengine.mousePosition = pygame.mouse.get_pos()
+            
+            # Input changes the world so it has to wait for the simulation
+            with gameengine.worldLock:
+                events = gameengine.input.poll(pygame.time.get_ticks(), gameengine.tick)
+                gameengine.currentState.handle_events(events, gameengine)
         
-        # Display only the camera view of the world map
-        winSurface = camera.update(gameengine.base, gameengine.player)                
+        inMenu = gameengine.currentState == gameengine.menuState
         
-        if not inMenu:
-            # Control how fast the game updates, which is different from how
-            # fast the display updates.  Refer to the following link for a
-            # good article on the game loop.
-            # http://www.koonsolo.com/news/dewitters-gameloop/
+        if simulation:
+            # The world is simulated in its own thread, draw it between the
+            # last two game ticks
+            snapshot = simulation.frame(pygame.time.get_ticks())
+            camera.center(snapshot.rect(gameengine.player))
             
-            loops = 0
-            while pygame.time.get_ticks() > nextGameTick and loops < MAX_FRAMESKIP:
-                # Update the characters on the world map
-                start = time()        
-                gameengine.characters.update(gameengine, pygame.time.get_ticks())
-                end = time()
-                charUpdateTime = end - start
-                
-                # Update the projectiles
-                gameengine.projectiles.update(gameengine, pygame.time.get_ticks())
+            dirtyRects = renderer.draw(screen, gameengine, snapshot)
+        else:
+            # Display only the camera view of the world map
+            camera.update(gameengine.player)                
+            
+            if not inMenu:
+                # Control how fast the game updates, which is different from how
+                # fast the display updates.  Refer to the following link for a
+                # good article on the game loop.
+                # http://www.koonsolo.com/news/dewitters-gameloop/
                 
-                nextGameTick += SKIP_TICKS
-                loops += 1
-        
-        # The actual visual display consists of the following layers from background to foreground
-        # 1. Background
-        # 2. Tiles (from tile engine)
-        # 3. Entities (player player, mobs, npc's, etc...)
-        # 4. Menu
-        
-        # Blit the background (only the camera view  
-        screen.blit(winSurface, (0,0))
-        screen.blit(gameengine.background, (0,0))
-        
-        # Blit the tiles
-        start = time()
-        #for tile in tiles:
-        #    screen.blit(tile.image, camera.apply(tile))
-        tileWindowSurface = gameengine.tileengine.tileWorldSurface.subsurface(gameengine.camera.window)
-        screen.blit(tileWindowSurface, (0,0))
-        end = time()
-        tileTime = end-start
-        
-        # Now blit the characters on the screen adjusting for camera location
-        # Also blit the player's item, if equipped
-        start = time()
-        for character in gameengine.characters:
-            screen.blit(character.image, camera.apply(character))
+                loops = 0
+                while pygame.time.get_ticks() > nextGameTick and loops < MAX_FRAMESKIP:
+                    # Update the characters and projectiles on the world map
+                    gameengine.step(pygame.time.get_ticks())
+                    
+                    nextGameTick += SKIP_TICKS
+                    loops += 1
             
-            if character.currentItem and character.currentItem.image:
-                screen.blit(character.currentItem.image, camera.apply(character.currentItem))
-        end = time()
-        characterTime = end-start
-        
-        # Blit all the projectiles
-        for projectile in gameengine.projectiles:
-            screen.blit(projectile.image, camera.apply(projectile))
-        
-        # Display the inventory
-        if inInventory:
-            gameengine.inventoryState.displayInventory(screen)
+            dirtyRects = renderer.draw(screen, gameengine)
+            
+        # Actually update the visible screen, only the parts that changed
+        # if they are known
+        with flipScope:
+            if dirtyRects is None:
+                pygame.display.update()
+            else:
+                pygame.display.update(dirtyRects)
         
-        # Display the menu
+        # The menu is drawn straight from its state, the world only shows
+        # input once a later game tick is drawn
         if inMenu:
-            gameengine.menuState.displayMenu(screen)
-            
-        # Debugging info
-        if gameengine.debugging:
-            screen.blit(arialFnt.render('left: ' +  str(gameengine.player.rect.left) + ', top: ' + str(gameengine.player.rect.top), True, (255,255,255)), (5,5))
-            screen.blit(arialFnt.render('FPS: ' +  str(gameengine.clock.get_fps()), True, (255,255,255)), (5,25))
-            screen.blit(arialFnt.render('Character Update Time: %.4f' % charUpdateTime, True, (255,255,255)), (5,45))
-            screen.blit(arialFnt.render('Character Time: %.4f' % characterTime, True, (255,255,255)), (5,65))
-            screen.blit(arialFnt.render('Tile Time: %.4f' % tileTime, True, (255,255,255)), (5,85))
-            screen.blit(arialFnt.render('Characters: %.0f, Projectiles: %.0f' % (len(gameengine.characters), len(gameengine.projectiles)), True, (255,255,255)), (5,105))
+            gameengine.input.latency.presented(pygame.time.get_ticks())
+        else:
+            gameengine.input.latency.presented(pygame.time.get_ticks(), snapshot.tick if simulation else gameengine.tick)
+        
+        if timeline.firstFrame is None:
+            timeline.first_frame()
             
-        # Actually update the visible screen
-        pygame.display.update()
+            if gameengine.debugging:
+                for line in timeline.report():
+                    print(line)
         
-        if not inMenu:
+        if simulation:
+            # Frames are interpolated so they can be drawn faster than the
+            # game ticks
+            gameengine.clock.tick(RENDER_FPS_LIMIT)
+        elif not inMenu:
             # Tick the game clock limiting to 30 frames per second
             gameengine.clock.tick(FPS_LIMIT)
 
@@ -0,0 +1,116 @@
+import unittest
+import numpy
+from pygame.locals import Rect
+from engine.activity import ActivityManager
+from engine.sharding import CHARACTER_RECORD, step_region
+from engine.spatialhash import SpatialHash
+
+class Walker(object):
+    """ Character walking right on flat ground
+    """
+
+    def __init__(self, position):
+        self.rect = Rect(position, (10, 10))
+        self.onGround = True
+        self.xdirection = 1
+        self.speed = 3
+
+    def update(self, gameengine, current_time, ticks=1):
+        self.rect.x += self.speed * ticks
+
+
+class Camera(object):
+
+    def __init__(self):
+        self.window = Rect(0, 0, 100, 100)
+
+
+class TileEngine(object):
+
+    def __init__(self):
+        self.world = None
+
+
+class GameEngine(object):
+
+    def __init__(self):
+        self.camera = Camera()
+        self.tileengine = TileEngine()
+
+
+class ActivityTest(unittest.TestCase):
+
+    def test_far_characters_keep_up(self):
+        activity = ActivityManager(SpatialHash(), lodDistance=100, lodInterval=4)
+        gameengine = GameEngine()
+
+        near = Walker((10, 10))
+        far = Walker((5000, 10))
+        activity.add(near)
+        activity.add(far)
+
+        farUpdates = 0
+
+        for tick in range(40):
+            location = far.rect.left
+            activity.update(gameengine, [near, far], tick)
+
+            # Whenever the far character is updated it has walked as far as
+            # the near one
+            if far.rect.left != location:
+                farUpdates += 1
+                self.assertEqual(far.rect.left - 5000, near.rect.left - 10)
+
+        self.assertEqual(near.rect.left - 10, 40 * near.speed)
+        self.assertEqual(farUpdates, 10)
+
+    def test_woken_characters_dont_make_up_for_sleep(self):
+        activity = ActivityManager(SpatialHash(), lodDistance=100, lodInterval=4)
+        gameengine = GameEngine()
+
+        walker = Walker((10, 10))
+        activity.add(walker)
+        activity.sleeping.add(walker)
+
+        for tick in range(10):
+            activity.update(gameengine, [walker], tick)
+
+        activity.wake(walker)
+        activity.update(gameengine, [walker], 10)
+
+        self.assertEqual(walker.rect.left, 10 + walker.speed)
+
+    def test_far_records_keep_up(self):
+        # Flat ground along row 5 of 32 pixel tiles
+        grid = numpy.zeros((400, 10), numpy.uint8)
+        grid[:, 5] = 1
+        loaded = numpy.ones((1, 1), numpy.bool_)
+
+        records = numpy.zeros(2, CHARACTER_RECORD)
+        records['left'] = (10, 5000)
+        records['top'] = 5 * 32 - 10
+        records['width'] = records['height'] = 10
+        records['speed'] = 3
+        records['xdirection'] = 1
+        records['onGround'] = True
+        records['maxFallingSpeed'] = 30
+        records['active'] = True
+        records['phase'] = (0, 1)
+
+        near = (-100, -100, 300, 300)
+        farUpdates = 0
+
+        for tick in range(1, 41):
+            location = records['left'][1]
+            step_region(records, 0, 400 * 32, 1, grid, loaded, 512, numpy.array([False, True]), 32, tick,
+                        near, 4, False)
+
+            if records['left'][1] != location:
+                farUpdates += 1
+                self.assertEqual(records['left'][1] - 5000, records['left'][0] - 10)
+
+        self.assertEqual(records['left'][0] - 10, 40 * 3)
+        self.assertEqual(farUpdates, 10)
+
+if __name__ == '__main__':
+    unittest.main()
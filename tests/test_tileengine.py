@@ -0,0 +1,277 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy
+import pygame
+from engine.tileengine import TileEngine, sweep_horizontal, sweep_vertical
+from engine.worldformat import write_world, grid_chunks
+
+class SweepTest(unittest.TestCase):
+    """ Swept collision of a rect against a 10 by 10 grid of 10 pixel tiles,
+        tile type 1 is solid
+    """
+
+    tileSize = 10
+    solidTypes = [False, True]
+
+    def setUp(self):
+        self.grid = numpy.zeros((10, 10), numpy.uint8)
+
+    def horizontal(self, rect, dx):
+        return sweep_horizontal(self.grid, self.solidTypes, self.tileSize, *(tuple(rect) + (dx,)))
+
+    def vertical(self, rect, dy):
+        return sweep_vertical(self.grid, self.solidTypes, self.tileSize, *(tuple(rect) + (dy,)))
+
+    def test_no_movement(self):
+        self.grid[:] = 1
+
+        self.assertEqual(self.horizontal((20, 20, 10, 10), 0), (20, 0))
+        self.assertEqual(self.vertical((20, 20, 10, 10), 0), (20, 0))
+
+    def test_move_exactly_one_tile(self):
+        self.grid[2, 0] = 1
+        self.grid[0, 2] = 1
+
+        # Up against the solid tile without entering it
+        self.assertEqual(self.horizontal((0, 0, 10, 10), 10), (10, 0))
+        self.assertEqual(self.vertical((0, 0, 10, 10), 10), (10, 0))
+
+        # One pixel more enters it
+        self.assertEqual(self.horizontal((0, 0, 10, 10), 11), (10, 1))
+        self.assertEqual(self.vertical((0, 0, 10, 10), 11), (10, 1))
+
+    def test_move_back_onto_tile_boundary(self):
+        self.grid[0, 5] = 1
+        self.grid[5, 0] = 1
+
+        # The left and top edges land on the boundary of the solid tiles
+        self.assertEqual(self.horizontal((25, 50, 10, 10), -15), (10, 0))
+        self.assertEqual(self.vertical((50, 25, 10, 10), -15), (10, 0))
+
+        self.assertEqual(self.horizontal((25, 50, 10, 10), -16), (10, -1))
+        self.assertEqual(self.vertical((50, 25, 10, 10), -16), (10, -1))
+
+    def test_rect_spanning_rows_and_columns(self):
+        # Only the second row and column the rect overlaps are solid
+        self.grid[5, 3] = 1
+        self.grid[3, 5] = 1
+
+        self.assertEqual(self.horizontal((0, 25, 10, 10), 100), (40, 1))
+        self.assertEqual(self.vertical((25, 0, 10, 10), 100), (40, 1))
+
+    def test_start_overlapping_solid_tile(self):
+        self.grid[1, 0] = 1
+        self.grid[0, 1] = 1
+
+        # Only the tiles entered stop the rect, so it can move out of the
+        # tile it overlaps either way
+        self.assertEqual(self.horizontal((5, 0, 10, 10), 5), (10, 0))
+        self.assertEqual(self.horizontal((5, 0, 10, 10), -5), (0, 0))
+        self.assertEqual(self.vertical((0, 5, 10, 10), 5), (10, 0))
+        self.assertEqual(self.vertical((0, 5, 10, 10), -5), (0, 0))
+
+    def test_map_edge_is_solid(self):
+        self.assertEqual(self.horizontal((0, 0, 10, 10), -1), (0, -1))
+        self.assertEqual(self.horizontal((85, 0, 10, 10), 10), (90, 1))
+        self.assertEqual(self.vertical((0, 0, 10, 10), -1), (0, -1))
+        self.assertEqual(self.vertical((0, 85, 10, 10), 100), (90, 1))
+
+        # Up to the edge is no contact
+        self.assertEqual(self.horizontal((85, 0, 10, 10), 5), (90, 0))
+        self.assertEqual(self.vertical((0, 85, 10, 10), 5), (90, 0))
+
+    def test_tile_engine_sweep(self):
+        tileengine = TileEngine((10, 10), 10)
+        rock = tileengine.find_tile_type('rock').id
+        tileengine.set_tiles((0, 5, 10, 1), rock)
+
+        # Falls onto the rock and stops against the left edge of the map
+        self.assertEqual(tileengine.sweep((20, 0, 10, 10), -30, 100), (0, 40, -1, 1))
+
+class TileEditTest(unittest.TestCase):
+    """ Tile edits on a small tile engine of 8 by 8 tiles, in chunks of 4 by
+        4 tiles
+    """
+
+    def setUp(self):
+        self.tileengine = TileEngine((8, 8), 32, 4)
+        self.rock = self.tileengine.find_tile_type('rock')
+        self.block = self.tileengine.find_tile_type('block')
+
+        self.edits = []
+        self.tileengine.add_listener(self.edits.append)
+
+    def assert_surface_tiles(self):
+        """ Check the surface tiles kept up to date by the edits match the
+            ones computed for the whole tile map
+        """
+        surfaceMask = self.tileengine.surfaceMask.copy()
+        self.tileengine.update_surface_tiles()
+
+        self.assertTrue((surfaceMask == self.tileengine.surfaceMask).all())
+
+    def test_edits_are_clipped_to_the_map(self):
+        tileengine = self.tileengine
+        rock = self.rock.id
+
+        tileengine.fill_rect((-2, -3, 5, 5), self.rock)
+        self.assertEqual(self.edits, [(0, 0, 3, 2)])
+        self.assertEqual(numpy.count_nonzero(tileengine.grid), 6)
+        self.assertTrue((tileengine.grid[0:3, 0:2] == rock).all())
+        self.assert_surface_tiles()
+
+        tileengine.apply_stencil((6, 6), numpy.ones((4, 4), numpy.bool_), self.rock)
+        self.assertEqual(self.edits[-1], (6, 6, 2, 2))
+        self.assertTrue((tileengine.grid[6:, 6:] == rock).all())
+        self.assert_surface_tiles()
+
+        tileengine.brush_line((-5, 4), (12, 4), self.rock)
+        self.assertEqual(self.edits[-1], (0, 4, 8, 1))
+        self.assertTrue((tileengine.grid[:, 4] == rock).all())
+        self.assert_surface_tiles()
+
+        tileengine.clear_rect((-1, -1, 2, 2))
+        self.assertEqual(self.edits[-1], (0, 0, 1, 1))
+        self.assertEqual(tileengine.grid[0, 0], 0)
+        self.assert_surface_tiles()
+
+        # Entirely outside the map
+        tileengine.fill_rect((8, 0, 2, 2), self.rock)
+        tileengine.brush_line((-5, -5), (-2, -2), self.rock, 1)
+        self.assertEqual(len(self.edits), 4)
+
+    def test_fill_without_replacing(self):
+        tileengine = self.tileengine
+        tileengine.fill_rect((2, 2, 2, 2), self.block)
+
+        tileengine.brush_line((0, 3), (7, 3), self.rock, 0, False)
+
+        self.assertTrue((tileengine.grid[2:4, 3] == self.block.id).all())
+        self.assertTrue((tileengine.grid[0:2, 3] == self.rock.id).all())
+        self.assertTrue((tileengine.grid[4:, 3] == self.rock.id).all())
+        self.assert_surface_tiles()
+
+        # Only the tiles that changed are edited
+        tileengine.brush_line((2, 2), (3, 2), self.rock, 0, False)
+        tileengine.brush_line((3, 1), (3, 2), self.rock, 0, False)
+
+        self.assertEqual(self.edits[-1], (3, 1, 1, 1))
+        self.assertTrue((tileengine.grid[2:4, 2] == self.block.id).all())
+        self.assertEqual(len(self.edits), 3)
+
+    def test_brush_radius(self):
+        tileengine = self.tileengine
+        tileengine.brush_line((3, 3), (4, 3), self.rock, 1)
+
+        self.assertEqual(self.edits, [(2, 2, 4, 3)])
+        self.assertTrue((tileengine.grid[2:6, 2:5] == self.rock.id).all())
+        self.assertEqual(numpy.count_nonzero(tileengine.grid), 12)
+        self.assert_surface_tiles()
+
+        tileengine.brush_line((4, 3), (4, 3), None)
+        self.assertEqual(self.edits[-1], (4, 3, 1, 1))
+        self.assertEqual(tileengine.grid[4, 3], 0)
+        self.assert_surface_tiles()
+
+    def test_one_notification_per_edit(self):
+        tileengine = self.tileengine
+
+        tileengine.set_tiles((0, 0, 8, 8), self.rock.id)
+        tileengine.brush_line((0, 0), (7, 7), None, 1)
+        self.assertEqual(len(self.edits), 2)
+
+        # Edits that change nothing aren't told to the listeners
+        tileengine.brush_line((0, 0), (7, 7), None, 1)
+        tileengine.brush_line((0, 7), (0, 7), self.block, 0, False)
+        tileengine.apply_stencil((0, 0), numpy.zeros((8, 8), numpy.bool_), self.block)
+        self.assertEqual(len(self.edits), 2)
+        self.assert_surface_tiles()
+
+    def test_repaint_across_chunks(self):
+        tileengine = self.tileengine
+        tileengine.fill_rect((0, 0, 8, 8), self.block)
+
+        for chunkLocation in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            tileengine.get_chunk(chunkLocation)
+
+        # Edit across the corner of all four chunks
+        tileengine.brush_line((2, 3), (5, 4), self.rock)
+        tileengine.clear_rect((3, 2, 2, 1))
+
+        for chunkLocation in ((0, 0), (1, 0), (0, 1), (1, 1)):
+            chunk = tileengine.chunks.peek(chunkLocation)
+            expected = tileengine.render_chunk(chunkLocation)
+
+            self.assertEqual(pygame.image.tostring(chunk, 'RGBA'), pygame.image.tostring(expected, 'RGBA'))
+
+class StreamingTest(unittest.TestCase):
+    """ Streaming a world file of 64 by 64 tiles, in chunks of 4 by 4 tiles
+        of 32 pixels
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'world.sqw')
+
+        xs, ys = numpy.indices((64, 64))
+        self.tiles = ((xs + ys) % 3 == 0).astype(numpy.uint8)
+        write_world(self.filename, (64, 64), 4, [u'', u'rock'], grid_chunks(self.tiles, 4))
+
+        self.tileengine = TileEngine.fromworldfile(self.filename, 32)
+        self.rock = self.tileengine.find_tile_type('rock').id
+
+    def tearDown(self):
+        self.tileengine.world.close()
+        shutil.rmtree(self.directory)
+
+    def assert_surface_tiles(self):
+        surfaceMask = self.tileengine.surfaceMask.copy()
+        self.tileengine.update_surface_tiles()
+
+        self.assertTrue((surfaceMask == self.tileengine.surfaceMask).all())
+
+    def test_far_chunks_are_unloaded(self):
+        tileengine = self.tileengine
+        rock = self.rock
+
+        tileengine.stream((0, 0, 128, 128))
+        self.assertTrue(tileengine.loadedChunks[0, 0])
+        self.assertTrue((tileengine.grid[0:4, 0:4] == self.tiles[0:4, 0:4] * rock).all())
+
+        # Moving far away unloads the chunk
+        tileengine.stream((1536, 1536, 128, 128))
+        self.assertFalse(tileengine.loadedChunks[0, 0])
+        self.assertTrue(tileengine.loadedChunks[12, 12])
+        self.assertTrue((tileengine.grid[0:4, 0:4] == 0).all())
+        self.assertEqual(tileengine.unloadedTiles, {})
+        self.assert_surface_tiles()
+
+        # Only the chunks within the unload distance stay loaded
+        tileengine.stream((1024, 1024, 128, 128))
+        self.assertTrue(tileengine.loadedChunks[12, 12])
+        tileengine.stream((0, 0, 128, 128))
+        self.assertFalse(tileengine.loadedChunks[12, 12])
+        self.assertEqual(numpy.count_nonzero(tileengine.loadedChunks[5:, :]), 0)
+        self.assertTrue((tileengine.grid[0:4, 0:4] == self.tiles[0:4, 0:4] * rock).all())
+        self.assert_surface_tiles()
+
+    def test_edited_chunks_keep_their_edits(self):
+        tileengine = self.tileengine
+        tileengine.stream((0, 0, 128, 128))
+        tileengine.set_tiles((1, 1, 2, 2), self.rock)
+        edited = tileengine.grid[0:4, 0:4].copy()
+
+        tileengine.stream((1536, 1536, 128, 128))
+        self.assertFalse(tileengine.loadedChunks[0, 0])
+        self.assertTrue((tileengine.grid[0:4, 0:4] == 0).all())
+        self.assertIn((0, 0), tileengine.unloadedTiles)
+
+        tileengine.stream((0, 0, 128, 128))
+        self.assertTrue((tileengine.grid[0:4, 0:4] == edited).all())
+        self.assertEqual(tileengine.unloadedTiles, {})
+        self.assert_surface_tiles()
+
+if __name__ == '__main__':
+    unittest.main()
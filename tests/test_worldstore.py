@@ -0,0 +1,160 @@
+import os
+import shutil
+import tempfile
+import unittest
+from engine.tileengine import TileEngine
+from engine.worldstore import WorldStore, JOURNAL_HEADER, JOURNAL_RECORD
+
+class WorldStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.basename = os.path.join(self.directory, 'world')
+        self.stores = []
+
+    def tearDown(self):
+        for store in self.stores:
+            store.close()
+
+            if store.tileengine is not None and store.tileengine.world is not None:
+                store.tileengine.world.close()
+
+        shutil.rmtree(self.directory)
+
+    def open_store(self):
+        store = WorldStore(self.basename)
+        self.stores.append(store)
+
+        return store
+
+    def test_torn_record_is_dropped_before_appending(self):
+        tileengine = TileEngine((40, 40))
+        tileengine.set_tiles((0, 30, 40, 10), 1)
+
+        store = self.open_store()
+        store.create(tileengine)
+
+        tileengine.set_tiles((1, 1, 2, 2), 2)
+        tileengine.set_tiles((5, 5, 3, 1), 2)
+        store.close()
+
+        # Tear the last record, as a crash while writing it would
+        journalSize = os.path.getsize(store.journalFile)
+        with open(store.journalFile, 'r+b') as journalFile:
+            journalFile.truncate(journalSize - 2)
+
+        store = self.open_store()
+        tileengine = store.load(32)
+
+        self.assertTrue((tileengine.grid[1:3, 1:3] == 2).all())
+        self.assertTrue((tileengine.grid[5:8, 5] == 0).all())
+
+        # Records appended after the torn one have to replay too
+        tileengine.set_tiles((10, 10, 1, 1), 2)
+        store.close()
+
+        store = self.open_store()
+        tileengine = store.load(32)
+        tileengine.stream((0, 0, 40*32, 40*32))
+
+        self.assertTrue((tileengine.grid[1:3, 1:3] == 2).all())
+        self.assertTrue((tileengine.grid[5:8, 5] == 0).all())
+        self.assertEqual(tileengine.grid[10, 10], 2)
+        self.assertTrue((tileengine.grid[:, 30:] == 1).all())
+
+    def test_checkpoint_keeps_unloaded_chunks(self):
+        tileengine = TileEngine((64, 64))
+        tileengine.set_tiles((0, 40, 64, 24), 1)
+
+        store = self.open_store()
+        store.create(tileengine)
+        store.close()
+
+        # Only load the top left chunk, the rest of the world stays in the
+        # old snapshot
+        store = self.open_store()
+        tileengine = store.load(32)
+        tileengine.stream((0, 0, 32, 32))
+        tileengine.set_tiles((2, 2, 3, 3), 2)
+
+        self.assertFalse(tileengine.loadedChunks[3, 3])
+
+        store.checkpoint()
+        store.close()
+
+        self.assertEqual(os.path.getsize(store.journalFile), JOURNAL_HEADER.size)
+
+        store = self.open_store()
+        tileengine = store.load(32)
+        tileengine.stream((0, 0, 64*32, 64*32))
+
+        self.assertEqual(tileengine.world.generation, 1)
+        self.assertTrue((tileengine.grid[2:5, 2:5] == 2).all())
+        self.assertTrue((tileengine.grid[:, 40:] == 1).all())
+        self.assertTrue((tileengine.grid[5:, :40] == 0).all())
+
+    def test_checkpoint_keeps_edits_of_unloaded_chunks(self):
+        tileengine = TileEngine((128, 128))
+        tileengine.set_tiles((0, 100, 128, 28), 1)
+
+        store = self.open_store()
+        store.create(tileengine)
+        store.close()
+
+        store = self.open_store()
+        tileengine = store.load(32)
+        tileengine.stream((0, 0, 32, 32))
+        tileengine.set_tiles((2, 2, 3, 3), 2)
+
+        # Move far enough away for the edited chunk to be unloaded
+        tileengine.stream((100*32, 100*32, 32, 32))
+        self.assertFalse(tileengine.loadedChunks[0, 0])
+
+        store.checkpoint()
+        store.close()
+
+        store = self.open_store()
+        tileengine = store.load(32)
+        tileengine.stream((0, 0, 32, 32))
+
+        self.assertTrue((tileengine.grid[2:5, 2:5] == 2).all())
+
+    def test_stale_journal_is_discarded(self):
+        tileengine = TileEngine((40, 40))
+
+        store = self.open_store()
+        store.create(tileengine)
+        tileengine.set_tiles((1, 1, 2, 2), 2)
+        store.close()
+
+        # A newer snapshot written without the edits, as if the game
+        # stopped after a checkpoint wrote it but before the old journal
+        # was removed
+        store.write_snapshot(TileEngine((40, 40)), 1)
+
+        store = self.open_store()
+        tileengine = store.load(32)
+        tileengine.stream((0, 0, 40*32, 40*32))
+
+        self.assertTrue((tileengine.grid == 0).all())
+
+        # The stale journal was replaced by an empty one of the snapshot's
+        # generation
+        store.close()
+        self.assertEqual(os.path.getsize(store.journalFile), JOURNAL_HEADER.size)
+
+    def test_attaching_again_journals_edits_once(self):
+        tileengine = TileEngine((40, 40))
+
+        store = self.open_store()
+        store.create(tileengine)
+        store.create(tileengine)
+
+        tileengine.set_tiles((1, 1, 2, 2), 2)
+        store.close()
+
+        self.assertEqual(tileengine.listeners, [])
+        self.assertEqual(os.path.getsize(store.journalFile), JOURNAL_HEADER.size + JOURNAL_RECORD.size + 4)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -33,3 +33,20 @@ class Util(object):
 
         return (angle, flip)
 
+    @staticmethod
+    def blit_all(surface, sequence):
+        """ Blit the sequence of (image, position) pairs onto the surface, in
+            one call if this version of pygame supports it
+        """
+        if hasattr(surface, 'blits'):
+            surface.blits(sequence, False)
+        else:
+            for image, position in sequence:
+                surface.blit(image, position)
+
+    @staticmethod
+    def surface_bytes(surface):
+        """ Get the number of bytes of pixel data held by the given surface
+        """
+        width, height = surface.get_size()
+        return width * height * surface.get_bytesize()